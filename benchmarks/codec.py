@@ -0,0 +1,180 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.codec
+ ~~~~~~~~~~~~~~~~
+
+ JSON encode and decode time of the HC2 payloads per installed backend.
+ The payloads are the response bodies recorded in the cassettes or
+ stored in the JSON fixture files::
+
+    python -m benchmarks.codec hc2.cassette.gz devices.json
+
+ Without the arguments the default cassette ``hc2.cassette.gz`` is used.
+ The cassette of a real Home Center is recorded with::
+
+    with cassette.Recorder('hc2.cassette.gz') as session:
+        client = Client('v3', url, 'admin', 'admin', session=session)
+        ...
+
+ The synthetic payloads of ``devices`` devices are measured with::
+
+    python -m benchmarks.codec --synthetic [--devices 600]
+"""
+
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import timeit
+
+from benchmarks import hc2data
+from fiblary.common import cassette
+from fiblary.common import codec
+
+
+DEFAULT_CASSETTE = 'hc2.cassette.gz'
+
+
+def refresh_states(devices, changes, seed=0):
+    """Returns the refreshStates response with ``changes`` changes"""
+    rnd = random.Random(seed)
+    return {
+        'status': 'IDLE',
+        'last': 431253,
+        'date': '12:00 | 1.1.2014',
+        'timestamp': 1388574000,
+        'logs': [],
+        'events': [],
+        'changes': [
+            {'id': rnd.choice(devices)['id'],
+             'value': str(rnd.randint(0, 99)),
+             'lastBreached': str(rnd.randint(1388574000, 1388577600))}
+            for _ in range(changes)
+        ],
+    }
+
+
+def synthetic(count):
+    """Returns the dictionary of the generated payloads by name"""
+    devices = hc2data.devices(count)
+    return {
+        'devices': [json.dumps(devices)],
+        'device': [json.dumps(devices[0])],
+        'refreshStates': [json.dumps(refresh_states(devices, 50))],
+    }
+
+
+def _name(entry):
+    """Returns the payload name i.e. 'devices?id' of the cassette entry"""
+    name = entry['path'].rsplit('/api/', 1)[-1]
+    if entry['query']:
+        name += '?' + '&'.join(sorted(set(
+            param.split('=', 1)[0] for param in entry['query'].split('&'))))
+    return name
+
+
+def recorded(paths):
+    """Returns the dictionary of the recorded JSON bodies by resource
+    name read from the cassettes and the fixture files
+    """
+    payloads = collections.defaultdict(list)
+    for path in paths:
+        if path.endswith('.gz'):
+            for entry in cassette.load(path):
+                content = entry.get('content')
+                if entry['status'] != 200 or not content or \
+                        entry.get('content_encoding'):
+                    continue
+                try:
+                    json.loads(content)
+                except ValueError:
+                    continue
+                payloads[_name(entry)].append(content)
+        else:
+            with open(path) as f:
+                content = f.read()
+            json.loads(content)  # fail early on the invalid fixture
+            payloads[os.path.basename(path)].append(content)
+    return dict(payloads)
+
+
+def measure(backend, bodies, repeat):
+    """Returns the total time of decoding and encoding all the bodies"""
+    decoded = [json.loads(body) for body in bodies]
+
+    def decode():
+        for body in bodies:
+            backend.loads(body)
+
+    def encode():
+        for data in decoded:
+            backend.dumps(data)
+
+    return {
+        'decode_ms': min(timeit.repeat(
+            decode, number=1, repeat=repeat)) * 1000,
+        'encode_ms': min(timeit.repeat(
+            encode, number=1, repeat=repeat)) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='JSON codec backends benchmark')
+    parser.add_argument('payloads', nargs='*',
+                        help='cassette (*.gz) or JSON fixture files, '
+                             'default ' + DEFAULT_CASSETTE)
+    parser.add_argument('--synthetic', action='store_true',
+                        help='measure the generated payloads instead')
+    parser.add_argument('--devices', type=int, default=600,
+                        help='number of the generated devices')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        payloads = synthetic(args.devices)
+    else:
+        paths = args.payloads or [DEFAULT_CASSETTE]
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            parser.error(
+                "{} not found, record the cassette or use --synthetic".format(
+                    ', '.join(missing)))
+        payloads = recorded(paths)
+
+    results = {}
+    for name in codec.BACKENDS:
+        try:
+            backend = codec.Codec(name)
+        except ImportError:
+            continue
+        results[name] = dict(
+            (payload, measure(backend, bodies, args.repeat))
+            for payload, bodies in payloads.items())
+
+    results['default'] = codec.default.name
+    results['payloads'] = dict(
+        (payload, {'count': len(bodies),
+                   'bytes': sum(len(body) for body in bodies)})
+        for payload, bodies in payloads.items())
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return results
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,425 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.fakehc
+ ~~~~~~~~~~~~~~~~~
+
+ Local fake Home Center 2 HTTP server
+
+ Serves the synthetic installation generated by :mod:`benchmarks.hc2data`
+ with the devices, rooms, sections, scenes, global variables, the event
+ history, callAction, sceneControl and the refreshStates long-poll. The
+ device changes are produced by :meth:`FakeHomeCenter.change` or by the
+ background generator at ``change_rate`` changes per second.
+"""
+
+import BaseHTTPServer
+import collections
+import json
+import random
+import socket
+import SocketServer
+import threading
+import time
+import urlparse
+
+from benchmarks import hc2data
+
+
+MAX_CHANGES = 10000
+"""The number of the refreshStates changes kept for the clients"""
+
+POLL_TIMEOUT = 30
+"""The number of seconds refreshStates waits for the changes"""
+
+COLLECTIONS = {
+    # resource: (attribute, key)
+    'devices': ('devices', 'id'),
+    'rooms': ('rooms', 'id'),
+    'sections': ('sections', 'id'),
+    'scenes': ('scenes', 'id'),
+    'users': ('users', 'id'),
+    'globalVariables': ('variables', 'name'),
+}
+
+FILTERS = {
+    'devices': ('type', 'roomID'),
+}
+"""The list parameters handled by Home Center, the others are ignored"""
+
+ACTIONS = {
+    'turnOn': lambda args: '1',
+    'turnOff': lambda args: '0',
+    'open': lambda args: '99',
+    'close': lambda args: '0',
+    'setValue': lambda args: args[0] if args else None,
+}
+"""The device actions changing the value property"""
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, data=None):
+        body = json.dumps(data) if data is not None else ''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+        self.server.home_center.count('bytes_sent', len(body))
+
+    def _route(self, method):
+        hc = self.server.home_center
+        url = urlparse.urlparse(self.path)
+        resource = url.path[len('/api/'):]
+        params = dict(urlparse.parse_qsl(url.query))
+
+        body = None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length)
+            hc.count('bytes_received', length)
+
+        hc.count('requests', 1)
+        hc.delay()
+        status, data = hc.handle(method, resource, params, body)
+        self._reply(status, data)
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+
+class FakeHomeCenter(object):
+    """Fake Home Center 2 serving the synthetic installation on localhost
+
+    Usage::
+
+        with FakeHomeCenter(devices=600, latency=0.01) as hc:
+            client = Client('v3', hc.url, 'admin', 'admin')
+    """
+
+    def __init__(self, devices=100, rooms=10, seed=0, sections=3, scenes=20,
+                 variables=20, events=1000, latency=0, jitter=0,
+                 change_rate=0, poll_timeout=POLL_TIMEOUT):
+        """
+        :param devices: The number of devices
+        :param rooms: The number of rooms
+        :param seed: The seed of the generated data and changes
+        :param sections: The number of sections
+        :param scenes: The number of scenes
+        :param variables: The number of global variables
+        :param events: The number of events in the history
+        :param latency: The number of seconds every response is delayed
+        :param jitter: The maximum number of seconds added to the latency
+        :param change_rate: The number of device changes generated per
+                            second
+        :param poll_timeout: The number of seconds refreshStates waits for
+                             the changes
+        """
+        self.devices = dict(
+            (item['id'], item)
+            for item in hc2data.devices(devices, rooms, seed))
+        self.rooms = dict(
+            (item['id'], item)
+            for item in hc2data.rooms(rooms, sections, seed))
+        self.sections = dict(
+            (item['id'], item) for item in hc2data.sections(sections))
+        self.scenes = dict(
+            (item['id'], item)
+            for item in hc2data.scenes(scenes, rooms, seed))
+        self.users = {2: {'id': 2, 'name': 'admin', 'type': 'superuser'}}
+        self.variables = dict(
+            (item['name'], item)
+            for item in hc2data.variables(variables, seed))
+        self.events = hc2data.events(
+            events, list(self.devices.values()) or [{'id': 0, 'type': ''}],
+            int(time.time()), seed)
+
+        self.latency = latency
+        self.jitter = jitter
+        self.change_rate = change_rate
+        self.poll_timeout = poll_timeout
+
+        self.last = 1
+        self._changes = collections.deque(maxlen=MAX_CHANGES)
+        self._state = threading.Condition()
+        self._random = random.Random(seed)
+        self._stop = threading.Event()
+
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._generator = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return 'http://{}:{}/api/'.format(host, port)
+
+    def count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {}
+
+    def delay(self):
+        """Sleep for the configured latency and jitter"""
+        delay = self.latency
+        if self.jitter:
+            with self._lock:
+                delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def change(self, device_id, **properties):
+        """Change the device properties and publish the change to the
+        refreshStates clients. Returns the new cursor.
+        """
+        device = self.devices[device_id]
+        with self._state:
+            device['properties'].update(properties)
+            device['modified'] = int(time.time())
+            self.last += 1
+            change = dict(properties, id=device_id)
+            self._changes.append((self.last, change))
+            self._state.notify_all()
+            return self.last
+
+    def handle(self, method, resource, params, body):
+        """Returns (status, data) of the response"""
+        handler = getattr(self, '_handle_' + resource.replace('/', '_'), None)
+        if handler is not None:
+            if method != 'GET':
+                return 405, None
+            return handler(params)
+
+        if resource not in COLLECTIONS:
+            return 404, None
+        attribute, key = COLLECTIONS[resource]
+        items = getattr(self, attribute)
+
+        if method == 'GET':
+            if key in params:
+                item = items.get(_key(key, params[key]))
+                return (200, item) if item else (404, None)
+            filters = dict((name, value) for name, value in params.items()
+                           if name in FILTERS.get(resource, ()))
+            return 200, [value for _, value in sorted(items.items())
+                         if _match(value, filters)]
+
+        if method == 'PUT':
+            data = json.loads(body)
+            item = items.get(data.get(key))
+            if item is None:
+                return 404, None
+            _merge(item, data)
+            return 200, item
+
+        if method == 'POST':
+            data = json.loads(body)
+            if key == 'id':
+                data['id'] = max(items or [0]) + 1
+            elif data.get(key) in items:
+                return 409, None
+            items[data[key]] = data
+            return 201, data
+
+        if method == 'DELETE':
+            if items.pop(_key(key, params.get(key)), None) is None:
+                return 404, None
+            return 204, None
+
+        return 405, None
+
+    def _handle_refreshStates(self, params):
+        last = int(params.get('last') or 0)
+        deadline = time.time() + self.poll_timeout
+        with self._state:
+            # the first request only returns the cursor
+            while last and self.last <= last and not self._stop.is_set():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._state.wait(remaining)
+            changes = [dict(change) for seq, change in self._changes
+                       if last and seq > last]
+            return 200, {
+                'status': 'IDLE',
+                'last': self.last,
+                'date': time.strftime('%H:%M | %d.%m.%Y'),
+                'timestamp': int(time.time()),
+                'logs': [],
+                'events': [],
+                'changes': changes,
+            }
+
+    def _handle_callAction(self, params):
+        try:
+            device_id = int(params['deviceID'])
+        except (KeyError, ValueError):
+            return 400, None
+        if device_id not in self.devices:
+            return 404, None
+
+        args = [params[name] for name in sorted(params)
+                if name.startswith('arg')]
+        action = ACTIONS.get(params.get('name'))
+        value = action(args) if action else None
+        if value is not None:
+            self.change(device_id, value=value)
+        return 202, None
+
+    def _handle_sceneControl(self, params):
+        scene = self.scenes.get(_key('id', params.get('id')))
+        if scene is None:
+            return 404, None
+        action = params.get('action')
+        if action == 'start':
+            scene['runningInstances'] += 1
+        elif action == 'stop':
+            scene['runningInstances'] = 0
+        elif action in ('enable', 'disable'):
+            scene['runConfig'] = 'TRIGGER_AND_MANUAL' \
+                if action == 'enable' else 'DISABLED'
+        else:
+            return 400, None
+        return 202, None
+
+    def _handle_panels_event(self, params):
+        events = self.events
+        if 'from' in params:
+            start = int(params['from'])
+            events = [e for e in events if e['timestamp'] >= start]
+        if 'to' in params:
+            end = int(params['to'])
+            events = [e for e in events if e['timestamp'] <= end]
+        if params.get('type') not in (None, 'time'):
+            # type=time selects the from/to range
+            events = [e for e in events if e['type'] == params['type']]
+        if 'deviceID' in params:
+            device_id = int(params['deviceID'])
+            events = [e for e in events if e['deviceID'] == device_id]
+        if 'last' in params:
+            events = events[:int(params['last'])]
+        return 200, events
+
+    def _handle_settings_info(self, params):
+        return 200, hc2data.info(len(self.devices))
+
+    def _handle_loginStatus(self, params):
+        return 200, {'status': True, 'userID': 2, 'username': 'admin',
+                     'type': 'superuser'}
+
+    def _handle_weather(self, params):
+        return 200, {'Temperature': 12.5, 'Humidity': 60.0,
+                     'WeatherCondition': 'clear', 'WindSpeed': 2.5}
+
+    def _generate(self):
+        rnd = random.Random(self._random.random())
+        ids = sorted(self.devices)
+        budget = 0.0
+        stamp = time.time()
+        while ids and not self._stop.wait(0.01):
+            now = time.time()
+            budget += (now - stamp) * self.change_rate
+            stamp = now
+            while budget >= 1:
+                change = hc2data.change(self.devices[rnd.choice(ids)], rnd)
+                self.change(change.pop('id'), **change)
+                budget -= 1
+
+    def start(self):
+        self._stop.clear()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.home_center = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        if self.change_rate:
+            self._generator = threading.Thread(target=self._generate)
+            self._generator.daemon = True
+            self._generator.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._state:
+            # release the pending refreshStates
+            self._state.notify_all()
+        if self._generator is not None:
+            self._generator.join()
+            self._generator = None
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _key(key, value):
+    if key == 'id':
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return value
+
+
+def _match(item, params):
+    """Returns True if the item matches the list filter i.e. roomID=5"""
+    for name, value in params.items():
+        if str(item.get(name)) != value:
+            return False
+    return True
+
+
+def _merge(item, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(item.get(key), dict):
+            _merge(item[key], value)
+        else:
+            item[key] = value
@@ -0,0 +1,209 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.hc2data
+ ~~~~~~~~~~~~~~~~~~
+
+ Synthetic Home Center 2 data shaped like the v3 API responses
+"""
+
+import random
+
+
+DEVICE_TYPES = (
+    ('binary_light', {'turnOn': 0, 'turnOff': 0, 'setValue': 1}),
+    ('dimmable_light', {'turnOn': 0, 'turnOff': 0, 'setValue': 1,
+                        'startLevelIncrease': 0, 'stopLevelChange': 0}),
+    ('door_sensor', {'setArmed': 1}),
+    ('window_sensor', {'setArmed': 1}),
+    ('temperature_sensor', {}),
+    ('motion_sensor', {'setArmed': 1}),
+    ('blind', {'open': 0, 'close': 0, 'stop': 0, 'setValue': 1}),
+)
+
+
+def device(device_id, room_id=0, rnd=random):
+    """Returns the device dictionary as returned by GET devices"""
+    device_type, actions = rnd.choice(DEVICE_TYPES)
+    properties = {
+        'value': rnd.choice(('0', '1')),
+        'dead': '0',
+        'disabled': '0',
+        'isLight': '1' if device_type.endswith('light') else '0',
+        'batteryLevel': str(rnd.randint(0, 100)),
+        'power': '{:.1f}'.format(rnd.random() * 100),
+        'energy': '{:.2f}'.format(rnd.random() * 1000),
+        'armed': '0',
+        'log': '',
+        'logTemp': '',
+        'zwaveCompany': 'Fibargroup',
+        'zwaveInfo': '3,3,67',
+        'zwaveVersion': '2.1',
+        'pollingTimeSec': 0,
+        'parameters': [
+            {'id': i, 'size': 1, 'value': rnd.randint(0, 255)}
+            for i in range(1, 31)],
+        'associationSet': [
+            {'group': i, 'nodes': [1, device_id]} for i in range(1, 4)],
+        'associationView': [
+            {'group': i, 'nodes': [1]} for i in range(1, 4)],
+    }
+    for i in range(60):
+        properties['userDescription{}'.format(i)] = 'x' * rnd.randint(0, 20)
+
+    return {
+        'id': device_id,
+        'name': '{}_{}'.format(device_type, device_id),
+        'roomID': room_id,
+        'type': device_type,
+        'baseType': device_type.split('_')[-1],
+        'enabled': True,
+        'visible': True,
+        'isPlugin': False,
+        'parentId': max(1, device_id // 4),
+        'remoteGatewayId': 0,
+        'properties': properties,
+        'actions': actions,
+        'created': 1390000000 + device_id,
+        'modified': 1390000000 + device_id,
+        'sortOrder': device_id,
+    }
+
+
+def devices(count, rooms=10, seed=0):
+    """Returns the list of ``count`` devices spread over ``rooms``"""
+    rnd = random.Random(seed)
+    return [device(device_id, rnd.randint(1, rooms), rnd)
+            for device_id in range(3, count + 3)]
+
+
+def sections(count):
+    """Returns the list of ``count`` sections"""
+    return [{'id': section_id, 'name': 'section_{}'.format(section_id),
+             'sortOrder': section_id}
+            for section_id in range(1, count + 1)]
+
+
+def rooms(count, sections=1, seed=0):
+    """Returns the list of ``count`` rooms spread over ``sections``"""
+    rnd = random.Random(seed)
+    return [{
+        'id': room_id,
+        'name': 'room_{}'.format(room_id),
+        'sectionID': rnd.randint(1, sections),
+        'icon': 'room_{}'.format(rnd.randint(1, 20)),
+        'defaultSensors': {'temperature': 0, 'humidity': 0, 'light': 0},
+        'defaultThermostat': 0,
+        'sortOrder': room_id,
+    } for room_id in range(1, count + 1)]
+
+
+def scenes(count, rooms=10, seed=0):
+    """Returns the list of ``count`` scenes"""
+    rnd = random.Random(seed)
+    return [{
+        'id': scene_id,
+        'name': 'scene_{}'.format(scene_id),
+        'type': 'com.fibaro.luaScene',
+        'roomID': rnd.randint(1, rooms),
+        'iconID': 0,
+        'runConfig': 'TRIGGER_AND_MANUAL',
+        'autostart': False,
+        'protectedByPIN': False,
+        'killable': True,
+        'maxRunningInstances': 2,
+        'runningInstances': 0,
+        'instances': [],
+        'runningManualInstances': 0,
+        'visible': True,
+        'isLua': True,
+        'properties': '',
+        'triggers': {'properties': [], 'globals': [], 'events': []},
+        'actions': {'devices': [], 'scenes': [], 'groups': []},
+        'sortOrder': scene_id,
+        'lua': '--[[\n%% properties\n--]]\n' + 'x' * rnd.randint(0, 2000),
+    } for scene_id in range(1, count + 1)]
+
+
+def variables(count, seed=0):
+    """Returns the list of ``count`` global variables"""
+    rnd = random.Random(seed)
+    return [{
+        'name': 'var_{}'.format(n),
+        'value': str(rnd.randint(0, 100)),
+        'readOnly': False,
+        'isEnum': False,
+        'created': 1390000000 + n,
+        'modified': 1390000000 + n,
+    } for n in range(count)]
+
+
+def events(count, devices, now=1400000000, seed=0):
+    """Returns the list of ``count`` device property change events of the
+    ``devices`` ordered from the newest one as returned by GET
+    panels/event
+    """
+    rnd = random.Random(seed)
+    result = []
+    timestamp = now
+    for event_id in range(count, 0, -1):
+        device = rnd.choice(devices)
+        old = rnd.choice(('0', '1'))
+        result.append({
+            'id': event_id,
+            'type': 'DEVICE_PROPERTY_CHANGED',
+            'timestamp': timestamp,
+            'deviceID': device['id'],
+            'deviceType': device['type'],
+            'propertyName': 'value',
+            'oldValue': old,
+            'newValue': '1' if old == '0' else '0',
+        })
+        timestamp -= rnd.randint(1, 60)
+    return result
+
+
+def info(devices=0):
+    """Returns the settings/info dictionary"""
+    return {
+        'serialNumber': 'HC2-000000',
+        'hcName': 'HC2',
+        'mac': '00:00:00:00:00:00',
+        'softVersion': '4.056',
+        'beta': False,
+        'zwaveVersion': '3.67',
+        'timeFormat': 24,
+        'zwaveRegion': 'EU',
+        'serverStatus': 1400000000,
+        'defaultLanguage': 'en',
+        'sunsetHour': '19:00',
+        'sunriseHour': '06:00',
+        'hotelMode': False,
+        'updateStableAvailable': False,
+        'temperatureUnit': 'C',
+        'updateBetaAvailable': False,
+        'batteryLowNotification': False,
+        'smsManagement': False,
+        'date': '12:00 | 1.1.2014',
+        'devices': devices,
+    }
+
+
+def change(device, rnd=random):
+    """Returns the random refreshStates change of the device"""
+    if rnd.random() < 0.5:
+        return {'id': device['id'], 'value': rnd.choice(('0', '1'))}
+    return {'id': device['id'],
+            'power': '{:.1f}'.format(rnd.random() * 100)}
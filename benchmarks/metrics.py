@@ -0,0 +1,64 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.metrics
+ ~~~~~~~~~~~~~~~~~~
+
+ Client calls per second with the request metrics disabled and enabled::
+
+    python -m benchmarks.metrics [calls] [devices]
+"""
+
+import json
+import sys
+import time
+
+from benchmarks.fakehc import FakeHomeCenter
+from fiblary.client import Client
+
+
+def run(hc, calls, enabled):
+    client = Client('v3', hc.url, 'admin', 'admin', metrics=enabled)
+    device_ids = sorted(hc.devices)
+
+    start = time.time()
+    for n in range(calls):
+        if n % 10:
+            client.devices.get(device_ids[n % len(device_ids)])
+        else:
+            list(client.devices.list())
+    elapsed = time.time() - start
+    client.client.session.close()
+
+    result = {'calls_per_sec': calls / elapsed}
+    if enabled:
+        snapshot = client.metrics.snapshot()
+        result['devices_GET'] = snapshot['latency']['devices']['GET']
+    return result
+
+
+def main(calls=1000, count=100):
+    with FakeHomeCenter(devices=count) as hc:
+        results = {
+            'off': run(hc, calls, False),
+            'on': run(hc, calls, True),
+        }
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
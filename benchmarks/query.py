@@ -0,0 +1,69 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.query
+ ~~~~~~~~~~~~~~~~
+
+ Device lookups per second served by the network, the replica scan and
+ the replica index::
+
+    python -m benchmarks.query [devices] [lookups]
+"""
+
+import json
+import sys
+import time
+
+from benchmarks.fakehc import FakeHomeCenter
+from fiblary.client import Client
+from fiblary.client.v3 import index
+from fiblary.client.v3 import replica
+
+
+def run(client, lookups, rooms):
+    start = time.time()
+    for i in range(lookups):
+        list(client.devices.list(roomID=i % rooms + 1, p_dead='0'))
+    elapsed = time.time() - start
+    return {
+        'lookups': lookups,
+        'lookups_per_sec': lookups / elapsed,
+    }
+
+
+def main(count=600, lookups=200, rooms=10):
+    with FakeHomeCenter(devices=count, rooms=rooms) as hc:
+        client = Client('v3', hc.url, 'admin', 'admin')
+        devices = list(client.client.get('devices').json())
+
+        results = {'network': run(client, lookups // 10, rooms)}
+
+        client.devices.replica = replica.Replica()
+        client.devices.replica.load(devices)
+        results['replica_scan'] = run(client, lookups, rooms)
+
+        client.devices.replica = replica.Replica(
+            index=index.Index(properties=('dead',)))
+        client.devices.replica.load(devices)
+        results['replica_index'] = run(client, lookups * 100, rooms)
+
+        client.client.session.close()
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
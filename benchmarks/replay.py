@@ -0,0 +1,126 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.replay
+ ~~~~~~~~~~~~~~~~~
+
+ CPU time of the model building, the jsonpath filtering and the state
+ change dispatch on the payloads replayed from the cassette. The cassette
+ recorded on a real Home Center gives the realistic payload shapes::
+
+    python -m benchmarks.replay hc2.cassette.gz [repeat]
+
+ Without the cassette one is recorded from the fake Home Center first::
+
+    python -m benchmarks.replay --record hc2.cassette.gz [devices]
+"""
+
+import json
+import sys
+import time
+
+from benchmarks.fakehc import FakeHomeCenter
+from fiblary.client import Client
+from fiblary.common import cassette
+from fiblary.common import codec
+
+
+URL = 'http://hc2/api/'
+
+RESOURCES = ('devices', 'rooms', 'sections', 'scenes', 'globalVariables')
+
+
+def record(path, devices=200, duration=2):
+    """Records the cassette of the fake Home Center traffic"""
+    with FakeHomeCenter(devices=devices, change_rate=200) as hc:
+        with cassette.Recorder(path) as session:
+            client = Client('v3', hc.url, 'admin', 'admin', session=session)
+            for name in ('devices', 'rooms', 'sections', 'scenes',
+                         'variables'):
+                list(getattr(client, name).list())
+            list(client.events.list(last=100))
+            client.add_event_handler('value', lambda **kwargs: None)
+            client.enable_state_handler()
+            time.sleep(duration)
+            client.disable_state_handler()
+            client.dispatcher.stop()
+    return path
+
+
+def _cpu(function):
+    start = time.clock()
+    function()
+    return (time.clock() - start) * 1000
+
+
+def replay(path, repeat=10):
+    entries = cassette.load(path)
+    resources = set(
+        entry['path'].rsplit('/api/', 1)[-1] for entry in entries
+        if entry['method'] == 'GET' and not entry['query'])
+    polls = [entry for entry in entries
+             if entry['path'].endswith('refreshStates')]
+    states = [codec.loads(entry['content']) for entry in polls
+              if entry['status'] == 200]
+
+    controllers = {
+        'devices': 'devices', 'rooms': 'rooms', 'sections': 'sections',
+        'scenes': 'scenes', 'globalVariables': 'variables',
+    }
+
+    results = {'models_ms': 0.0, 'jsonpath_ms': 0.0, 'dispatch_ms': 0.0}
+    for _ in range(repeat):
+        player = cassette.Player(path)
+        client = Client('v3', URL, session=player)
+        for resource in sorted(resources & set(RESOURCES)):
+            controller = getattr(client, controllers[resource])
+            results['models_ms'] += _cpu(lambda: list(controller.list()))
+
+        if 'devices' in resources:
+            # the list is served by the next recorded response if any
+            player = cassette.Player(path)
+            client = Client('v3', URL, session=player)
+            results['jsonpath_ms'] += _cpu(lambda: list(
+                client.devices.list(p_value='1', enabled=True)))
+
+        client.add_event_handler('value', lambda **kwargs: None)
+        client.add_event_handler('power', lambda **kwargs: None)
+
+        def dispatch():
+            for state in states:
+                client._on_state_change(json.loads(json.dumps(state)))
+        results['dispatch_ms'] += _cpu(dispatch)
+        if client.dispatcher is not None:
+            client.dispatcher.stop()
+
+    for name in list(results):
+        results[name] /= repeat
+    results['requests'] = len(entries)
+    results['states'] = len(states)
+    results['changes'] = sum(len(state.get('changes', ()))
+                             for state in states)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return results
+
+
+def main(argv):
+    if argv and argv[0] == '--record':
+        record(argv[1], *[int(arg) for arg in argv[2:]])
+        return
+    replay(argv[0], *[int(arg) for arg in argv[1:]])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,90 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.routing
+ ~~~~~~~~~~~~~~~~~~
+
+ Cost of a property change dispatch as the number of the handlers grows.
+ The handlers subscribed to all the devices filter the changes by id
+ themselves, the routed handlers are subscribed with device_id::
+
+    python -m benchmarks.routing [changes]
+"""
+
+import json
+import sys
+import time
+
+from benchmarks import hc2data
+from fiblary.client import Client
+from fiblary.client.v3 import replica
+
+
+HANDLERS = (10, 100, 1000, 5000)
+
+
+def run(handlers, changes, routed):
+    client = Client('v3', 'http://127.0.0.1:9/api/', 'admin', 'admin')
+    devices = hc2data.devices(handlers)
+    client.devices.replica = replica.Replica()
+    client.devices.replica.load(devices)
+
+    calls = [0]
+
+    def make_handler(device_id):
+        def handler(**kwargs):
+            if kwargs['id'] == device_id:
+                calls[0] += 1
+        return handler
+
+    for device in devices:
+        if routed:
+            client.add_event_handler(
+                'value', make_handler(device['id']), device_id=device['id'])
+        else:
+            client.add_event_handler('value', make_handler(device['id']))
+
+    ids = [device['id'] for device in devices]
+    start = time.time()
+    for n in range(changes):
+        client._on_state_change({'last': n, 'changes': [
+            {'id': ids[n % len(ids)], 'value': str(n)}]})
+    elapsed = time.time() - start
+
+    # wait for the dispatcher to run the queued handlers
+    while calls[0] < changes and time.time() - start < 60:
+        time.sleep(0.01)
+    total = time.time() - start
+    client.dispatcher.stop()
+    return {
+        'dispatch_us': elapsed / changes * 1e6,
+        'changes_per_sec': changes / total,
+    }
+
+
+def main(changes=2000):
+    results = {}
+    for handlers in HANDLERS:
+        results[handlers] = {
+            'filtered': run(handlers, min(changes, 200000 // handlers),
+                            routed=False),
+            'routed': run(handlers, changes, routed=True),
+        }
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,205 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.suite
+ ~~~~~~~~~~~~~~~~
+
+ End-to-end Client benchmarks against the fake Home Center. The results
+ are printed as JSON and can be stored with ``--output`` to be compared
+ across the releases::
+
+    python -m benchmarks.suite --devices 600 --latency 5 --output out.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+
+from benchmarks.fakehc import FakeHomeCenter
+import fiblary
+from fiblary.client import Client
+from fiblary.common import codec
+
+
+def percentile(samples, fraction):
+    """Returns the percentile of the sorted samples"""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure(function, repeat):
+    """Calls function(n) ``repeat`` times and returns the latency stats"""
+    samples = []
+    start = time.time()
+    for n in range(repeat):
+        call_start = time.time()
+        function(n)
+        samples.append((time.time() - call_start) * 1000)
+    elapsed = time.time() - start
+    samples.sort()
+    return {
+        'ops': repeat,
+        'ops_per_sec': repeat / elapsed,
+        'mean_ms': sum(samples) / len(samples),
+        'p50_ms': percentile(samples, 0.50),
+        'p95_ms': percentile(samples, 0.95),
+        'p99_ms': percentile(samples, 0.99),
+        'max_ms': samples[-1],
+    }
+
+
+def scenarios(client, device_ids, repeat):
+    """Returns the list of (name, function, repeat) of the Client calls"""
+    devices = dict((device.id, device) for device in client.devices.list())
+    names = dict((device_id, devices[device_id].name)
+                 for device_id in device_ids)
+
+    now = int(time.time())
+
+    def pick(n):
+        return device_ids[n % len(device_ids)]
+
+    def update(n):
+        device = devices[pick(n)]
+        device.name = '{}_{}'.format(device.name.split('_x')[0] + '_x', n)
+        devices[device.id] = client.devices.update(device, partial=True)
+
+    return [
+        ('devices.list', lambda n: list(client.devices.list()),
+         max(1, repeat // 10)),
+        ('devices.list_room', lambda n: list(
+            client.devices.list(roomID=n % 10 + 1)), max(1, repeat // 10)),
+        ('devices.find', lambda n: client.devices.find(
+            name=names[pick(n)]), max(1, repeat // 10)),
+        ('devices.get', lambda n: client.devices.get(pick(n)), repeat),
+        ('devices.action', lambda n: client.devices.action(
+            pick(n), 'turnOn' if n % 2 else 'turnOff'), repeat),
+        ('devices.update', update, repeat),
+        ('events.list', lambda n: list(client.events.list(last=100)),
+         repeat),
+        ('events.history', lambda n: list(client.events.history(
+            now - 12 * 3600, now, window=3600)), max(1, repeat // 10)),
+    ]
+
+
+def run_requests(args):
+    results = {}
+    with FakeHomeCenter(devices=args.devices, rooms=10, events=args.events,
+                        latency=args.latency / 1000.0,
+                        jitter=args.jitter / 1000.0) as hc:
+        client = Client('v3', hc.url, 'admin', 'admin')
+        device_ids = sorted(hc.devices)
+        for name, function, repeat in scenarios(
+                client, device_ids, args.repeat):
+            if args.only and name not in args.only:
+                continue
+            hc.reset_counters()
+            result = measure(function, repeat)
+            transferred = sum(hc.counters.get(counter, 0) for counter in (
+                'bytes_sent', 'bytes_received'))
+            result['bytes_per_op'] = transferred // repeat
+            results[name] = result
+        client.client.session.close()
+    return results
+
+
+def run_state_handler(args):
+    """Measures the number of changes per second delivered to the event
+    handlers while the fake Home Center generates them
+    """
+    with FakeHomeCenter(devices=args.devices, rooms=10, events=0,
+                        latency=args.latency / 1000.0,
+                        jitter=args.jitter / 1000.0,
+                        change_rate=args.change_rate) as hc:
+        client = Client('v3', hc.url, 'admin', 'admin')
+        received = [0]
+        lock = threading.Lock()
+
+        def handler(**kwargs):
+            with lock:
+                received[0] += 1
+
+        client.add_event_handler('value', handler)
+        client.add_event_handler('power', handler)
+
+        start_last = hc.last
+        client.enable_state_handler()
+        start = time.time()
+        time.sleep(args.duration)
+        client.disable_state_handler()
+        elapsed = time.time() - start
+        generated = hc.last - start_last
+        polls = hc.counters.get('requests', 0)
+
+    client.dispatcher.stop()
+    return {
+        'duration_sec': elapsed,
+        'generated': generated,
+        'delivered': received[0],
+        'changes_per_sec': received[0] / elapsed,
+        'polls': polls,
+        'changes_per_poll': received[0] / float(polls or 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='calls per single item scenario')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='server latency in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='maximum server jitter in milliseconds')
+    parser.add_argument('--change-rate', type=float, default=500,
+                        help='device changes per second')
+    parser.add_argument('--duration', type=float, default=3,
+                        help='state handler benchmark duration in seconds')
+    parser.add_argument('--only', action='append',
+                        help='run only the named scenario')
+    parser.add_argument('--output', help='write the results to the file')
+    args = parser.parse_args(argv)
+
+    results = run_requests(args)
+    if not args.only or 'state_handler' in args.only:
+        results['state_handler'] = run_state_handler(args)
+
+    report = {
+        'meta': {
+            'fiblary': fiblary.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'codec': codec.default.name,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'params': vars(args),
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,84 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.tracing
+ ~~~~~~~~~~~~~~~~~~
+
+ Requests per second with the request tracing disabled and enabled::
+
+    python -m benchmarks.tracing [requests] [devices]
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+from benchmarks.fakehc import FakeHomeCenter
+from fiblary.common import restapi
+
+
+MODES = (
+    # name, debug, logger level, sample rate
+    ('off', False, logging.WARNING, 1.0),
+    ('debug_level_off', True, logging.WARNING, 1.0),
+    ('on', True, logging.DEBUG, 1.0),
+    ('on_sampled_10pct', True, logging.DEBUG, 0.1),
+)
+
+
+def run(hc, requests, debug, level, sample_rate, logger):
+    logger.setLevel(level)
+    api = restapi.RESTApi(
+        base_url=hc.url,
+        username='admin',
+        password='admin',
+        logger=logger,
+        debug=debug,
+        trace_sample_rate=sample_rate)
+
+    resources = ['devices?id={}'.format(device_id % 10 + 3)
+                 for device_id in range(requests)]
+    resources[::10] = ['devices'] * len(resources[::10])
+
+    start = time.time()
+    for resource in resources:
+        api.get(resource)
+    elapsed = time.time() - start
+    api.session.close()
+
+    return {
+        'requests': requests,
+        'requests_per_sec': requests / elapsed,
+    }
+
+
+def main(requests=2000, count=100):
+    logger = logging.getLogger('benchmarks.tracing')
+    logger.propagate = False
+    with open(os.devnull, 'w') as devnull:
+        logger.addHandler(logging.StreamHandler(devnull))
+        with FakeHomeCenter(devices=count) as hc:
+            results = dict(
+                (name, run(hc, requests, debug, level, rate, logger))
+                for name, debug, level, rate in MODES)
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,95 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ benchmarks.update
+ ~~~~~~~~~~~~~~~~~
+
+ Full vs partial device update payload and latency::
+
+    python -m benchmarks.update [devices]
+"""
+
+import json
+import sys
+import time
+
+import jsonpatch
+
+from benchmarks.fakehc import FakeHomeCenter
+from fiblary.client import Client
+
+
+def modify(device):
+    device.name = device.name + '_renamed'
+    device.properties.value = '1' if device.properties.value == '0' else '0'
+
+
+def run_updates(client, hc, partial):
+    devices = list(client.devices.list())
+    for device in devices:
+        modify(device)
+
+    hc.reset_counters()
+    start = time.time()
+    for device in devices:
+        client.devices.update(device, partial=partial)
+    elapsed = time.time() - start
+
+    return {
+        'updates': len(devices),
+        'bytes_per_update': hc.counters['bytes_received'] // len(devices),
+        'ms_per_update': elapsed * 1000 / len(devices),
+    }
+
+
+def run_changes(client):
+    devices = list(client.devices.list())
+    for device in devices:
+        modify(device)
+
+    start = time.time()
+    for device in devices:
+        jsonpatch.make_patch(
+            device.__dict__['__original__'], json.loads(json.dumps(device)))
+    full_diff = time.time() - start
+
+    start = time.time()
+    for device in devices:
+        device.changes()
+    tracked = time.time() - start
+
+    return {
+        'make_patch_ms': full_diff * 1000 / len(devices),
+        'tracked_ms': tracked * 1000 / len(devices),
+    }
+
+
+def main(count=200):
+    with FakeHomeCenter(devices=count) as hc:
+        client = Client('v3', hc.url, 'admin', 'admin')
+
+        results = {
+            'full': run_updates(client, hc, partial=False),
+            'partial': run_updates(client, hc, partial=True),
+            'changes': run_changes(client),
+        }
+        client.client.session.close()
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -31,3 +31,27 @@ def Client(version, *args, **kwargs):
     module = utils.import_versioned_module('client', version, 'client')
     client_class = getattr(module, 'Client')
     return client_class(*args, **kwargs)
+
+
+def ConcurrentClient(version, *args, **kwargs):
+    """This is a thread pool backed client wrapper handling API versioning
+
+    :param version: A verstion string of the API (i.e. 'v3')
+    :returns: A Home Center ConcurrentClient class
+    """
+
+    module = utils.import_versioned_module('client', version, 'client')
+    client_class = getattr(module, 'ConcurrentClient')
+    return client_class(*args, **kwargs)
+
+
+def StateHub(version, *args, **kwargs):
+    """This is a state hub wrapper handling API versioning
+
+    :param version: A verstion string of the API (i.e. 'v3')
+    :returns: A StateHub object polling the states of many clients
+    """
+
+    module = utils.import_versioned_module('client', version, 'statehub')
+    hub_class = getattr(module, 'StateHub')
+    return hub_class(*args, **kwargs)
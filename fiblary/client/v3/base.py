@@ -20,18 +20,69 @@
 
 """
 
-import fiblary.external.jsonpath as jsonpath
-
-from itertools import imap, ifilterfalse
+import collections
+from concurrent import futures
+import functools
+from itertools import ifilter, imap, ifilterfalse
 import logging
 import six
+import threading
+import time
 
+from fiblary.client.v3 import models
+from fiblary.common import codec
 from fiblary.common import exceptions
+from fiblary.common import jsonpath
+from fiblary.common import jsonstream
+from fiblary.common import throttle
+from fiblary.common import tracing
 from fiblary.common.utils import quote_if_string
 
 
 _logger = logging.getLogger(__name__)
 
+BULK_WORKERS = 8
+
+BulkResult = collections.namedtuple(
+    'BulkResult', ['id', 'ok', 'result', 'error', 'elapsed'])
+"""Outcome of the single call of the bulk operation. The calls skipped
+after the failure have ``futures.CancelledError`` error.
+"""
+
+
+def traced(name, arguments=('id',)):
+    """Decorator wrapping the controller method calls in the tracing span
+    with the resource and the positional arguments as the attributes
+
+    :param name: The span name i.e. 'fiblary.get'
+    :param arguments: The attribute names of the positional arguments.
+                      The item passed instead of the id is replaced by its
+                      key.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            attributes = {'resource': self.RESOURCE}
+            for attribute, value in zip(arguments, args):
+                if isinstance(value, dict):
+                    value = value.get(getattr(self, 'ITEM_KEY', 'id'))
+                attributes[attribute] = value
+            with tracing.span(name, **attributes):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bulk_workers(http_client, max_workers, count):
+    """Returns the number of workers of the concurrent calls capped by the
+    number of requests the Home Center throttle admits at once
+    """
+    workers = max_workers or BULK_WORKERS
+    admission = getattr(http_client, 'throttle', None)
+    if admission is not None and admission.max_in_flight:
+        workers = min(workers, admission.max_in_flight)
+    return max(1, min(workers, count))
+
 
 def _check_items(obj, searches):
     def _check_properties(attr, value):
@@ -62,10 +113,38 @@ class MinimalController(object):
         self.http_client = http_client
         self.model = model
 
+    def _decode(self, response, verb='GET'):
+        """Returns the decoded JSON body of the response"""
+        tracing.current().set_attribute('bytes', len(response.content or ''))
+        metrics = self.http_client.metrics
+        if metrics is None:
+            return codec.decode(response)
+
+        start = time.time()
+        try:
+            return codec.decode(response)
+        finally:
+            metrics.observe(
+                self.RESOURCE, verb, 'decode', time.time() - start)
+
+    def _build(self, item, verb='GET'):
+        """Returns the model object of the item"""
+        metrics = self.http_client.metrics
+        if metrics is None:
+            return self.model(item)
+
+        start = time.time()
+        try:
+            return self.model(item)
+        finally:
+            metrics.observe(
+                self.RESOURCE, verb, 'model', time.time() - start)
+
     def _get(self, **kwargs):
 
         try:
-            item = self.http_client.get(self.RESOURCE, params=kwargs).json()
+            item = self._decode(
+                self.http_client.get(self.RESOURCE, params=kwargs))
         except exceptions.ConnectionError:
             return None
         except exceptions.HTTPNotFound:
@@ -73,6 +152,7 @@ class MinimalController(object):
 
         return item
 
+    @traced('fiblary.get')
     def get(self):
         """Returns :class:`models.Model` object representing. This is
         applicable for single instance requests i.e. login, info, weather
@@ -80,7 +160,7 @@ class MinimalController(object):
         :returns: :class:`models.Model` object
         """
         item = self._get()
-        return self.model(item)
+        return self._build(item)
 
 
 class ReadOnlyController(MinimalController):
@@ -88,7 +168,15 @@ class ReadOnlyController(MinimalController):
     methods only
     """
     JSON_CONDITION_BASE = "(@.{0}=={1})"
+    ITEM_KEY = 'id'
+
+    def __init__(self, http_client, model):
+        super(ReadOnlyController, self).__init__(http_client, model)
+        self.replica = None
+        """If set to :class:`replica.Replica` the get, list and find
+        methods are served from the memory"""
 
+    @traced('fiblary.get')
     def get(self, item_id):
         """Returns :class:`models.Model` object representing an item
         identified by ``item_id``
@@ -103,14 +191,22 @@ class ReadOnlyController(MinimalController):
             _logger.debug("Called 'get' method with none id")
             return None
 
-        params = {"id": item_id}
-        item = self._get(**params)
-        return self.model(item)
+        item = None
+        if self.replica is not None:
+            item = self.replica.get(item_id)
 
+        if item is None:
+            params = {"id": item_id}
+            item = self._get(**params)
+        return self._build(item)
+
+    @traced('fiblary.list')
     def list(self, **kwargs):
         """
         :param kwargs: This is a dictionary of parameters passed to GET
         :type kwargs:
+        :param stream: If True the response is parsed and filtered item by
+                       item while it is being downloaded
         :return: Returns an iterator
         :rtype: iterator function
         """
@@ -122,16 +218,35 @@ class ReadOnlyController(MinimalController):
         # for some API calls home center handles additional parameters
 
         json_path = kwargs.pop('jsonpath', None)
+        stream = kwargs.pop('stream', False) and self.replica is None
+
+        if self.replica is not None:
+            items = None
+            if json_path is None:
+                items = self.replica.query(**kwargs)
+            if items is None:
+                # API params are filtered locally the same way as other ones
+                items = self.replica.list()
+            else:
+                # all the parameters answered by the index
+                kwargs = {}
+        else:
+            # Home center ignores unknown parameters so there is no need to
+            # remove them from REST request.
+            if stream:
+                items = self._stream(**kwargs)
+            else:
+                items = self._decode(self.http_client.get(
+                    self.RESOURCE, params=kwargs,
+                    priority=throttle.BULK))
+                if isinstance(items, list):
+                    tracing.current().set_attribute('items', len(items))
 
-        # Home center ignores unknown parameters so there is no need to
-        # remove them from REST request.
-        items = self.http_client.get(self.RESOURCE, params=kwargs).json()
-
-        # if there is no explicit defined json_path parameters
-        if json_path is None:
             for value in self.API_PARAMS:
                 kwargs.pop(value, None)
 
+        # if there is no explicit defined json_path parameters
+        if json_path is None:
             condition_expression = ""
             for k, v in six.iteritems(kwargs):
                 if k.startswith('p_'):  # search for properties
@@ -148,6 +263,16 @@ class ReadOnlyController(MinimalController):
                 json_path = "$[?({})]".format(condition_expression[:-5])
             _logger.debug("Implicit JSON Path: {}".format(json_path))
 
+        if json_path and stream:
+            path = jsonpath.compile(json_path)
+            if path.predicate is not None:
+                _logger.debug("JSON Path: {} (streamed)".format(json_path))
+                items = ifilter(path.predicate, items)
+                json_path = None
+            else:
+                # the expression needs the whole document
+                items = list(items)
+
         if json_path:
             _logger.debug("JSON Path: {}".format(json_path))
             filtered_items = jsonpath.jsonpath(items, json_path)
@@ -157,9 +282,19 @@ class ReadOnlyController(MinimalController):
                 items = []
 
         # in case there is only one item
-        items = items if isinstance(items, list) else [items]
-        return ifilterfalse(lambda i: i is None, imap(self.model, items))
+        if not stream:
+            items = items if isinstance(items, list) else [items]
+        return ifilterfalse(lambda i: i is None, imap(self._build, items))
 
+    def _stream(self, **kwargs):
+        """Returns an iterator over the items of the resource list parsed
+        while the response body is being downloaded
+        """
+        response = self.http_client.get(
+            self.RESOURCE, params=kwargs, priority=throttle.BULK, stream=True)
+        return _iter_response(response)
+
+    @traced('fiblary.find')
     def find(self, **kwargs):
         """Find single item with attributes matching ``**kwargs``.
         It also handles nested properties as a keywords.
@@ -194,6 +329,7 @@ class CommonController(ReadOnlyController):
     implementing method changing the data
     """
 
+    @traced('fiblary.create')
     def create(self, **kwargs):
         item = self.model(kwargs)
         for (key, value) in kwargs.items():
@@ -204,30 +340,169 @@ class CommonController(ReadOnlyController):
             return None
 
         try:
-            item = response.json()
+            item = self._decode(response, 'POST')
         except ValueError:
             _logger.warning(
                 "Invalid JSON format. Received: '{}'".format(response.text))
             return None
 
-        return self.model(item)
+        self._replicate(item)
+        return self._build(item, 'POST')
 
+    @traced('fiblary.delete')
     def delete(self, item_id):
         url = '{0}?id={1}'.format(self.RESOURCE, item_id)
         self.http_client.delete(url)
+        if self.replica is not None:
+            self.replica.remove(item_id)
         return
 
-    def update(self, data):
+    @traced('fiblary.update')
+    def update(self, data, partial=False):
+        """Updates the item on Home Center
+
+        :param data: The item to be updated i.e. :class:`models.Model`
+        :param partial: If True only the fields modified since the model
+        was retrieved are sent together with the item key
+        :returns: :class:`models.Model` object
+        """
+        if partial and isinstance(data, models.RecursiveDict):
+            payload = data.partial()
+            if not payload:
+                _logger.debug("Nothing to update: {}".format(
+                    data.get(self.ITEM_KEY)))
+                return data
+            payload[self.ITEM_KEY] = data[self.ITEM_KEY]
+            data = payload
+
         try:
             response = self.http_client.put(self.RESOURCE, json=data)
         except exceptions.ConnectionError:
             return None
 
         try:
-            item = response.json()
+            item = self._decode(response, 'PUT')
         except ValueError:
             _logger.warning(
                 "Invalid JSON format. Received: '{}'".format(response.text))
             return None
 
-        return self.model(item)
+        self._replicate(item)
+        return self._build(item, 'PUT')
+
+    def _replicate(self, item):
+        """Stores the item returned by Home Center in the replica"""
+        if self.replica is None or not isinstance(item, dict):
+            return
+        if self.ITEM_KEY in item:
+            self.replica.put(item)
+
+    def _bulk(self, function, item_ids, max_workers=None,
+              stop_on_error=False):
+        """Calls function(item_id) for all the items concurrently
+
+        The number of workers is capped by the number of requests the
+        Home Center throttle admits at once.
+
+        :param function: A callable taking the item id
+        :param item_ids: An iterable of the item ids
+        :param max_workers: The maximum number of concurrent calls.
+                            default BULK_WORKERS (optional)
+        :param stop_on_error: If True the calls not started before the
+                              first failure are skipped
+        :returns: A list of :class:`BulkResult` in the item_ids order
+        """
+        item_ids = list(item_ids)
+        if not item_ids:
+            return []
+
+        workers = bulk_workers(self.http_client, max_workers, len(item_ids))
+
+        failed = threading.Event()
+
+        def call(item_id):
+            if failed.is_set():
+                return BulkResult(
+                    item_id, False, None, futures.CancelledError(), 0.0)
+            start = time.time()
+            try:
+                result = function(item_id)
+            except Exception as e:
+                if stop_on_error:
+                    failed.set()
+                return BulkResult(
+                    item_id, False, None, e, time.time() - start)
+            return BulkResult(item_id, True, result, None, time.time() - start)
+
+        executor = futures.ThreadPoolExecutor(workers)
+        try:
+            results = list(executor.map(call, item_ids))
+        finally:
+            executor.shutdown()
+
+        _logger.info("Bulk {} call on {} item(s): {} failed".format(
+            self.RESOURCE,
+            len(results),
+            sum(1 for result in results if not result.ok)))
+        return results
+
+
+def _iter_response(response):
+    try:
+        for item in jsonstream.iter_array(
+                response.iter_content(jsonstream.CHUNK_SIZE),
+                response.encoding or 'utf-8'):
+            yield item
+    finally:
+        response.close()
+
+
+def _materialize(function, *args, **kwargs):
+    result = function(*args, **kwargs)
+    # lazy iterators (i.e. returned by list) must be consumed in the worker
+    # otherwise the model building would happen in the caller's thread
+    if isinstance(result, collections.Iterator):
+        result = list(result)
+    return result
+
+
+REQUEST_METHODS = (
+    'get', 'list', 'find', 'findall', 'create', 'delete', 'update', 'set',
+    'action', 'bulk_action', 'start', 'stop', 'enable', 'disable',
+    'bulk_control', 'history',
+)
+"""The controller methods run by :class:`ConcurrentController`"""
+
+
+class ConcurrentController(object):
+    """Thread pool backed proxy of the controller.
+
+    The request methods of the wrapped controller (get, list, find, create,
+    update, delete, action, ...) are executed by the executor and return
+    a :class:`concurrent.futures.Future` object. The iterators returned
+    by ``list`` are resolved to the lists in the worker. Every other
+    attribute, i.e. ``model``, is returned as is.
+    """
+
+    def __init__(self, controller, executor):
+        self.controller = controller
+        self.executor = executor
+
+    @property
+    def RESOURCE(self):
+        return self.controller.RESOURCE
+
+    def __getattr__(self, name):
+        attr = getattr(self.controller, name)
+        if name not in REQUEST_METHODS or not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            return self.executor.submit(_materialize, attr, *args, **kwargs)
+
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+
+    def __repr__(self):
+        return "Concurrent({})".format(self.controller.__class__.__module__)
@@ -19,38 +19,103 @@
  Home Center Controller Client Implementation
 
 """
+from concurrent import futures
 import logging
+import os
 import sys
+import tempfile
 import threading
+import time
 
+from fiblary.client.v3 import base
 from fiblary.client.v3 import devices
 from fiblary.client.v3 import events
+from fiblary.client.v3 import index
 from fiblary.client.v3 import info
 from fiblary.client.v3 import login
 from fiblary.client.v3 import models
+from fiblary.client.v3 import replica
 from fiblary.client.v3 import rooms
+from fiblary.client.v3 import routing
 from fiblary.client.v3 import scenes
 from fiblary.client.v3 import sections
+from fiblary.client.v3 import snapshot
 from fiblary.client.v3 import users
 from fiblary.client.v3 import variables
 from fiblary.client.v3 import weather
 
+from fiblary.common import cache as response_cache
+from fiblary.common import codec
+from fiblary.common.event import Coalescer
+from fiblary.common.event import Dispatcher
 from fiblary.common.event import EventHook
 from fiblary.common import exceptions
+from fiblary.common import metrics as request_metrics
 from fiblary.common import restapi
+from fiblary.common import throttle as admission
+from fiblary.common import tracing
 
 
 _logger = logging.getLogger(__name__)
 
 _schema_ignore = ["HC_user", "VOIP_user", "weather", 'iOS_device', '']
 
+DISPATCHER_WORKERS = 4
+
+_controllers = ('info', 'login', 'sections', 'rooms', 'users', 'variables',
+                'scenes', 'devices', 'weather', 'events')
+
+MAX_OUTAGE = 300
+"""The number of seconds without refreshStates response after which the
+changes are assumed lost"""
+
+CURSOR_SAVE_INTERVAL = 1
+
+RESYNC_EVENT = 'resync'
+"""The event name of the resync after the refreshStates gap"""
+
+SNAPSHOT_REPLICAS = ('devices', 'rooms', 'sections', 'scenes')
+"""The snapshot resources served from the replica after warm start, all
+but devices are refetched in the background"""
+
 
 class Client(object):
     """Home Center 2 Client Class.
     Provides interface to different resources managed by HC2
     through the specialized controllers
     """
-    def __init__(self, endpoint, username=None, password=None):
+    def __init__(self, endpoint, username=None, password=None,
+                 dispatcher=None, dispatcher_workers=DISPATCHER_WORKERS,
+                 coalesce=False, cache=None, throttle=None, debug=False,
+                 cursor_file=None, session=None, metrics=None):
+        """Construct a new Home Center 2 client
+
+        :param endpoint: The API url i.e. http://<hc2_ip>/api/
+        :param username: The Home Center user name
+        :param password: The Home Center user password
+        :param dispatcher: A :class:`event.Dispatcher` object calling the
+                           event handlers. Can be shared between clients.
+        :param dispatcher_workers: A number of dispatcher workers if the
+                                   dispatcher is created by the client
+        :param coalesce: If True the concurrent identical GET requests
+                         share a single HTTP call
+        :param cache: A :class:`cache.ResponseCache` object or True to
+                      cache the read-mostly resources with default TTLs
+        :param throttle: A :class:`throttle.Throttle` object or True to use
+                         the default throttle shared by all the clients of
+                         the same Home Center
+        :param debug: Trace the requests and responses with the client
+                      logger at DEBUG level. True or a dictionary with
+                      ``trace_body_limit`` and ``trace_sample_rate``
+        :param cursor_file: The file the state handler stores the
+                            refreshStates cursor in, so it resumes from the
+                            same point after the restart
+        :param session: The :class:`requests.Session` object sending the
+                        requests i.e. :class:`cassette.Recorder` or
+                        :class:`cassette.Player`
+        :param metrics: A :class:`metrics.Metrics` object or True to record
+                        the request timing available as ``client.metrics``
+        """
 
         if '/api/' not in endpoint:
             raise IOError("Wrong API string. It should be like: "
@@ -58,15 +123,34 @@ class Client(object):
 
         # TODO(klstanie):  Add the HC2 reachability checking
 
+        trace_options = debug if isinstance(debug, dict) else {}
+
         self.client = restapi.RESTApi(
+            session=session,
             base_url=endpoint,
             username=username,
             password=password,
-            debug=True
+            debug=bool(debug),
+            coalesce=coalesce,
+            cache=response_cache.ResponseCache() if cache is True else cache,
+            throttle=admission.get(endpoint) if throttle is True else throttle,
+            metrics=request_metrics.Metrics() if metrics is True else (
+                metrics or None),
+            **trace_options
         )
 
         self.modified = {}
         self.modified_lock = threading.Lock()
+        self.batch_hook = None
+        self._coalescers = {}
+        self.router = routing.Router(self._device_of, self._new_event_hook)
+        # the device attributes used to route the changes w/o replica
+        self._devices_info = {}
+        self._refresher = None
+
+        # the event handlers of all properties share the dispatcher workers
+        self.dispatcher = dispatcher
+        self.dispatcher_workers = dispatcher_workers
 
         # initialize the managers
         self.info = info.Controller(
@@ -119,6 +203,7 @@ class Client(object):
             self._get_event_model()
         )
 
+        self.cursor_file = cursor_file
         self.state_handler = None
 
     def _get_info_model(self):
@@ -174,21 +259,64 @@ class Client(object):
     def __repr__(self):
         return "Home Center 2 Client"
 
+    @property
+    def metrics(self):
+        """The :class:`metrics.Metrics` object or None"""
+        return self.client.metrics
+
     def _on_property_change(self, **kwargs):
         property_name = kwargs.get('property', None)
         if not property_name:
             return
-        try:
-            self.modified[property_name](**kwargs)
-        except Exception:
-            # trick to reduce number of exceptions
-            with self.modified_lock:
-                self.modified[property_name] = EventHook(property_name)
+        # the hooks are created only by add_event_handler, so the changes
+        # of the properties nobody subscribed to are dropped here
+        hook = self.modified.get(property_name)
+        if hook is not None:
+            hook(**kwargs)
+
+        for hook in self.router.match(property_name, kwargs.get('id')):
+            hook(**kwargs)
+
+    def _device_of(self, device_id):
+        """Returns the device dictionary used to route the change"""
+        if device_id is None:
+            return None
+        if self.devices.replica is not None:
+            return self.devices.replica.get(device_id)
+
+        info = self._devices_info.get(device_id)
+        if info is None:
+            item = self.devices._get(id=device_id)
+            if not isinstance(item, dict):
+                # not cached, so looked up again with the next change
+                return None
+            info = self._devices_info[device_id] = dict(
+                (field, item.get(field)) for field in routing.FIELDS)
+        return info
+
+    def _new_event_hook(self, property_name):
+        if self.dispatcher is None:
+            self.dispatcher = Dispatcher(
+                self.dispatcher_workers,
+                name="Dispatcher({})".format(self.client.base_url))
+        return EventHook(property_name, dispatcher=self.dispatcher)
 
     def _on_state_change(self, state):
+        if self.devices.replica is not None:
+            unknown = self.devices.replica.apply_state(state)
+            if unknown:
+                # i.e. the devices added since the replica was loaded
+                self._resync('unknown', unknown)
+
         timestamp = state.get('timestamp', 0)
+        batch = self.batch_hook is not None and \
+            self.batch_hook.get_handler_count() > 0
+        changes = []
         for change in state.get('changes', []):
             device_id = change.pop('id')
+            if 'roomID' in change:
+                # the device moved so it is routed by the new room
+                self._devices_info.pop(device_id, None)
             for property_name, value in change.items():
                 data = {
                     'timestamp': timestamp,
@@ -198,38 +326,417 @@ class Client(object):
                     'client': self
                 }
                 self._on_property_change(**data)
+                if batch:
+                    changes.append(data)
+
+        if changes:
+            self.batch_hook(
+                timestamp=timestamp,
+                last=state.get('last'),
+                changes=changes,
+                client=self)
 
 # API
 
-    def enable_state_handler(self):
-        self.state_handler = StateHandler(self, self._on_state_change)
+    def enable_state_handler(self, last=None, received=None):
+        """Starts the state handler
+
+        :param last: The refreshStates cursor to resume from
+        :param received: The time the cursor was received at, the gap is
+                         reported if it is older than ``MAX_OUTAGE``
+        """
+        self.state_handler = StateHandler(
+            self, self._on_state_change, last=last, received=received,
+            cursor_file=self.cursor_file, on_gap=self._resync)
 
     def disable_state_handler(self):
         self.state_handler.stop()
 
-    def add_event_handler(self, property_name, handler):
-        if property_name not in self.modified:
-            with self.modified_lock:
-                self.modified[property_name] = EventHook(property_name)
-
-        self.modified[property_name] += handler
-
-    def remove_event_handler(self, property_name, handler):
+    def enable_replica(self, properties=(), ranges=()):
+        """Enables the in-memory replica of devices. The devices are
+        fetched once and then patched with the changes received by the
+        state handler. The devices get, list and find methods are served
+        from the replica afterwards.
+
+        The replica indexes the devices by id, roomID, type, parentId and
+        baseType, so the list and find methods with those parameters do
+        not scan all the devices.
+
+        :param properties: The device properties to be indexed as well
+                           i.e. ('deviceID', 'value')
+        :param ranges: The numeric fields with the range index i.e.
+                       ('p_value',) used by :meth:`replica.Replica.between`
+        :returns: :class:`replica.Replica` object
+        """
+        # the cursor is taken before fetching the devices, so the changes
+        # made in between are replayed by the state handler
+        last = self._cursor()
+        if self.state_handler is not None and not self.state_handler.stopped():
+            self.state_handler.stop()
+
+        devices_replica = self._load_replica(
+            self.devices,
+            codec.decode(self.client.get(self.devices.RESOURCE)),
+            index.Index(properties=properties, ranges=ranges),
+            last)
+
+        self.enable_state_handler(last=last)
+        return devices_replica
+
+    def disable_replica(self):
+        """Disables the in-memory replicas"""
+        for controller in self._replicable_controllers():
+            controller.replica = None
+
+    def _resync(self, reason, device_ids=None):
+        """Refetch the devices after the changes were lost and emit the
+        resync event.
+
+        :param reason: 'reset' if Home Center reset the cursor, 'outage'
+                       if no state was received for too long or 'unknown'
+                       for the changes of the devices not in replica
+        :param device_ids: The ids of the affected devices or None if all
+                           the devices may be affected
+        """
+        _logger.warning("Resync of {} device(s) due to {}".format(
+            len(device_ids) if device_ids else 'all', reason))
+
+        devices_replica = self.devices.replica
+        if devices_replica is not None:
+            if device_ids:
+                for device_id in device_ids:
+                    item = self.devices._get(id=device_id)
+                    if isinstance(item, dict):
+                        devices_replica.put(item)
+                    else:
+                        devices_replica.remove(device_id)
+            else:
+                devices_replica.load(codec.decode(self.client.get(
+                    self.devices.RESOURCE, priority=admission.BULK)))
+        # the devices might have been moved between the rooms
+        self._devices_info.clear()
+
+        self._on_property_change(
+            timestamp=int(time.time()),
+            id=None,
+            property=RESYNC_EVENT,
+            value={
+                'reason': reason,
+                'devices': sorted(device_ids) if device_ids else None,
+            },
+            client=self)
+
+    def _replicable_controllers(self):
+        """Returns the controllers supporting the replica"""
+        return [getattr(self, name) for name in _controllers
+                if isinstance(getattr(self, name), base.ReadOnlyController)]
+
+    def _load_replica(self, controller, items, items_index=None, last=None):
+        # the changes of the device fields the events are routed by
+        fields = routing.FIELDS if controller is self.devices else ()
+        resource_replica = replica.Replica(
+            key=controller.ITEM_KEY, index=items_index, fields=fields)
+        resource_replica.load(items, last)
+        controller.replica = resource_replica
+        return resource_replica
+
+    def _cursor(self):
+        """Returns the current refreshStates cursor"""
+        if self.devices.replica is not None and \
+                self.devices.replica.last is not None:
+            return self.devices.replica.last
+
+        if self.state_handler is not None and not self.state_handler.stopped():
+            if self.state_handler.last not in (None, "0"):
+                return self.state_handler.last
+
+        state = codec.decode(self.client.get(
+            'refreshStates?last=0', priority=admission.EXEMPT))
+        return state['last']
+
+    def save_snapshot(self, path, resources=snapshot.RESOURCES):
+        """Saves the resources and the refreshStates cursor to the file.
+        The resources served from the replica are not fetched again.
+
+        :param path: The snapshot file path
+        :param resources: The names of the resources to be saved
+        :returns: The refreshStates cursor the snapshot is valid for
+        """
+        controllers = dict(
+            (controller.RESOURCE, controller)
+            for controller in self._replicable_controllers())
+
+        # the changes made while fetching are replayed after loading
+        last = self._cursor()
+        data = {}
+        for name in resources:
+            controller = controllers.get(name)
+            if controller is not None and controller.replica is not None:
+                data[name] = controller.replica.list()
+            else:
+                data[name] = codec.decode(
+                    self.client.get(name, priority=admission.BULK))
+
+        snapshot.save(path, data, last, self.client.base_url)
+        return last
+
+    def load_snapshot(self, path, max_age=None, replicas=SNAPSHOT_REPLICAS,
+                      properties=(), ranges=()):
+        """Warm start from the snapshot file. The replicas of the stored
+        resources are loaded from the file and the state handler is
+        (re)started from the snapshot cursor, so only the changes since
+        the snapshot was saved are received from Home Center.
+
+        Only the devices replica is updated by the state handler. The
+        other replicas are marked stale and refetched in the background,
+        then they change only with the updates made by this client.
+
+        :param path: The snapshot file path
+        :param max_age: The maximum snapshot age in seconds (optional)
+        :param replicas: The names of the resources to be replicated
+        :param properties: The device properties to be indexed
+        :param ranges: The numeric device fields with the range index
+        :returns: The refreshStates cursor of the snapshot
+        :raises exceptions.SnapshotError: If the snapshot file is invalid,
+                                         too old or of the other Home Center
+        """
+        stale = []
+        with snapshot.Snapshot(path) as snap:
+            if snap.endpoint and snap.endpoint != self.client.base_url:
+                raise exceptions.SnapshotError(
+                    "Snapshot of the other Home Center: {}".format(
+                        snap.endpoint))
+
+            if max_age is not None and snap.age() > max_age:
+                raise exceptions.SnapshotError(
+                    "Snapshot is {:.0f} second(s) old".format(snap.age()))
+
+            for controller in self._replicable_controllers():
+                if controller.RESOURCE not in replicas:
+                    continue
+                items = snap.get(controller.RESOURCE)
+                if items is None:
+                    continue
+                items_index = None
+                if controller is self.devices:
+                    items_index = index.Index(
+                        properties=properties, ranges=ranges)
+                resource_replica = self._load_replica(
+                    controller, items, items_index, snap.last)
+                if controller is not self.devices:
+                    resource_replica.stale = True
+                    stale.append(controller)
+            last = snap.last
+            created = snap.created
+
+        _logger.info("Warm start from snapshot {} at {}".format(path, last))
+        if self.state_handler is not None and not self.state_handler.stopped():
+            self.state_handler.stop()
+        # the replicas are resynced if the snapshot is older than the
+        # changes kept by Home Center
+        self.enable_state_handler(last=last, received=created)
+
+        if stale:
+            self._refresher = threading.Thread(
+                name="Refresh({})".format(self.client.base_url),
+                target=self._refresh_replicas,
+                args=(stale,))
+            self._refresher.daemon = True
+            self._refresher.start()
+        return last
+
+    def _refresh_replicas(self, controllers):
+        """Refetch the replicas not followed by the state handler. The
+        replica is disabled if it can not be refetched.
+        """
+        for controller in controllers:
+            resource_replica = controller.replica
+            if resource_replica is None:
+                continue
+            try:
+                items = codec.decode(self.client.get(
+                    controller.RESOURCE, priority=admission.BULK))
+            except Exception as e:
+                _logger.warning("Can not refresh {} replica: {}".format(
+                    controller.RESOURCE, e))
+                controller.replica = None
+                continue
+            resource_replica.load(items)
+
+    def add_event_handler(self, property_name, handler, window=None,
+                          max_rate=None, device_id=None, room_id=None,
+                          device_type=None):
+        """Registers the handler called with the property changes.
+
+        If any of ``device_id``, ``room_id`` or ``device_type`` is given
+        the handler is called only for the changes of the matching devices.
+        Such handlers are found by the dispatch index, so they are not
+        called for the other devices at all. The room and the type of the
+        device are taken from the devices replica if enabled.
+
+        :param property_name: The device property name i.e. 'value'
+        :param handler: The function called with timestamp, id, property,
+                        value and client keyword arguments
+        :param window: If set the changes of the device property are
+                       collected for ``window`` seconds and only the last
+                       one is passed to the handler
+        :param max_rate: If set the handler is called at most
+                         ``max_rate`` times per second per device with the
+                         last change
+        :param device_id: The id of the device
+        :param room_id: The id of the room of the devices
+        :param device_type: The type of the devices
+                            i.e. 'com.fibaro.binarySwitch'
+        """
+        key = self._route_key(property_name, device_id, room_id, device_type)
+        if key is None:
+            if property_name not in self.modified:
+                with self.modified_lock:
+                    self.modified[property_name] = self._new_event_hook(
+                        property_name)
+            hook = self.modified[property_name]
+        else:
+            hook = self.router.hook(key, create=True)
+
+        if window or max_rate:
+            coalescer = Coalescer(
+                handler, window, max_rate, deliver=self._deliver)
+            self._coalescers[(key or property_name, handler)] = coalescer
+            handler = coalescer
+
+        hook += handler
+
+    @staticmethod
+    def _route_key(property_name, device_id, room_id, device_type):
+        filters = dict((field, value) for field, value in (
+            ('id', device_id),
+            ('roomID', room_id),
+            ('type', device_type)) if value is not None)
+        if not filters:
+            return None
+        return routing.route_key(property_name, filters)
+
+    def _deliver(self, handler, kwargs):
+        # the coalesced changes are called by the dispatcher workers
+        self.dispatcher.put(handler, handler, (), kwargs)
+
+    def add_batch_handler(self, handler):
+        """Registers the handler called once per refreshStates response
+        with timestamp, last, changes and client keyword arguments. The
+        changes is the list of the property changes passed to the
+        handlers registered with :meth:`add_event_handler`.
+        """
+        with self.modified_lock:
+            if self.batch_hook is None:
+                self.batch_hook = self._new_event_hook('batch')
+        self.batch_hook += handler
+
+    def remove_batch_handler(self, handler):
         try:
-            self.modified[property_name] -= handler
-        except ValueError:
+            self.batch_hook -= handler
+        except (TypeError, ValueError, exceptions.HandlerNotFound):
+            raise exceptions.HandlerNotFound(
+                message="Batch handler not found: {}.".format(handler))
+
+    def get_queue_depths(self):
+        """Returns the dictionary of events waiting for the handlers
+        per property name
+        """
+        depths = dict(
+            (name, hook.get_queue_depth())
+            for name, hook in self.modified.items())
+        depths.update(self.router.depths())
+        return depths
+
+    def remove_event_handler(self, property_name, handler, device_id=None,
+                             room_id=None, device_type=None):
+        key = self._route_key(property_name, device_id, room_id, device_type)
+        coalescer = self._coalescers.pop((key or property_name, handler), None)
+        if coalescer is not None:
+            coalescer.cancel()
+        try:
+            if key is None:
+                self.modified[property_name] -= handler
+            else:
+                hook = self.router.hook(key)
+                if hook is None:
+                    raise ValueError
+                hook -= handler
+                self.router.discard(key)
+        except (KeyError, ValueError, exceptions.HandlerNotFound):
             raise exceptions.HandlerNotFound(
                 message="Handler for property '{}' not found: {}.".format(
                     property_name,
                     handler.__name__))
 
 
+class ConcurrentClient(object):
+    """Home Center 2 Concurrent Client Class.
+    Provides the same controllers as :class:`Client` but the controller
+    request methods are run by a thread pool and return
+    :class:`concurrent.futures.Future` object instead of blocking the
+    caller on the HTTP request.
+
+    Every request in flight still occupies one worker thread. Many
+    ConcurrentClient objects can share a single executor so the number of
+    the worker threads does not grow with the number of Home Centers.
+    """
+    def __init__(self, endpoint, username=None, password=None,
+                 executor=None, max_workers=restapi.CONCURRENT_WORKERS,
+                 **kwargs):
+
+        self.sync = Client(endpoint, username, password, **kwargs)
+
+        self._own_executor = executor is None
+        self.executor = executor or futures.ThreadPoolExecutor(max_workers)
+
+        self.client = restapi.ConcurrentRESTApi(
+            api=self.sync.client,
+            executor=self.executor,
+            max_workers=max_workers
+        )
+        if kwargs.get('session') is None:
+            restapi.size_pool(self.sync.client.session, max_workers)
+
+        for name in _controllers:
+            setattr(self, name, base.ConcurrentController(
+                getattr(self.sync, name),
+                self.executor)
+            )
+
+    def __repr__(self):
+        return "Home Center 2 Concurrent Client"
+
+    def close(self, wait=True):
+        """Shutdown the executor if it was created by the client"""
+        if self._own_executor:
+            self.executor.shutdown(wait=wait)
+
+
 class StateHandler(threading.Thread):
-    def __init__(self, client, callback):
+    """Long-polls refreshStates and passes the states to the callback.
+
+    The cursor is optionally persisted in ``cursor_file`` and the handler
+    resumes from it. If Home Center resets the cursor (i.e. after reboot)
+    or no state was received for more than ``max_outage`` seconds the
+    changes in between are lost and ``on_gap(reason)`` is called before
+    the state is passed to the callback.
+    """
+    def __init__(self, client, callback, last=None, cursor_file=None,
+                 on_gap=None, max_outage=MAX_OUTAGE, received=None):
         super(StateHandler, self).__init__(name=self.__class__.__name__)
         self.client = client
         self.api = client.client
         self.callback = callback
+        self.cursor_file = cursor_file
+        self.on_gap = on_gap
+        self.max_outage = max_outage
+
+        self.last = last
+        self.received = received  # time of the last state received
+        self._saved = 0
+        if last is None and cursor_file:
+            self.last, self.received = _read_cursor(cursor_file)
         self.daemon = True  # stop unconditionally on exit
 
         self._stop = threading.Event("Stop")
@@ -240,7 +747,7 @@ class StateHandler(threading.Thread):
         """State Handler main loop"""
 
         _logger.info("Starting the state change handler")
-        last = "0"
+        last = self.last or "0"
         while not self.stopped():
 
             timeout = 60
@@ -253,17 +760,9 @@ class StateHandler(threading.Thread):
                     break
 
                 try:
-                    state = self.api.get(
-                        'refreshStates?last={}'.format(last),
-                        timeout=timeout)
-                    _logger.debug(state)
-                    try:
-                        state = state.json()
-                    except Exception:
-                        _logger.critical("JSON ERROR: {}".format(state))
-                        raise
-                    last = state['last']
-                    self.callback(state)
+                    with tracing.span('fiblary.poll', last=last) as span:
+                        self._poll(last, timeout, span)
+                    last = self.last
                     success = True
                     break
 
@@ -292,6 +791,58 @@ class StateHandler(threading.Thread):
 
         _logger.info("State change handler stopped.")
 
+    def _poll(self, last, timeout, span):
+        """Single refreshStates long-poll cycle"""
+        state = self.api.get(
+            'refreshStates?last={}'.format(last),
+            timeout=timeout,
+            priority=admission.EXEMPT)
+        if self.stopped():
+            # the poll pending when stopped is superseded, i.e. by the
+            # handler restarted from the other cursor
+            return
+        _logger.debug(state)
+        span.set_attribute('bytes', len(state.content or ''))
+        try:
+            state = codec.decode(state)
+        except Exception:
+            _logger.critical("JSON ERROR: {}".format(state))
+            raise
+        self._check_gap(last, state)
+        self.last = state['last']
+        span.set_attributes(
+            changes=len(state.get('changes') or ()), next=self.last)
+        self.callback(state)
+        self._save_cursor()
+
+    def _check_gap(self, last, state):
+        now = time.time()
+        reason = None
+        if last not in (None, "0"):
+            if _cursor(state.get('last')) < _cursor(last):
+                reason = 'reset'
+            elif self.received and now - self.received > self.max_outage:
+                reason = 'outage'
+
+        if reason:
+            _logger.warning("refreshStates gap ({}) at {} -> {}".format(
+                reason, last, state.get('last')))
+            if self.on_gap:
+                self.on_gap(reason)
+        self.received = now
+
+    def _save_cursor(self, force=False):
+        if not self.cursor_file or self.last is None:
+            return
+        now = time.time()
+        if not force and now - self._saved < CURSOR_SAVE_INTERVAL:
+            return
+        try:
+            _write_cursor(self.cursor_file, self.last, self.received)
+            self._saved = now
+        except (IOError, OSError) as e:
+            _logger.warning("Can not save the cursor: {}".format(e))
+
     def stopped(self):
         return self._stop.isSet()
 
@@ -300,3 +851,37 @@ class StateHandler(threading.Thread):
 
         self.api.session.close()  # not effect on pending request
         self._stop.set()
+        # saved here as the pending poll is dropped when it returns
+        self._save_cursor(force=True)
+
+
+def _cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _read_cursor(path):
+    """Returns the (cursor, time of the last state) stored in the file or
+    (None, None) if the file is missing or invalid
+    """
+    try:
+        with open(path) as f:
+            data = codec.loads(f.read())
+        return data['last'], data.get('received')
+    except (IOError, ValueError, KeyError, TypeError) as e:
+        _logger.info("No refreshStates cursor in {}: {}".format(path, e))
+        return None, None
+
+
+def _write_cursor(path, last, received):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.cursor', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(codec.dumps({'last': last, 'received': received}))
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
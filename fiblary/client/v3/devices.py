@@ -21,6 +21,7 @@
 
 from fiblary.client.v3 import base
 from fiblary.common import exceptions
+from fiblary.common import throttle
 
 import logging
 
@@ -38,16 +39,32 @@ class Controller(base.CommonController):
     RESOURCE = 'devices'
     API_PARAMS = ('id', 'type', 'roomID')
 
+    @base.traced('fiblary.action', ('id', 'action'))
     def action(self, device_id, action, *args):
         cmd = "callAction?deviceID={0}&name={1}".format(device_id, action)
         for i, arg in enumerate(args, 1):
             cmd = '{0}&arg{1}={2}'.format(cmd, i, arg)
 
-        resp = self.http_client.get(cmd)
+        resp = self.http_client.get(cmd, priority=throttle.INTERACTIVE)
         if resp.status_code != 200 and resp.status_code != 202:
             exceptions.from_response(resp)
 
-    def update(self, data):
+    def bulk_action(self, device_ids, action, *args, **kwargs):
+        """Calls the action on many devices concurrently
+
+        :param device_ids: An iterable of the device ids
+        :param action: The action name i.e. 'turnOff'
+        :param args: The action arguments
+        :param max_workers: The maximum number of concurrent calls
+        :param stop_on_error: Skip the remaining devices on first failure
+        :returns: A list of :class:`base.BulkResult`
+        """
+        def call(device_id):
+            return self.action(device_id, action, *args)
+
+        return self._bulk(call, device_ids, **kwargs)
+
+    def update(self, data, partial=False):
         try:
             """
             HC2 does not like those properties to be PUT
@@ -58,4 +75,4 @@ class Controller(base.CommonController):
         except Exception:
             pass
 
-        return super(Controller, self).update(data)
+        return super(Controller, self).update(data, partial)
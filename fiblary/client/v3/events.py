@@ -19,9 +19,106 @@
  Home Center Info Manager Implementation
 """
 
+import collections
+from concurrent import futures
+import itertools
+import logging
+
 from fiblary.client.v3 import base
+from fiblary.common import throttle
+
+
+_logger = logging.getLogger(__name__)
+
+HISTORY_WINDOW = 24 * 3600
+"""The default number of seconds of the history fetched by one request"""
+
+HISTORY_TIMEOUT = 60
+"""The default timeout in seconds of the single window request"""
+
+
+def windows(start, end, window):
+    """Returns the list of (from, to) ranges covering <start, end>. The
+    ranges share the boundaries as both ends are inclusive.
+    """
+    if window <= 0:
+        raise ValueError("The window must be positive: {}".format(window))
+    result = []
+    while True:
+        to = min(start + window, end)
+        result.append((start, to))
+        if to >= end:
+            return result
+        start = to
 
 
 class Controller(base.ReadOnlyController):
     RESOURCE = 'panels/event'
     API_PARAMS = ('last', 'from', 'to', 'type', 'deviceID')
+
+    def history(self, start, end, window=HISTORY_WINDOW, max_workers=None,
+                timeout=HISTORY_TIMEOUT, **kwargs):
+        """Returns an iterator over the events between ``start`` and ``end``
+        ordered by the timestamp.
+
+        The range is split into windows fetched concurrently, so the long
+        history does not end up in a single huge request. The windows are
+        requested ahead of the consumer by at most twice the number of the
+        workers, and the events repeated at the window boundaries are
+        returned once.
+
+        :param start: The Unix timestamp of the oldest event
+        :param end: The Unix timestamp of the newest event
+        :param window: The number of seconds fetched by a single request
+        :param max_workers: The maximum number of concurrent requests.
+                            default base.BULK_WORKERS capped by the throttle
+        :param timeout: The timeout in seconds of the single request
+        :param kwargs: Other parameters i.e. deviceID=3
+        :returns: An iterator of :class:`models.Model` objects
+        """
+        ranges = windows(start, end, window)
+        workers = base.bulk_workers(self.http_client, max_workers, len(ranges))
+        params = dict({'type': 'time'}, **kwargs)
+
+        _logger.debug("History of {} window(s) with {} worker(s)".format(
+            len(ranges), workers))
+
+        executor = futures.ThreadPoolExecutor(workers)
+        pending = collections.deque()
+        ranges = iter(ranges)
+        try:
+            for window_range in itertools.islice(ranges, workers * 2):
+                pending.append(executor.submit(
+                    self._window, window_range, timeout, params))
+
+            previous = set()
+            while pending:
+                items = pending.popleft().result()
+                for window_range in itertools.islice(ranges, 1):
+                    pending.append(executor.submit(
+                        self._window, window_range, timeout, params))
+
+                current = set()
+                for item in items:
+                    item_id = item.get('id')
+                    current.add(item_id)
+                    if item_id in previous:
+                        continue
+                    yield self._build(item)
+                previous = current
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _window(self, window_range, timeout, params):
+        """Returns the events of the window ordered by the timestamp"""
+        params = dict(params)
+        params['from'], params['to'] = window_range
+        items = self._decode(self.http_client.get(
+            self.RESOURCE, params=params, timeout=timeout,
+            priority=throttle.BULK))
+        if not isinstance(items, list):
+            items = [items] if items else []
+        return sorted(items, key=lambda item: (
+            item.get('timestamp'), item.get('id')))
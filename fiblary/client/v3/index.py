@@ -0,0 +1,181 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.index
+ ~~~~~~~~~~~~~
+
+ Home Center Resource Index Implementation
+"""
+
+import bisect
+import collections
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+FIELDS = ('id', 'roomID', 'type', 'parentId', 'baseType')
+"""The fields indexed by default"""
+
+
+def field_name(name):
+    """Returns the field name of the list keyword argument i.e.
+    'p_value' -> 'properties.value'
+    """
+    if name.startswith('p_'):
+        return 'properties.' + name[2:]
+    return name
+
+
+def _getter(field):
+    keys = field.split('.')
+
+    def getter(item):
+        for key in keys:
+            item = item[key]
+        return item
+
+    return getter
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Index(object):
+    """Hash and range indexes over the items of the resource.
+
+    The hash indexes answer the equality queries, the range indexes keep
+    the numeric values of the field sorted. Home Center reports most of
+    the device properties as strings, so the range index converts the
+    values to float and skips the non-numeric ones.
+
+    The index is not thread safe. :class:`replica.Replica` maintains it
+    under its lock.
+    """
+
+    def __init__(self, key='id', fields=FIELDS, properties=(), ranges=()):
+        """
+        :param key: The item key
+        :param fields: The top level fields with the hash index
+        :param properties: The device properties with the hash index
+                           i.e. ('deviceID', 'value')
+        :param ranges: The fields or properties with the range index
+                       i.e. ('properties.value', 'p_batteryLevel')
+        """
+        self.key = key
+        self._hash = dict(
+            (field, collections.defaultdict(set))
+            for field in tuple(fields) + tuple(
+                'properties.' + name for name in properties))
+        self._ranges = dict((field_name(field), []) for field in ranges)
+        self._getters = dict(
+            (field, _getter(field))
+            for field in set(self._hash) | set(self._ranges))
+        # the indexed values of the item needed to remove it
+        self._entries = {}
+
+    def indexed(self, field):
+        """Returns True if the field has the hash index"""
+        return field_name(field) in self._hash
+
+    def clear(self):
+        for index in self._hash.values():
+            index.clear()
+        for index in self._ranges.values():
+            del index[:]
+        self._entries.clear()
+
+    def add(self, item):
+        """Index the item replacing the previous version if exists"""
+        item_id = item[self.key]
+        self.discard(item_id)
+
+        entry = {}
+        for field, getter in self._getters.items():
+            try:
+                value = getter(item)
+            except (KeyError, TypeError, IndexError):
+                continue
+
+            if field in self._hash:
+                try:
+                    self._hash[field][value].add(item_id)
+                except TypeError:  # unhashable
+                    continue
+            if field in self._ranges:
+                number = _number(value)
+                if number is not None:
+                    bisect.insort(self._ranges[field], (number, item_id))
+            entry[field] = value
+
+        self._entries[item_id] = entry
+
+    def discard(self, item_id):
+        """Remove the item from the indexes if exists"""
+        entry = self._entries.pop(item_id, None)
+        if not entry:
+            return
+
+        for field, value in entry.items():
+            if field in self._hash:
+                ids = self._hash[field][value]
+                ids.discard(item_id)
+                if not ids:
+                    del self._hash[field][value]
+            if field in self._ranges:
+                number = _number(value)
+                if number is not None:
+                    index = self._ranges[field]
+                    pos = bisect.bisect_left(index, (number, item_id))
+                    if pos < len(index) and index[pos] == (number, item_id):
+                        del index[pos]
+
+    def lookup(self, **kwargs):
+        """Returns the set of ids of the items with all the fields equal to
+        the values or None if any of the fields is not indexed.
+
+        :param kwargs: The same keyword arguments as accepted by the
+                       controller list method i.e. roomID=5, p_value='0'
+        """
+        fields = [(field_name(name), value)
+                  for name, value in kwargs.items()]
+        if not all(field in self._hash for field, _ in fields):
+            return None
+
+        result = None
+        # start with the most selective index
+        for ids in sorted((self._hash[field].get(value, ())
+                           for field, value in fields), key=len):
+            result = set(ids) if result is None else result & ids
+            if not result:
+                break
+        return result if result is not None else set(self._entries)
+
+    def between(self, field, low=None, high=None):
+        """Returns the list of ids of the items with the numeric value of
+        the field in the <low, high> range ordered by the value.
+
+        :raises KeyError: if the field has no range index
+        """
+        index = self._ranges[field_name(field)]
+        start = 0 if low is None else bisect.bisect_left(
+            index, (float(low),))
+        end = len(index) if high is None else bisect.bisect_left(
+            index, (float(high), float('inf')))
+        return [item_id for _, item_id in index[start:end]]
@@ -20,16 +20,19 @@
 
 """
 
-import functools
 import jsonpatch
 import logging
-import six
+import re
+import threading
 
 _logger = logging.getLogger(__name__)
 
 
 _type_ignore = ["HC_user", "VOIP_user", "weather", 'iOS_device', '']
 
+_device_classes = {}
+_device_classes_lock = threading.Lock()
+
 
 def factory(controller, item):
     # try as item could be anything
@@ -42,7 +45,7 @@ def factory(controller, item):
     model = None
     if isinstance(item, dict):
         if controller.RESOURCE == 'devices':
-            model = DeviceModel(controller, item)
+            model = device_model_class(item)(controller, item)
         elif controller.RESOURCE == 'scenes':
             model = SceneModel(controller, item)
         else:
@@ -54,76 +57,319 @@ def factory(controller, item):
     return model
 
 
-class RecursiveList(list):
+def _wrap(value):
+    """Wraps the JSON value on the first access"""
+    if isinstance(value, str):
+        return unicode(value)
+
+    if isinstance(value, dict):
+        if not isinstance(value, RecursiveDict):
+            return RecursiveDict(value)
+
+    elif isinstance(value, list):
+        if not isinstance(value, RecursiveList):
+            return RecursiveList(value)
+
+    return value
+
+
+def _resolve(obj, path):
+    """Returns (True, value) if the path exists in obj or (False, None)"""
+    for key in path:
+        try:
+            if isinstance(obj, dict):
+                obj = dict.__getitem__(obj, key)
+            elif isinstance(obj, list):
+                obj = list.__getitem__(obj, key)
+            else:
+                return False, None
+        except (KeyError, IndexError, TypeError):
+            return False, None
+    return True, obj
+
+
+def _minimal_paths(paths):
+    """Returns the sorted paths not covered by the other paths"""
+    result = []
+    for path in sorted(paths, key=len):
+        if not any(path[:len(p)] == p for p in result):
+            result.append(path)
+    return sorted(result)
+
+
+def _pointer(path):
+    return u''.join(
+        u'/' + unicode(key).replace(u'~', u'~0').replace(u'/', u'~1')
+        for key in path)
+
+
+class _Tracking(object):
+    """Mixin recording the paths modified in the nested containers.
+
+    Every wrapped container knows its parent and the key it is stored
+    under, so a modification is recorded as a path in the container and
+    all its ancestors. This makes :meth:`changes` proportional to the
+    number of modifications rather than the size of the object.
+    """
+
+    def _adopt(self, key, value):
+        if isinstance(value, _Tracking):
+            value.__dict__['__parent__'] = (self, key)
+        return value
+
+    def _mark(self, path):
+        node = self
+        while True:
+            dirty = node.__dict__.get('__dirty__')
+            if dirty is None:
+                dirty = node.__dict__['__dirty__'] = set()
+            dirty.add(path)
+
+            parent = node.__dict__.get('__parent__')
+            if parent is None:
+                break
+            node, key = parent
+            path = (key,) + path
+
+    def _dirty_paths(self):
+        return _minimal_paths(self.__dict__.get('__dirty__', ()))
+
+    def is_modified(self):
+        """Returns True if the object was modified"""
+        return bool(self.__dict__.get('__dirty__'))
+
+    def changes(self):
+        """Returns JSON patch string of the modifications"""
+        original = self.__dict__['__original__']
+        operations = []
+        for path in self._dirty_paths():
+            found, value = _resolve(self, path)
+            found_before, value_before = _resolve(original, path)
+            if found:
+                if found_before and value == value_before:
+                    continue
+                operations.append({
+                    'op': 'replace' if found_before else 'add',
+                    'path': _pointer(path),
+                    'value': value})
+            elif found_before:
+                operations.append({'op': 'remove', 'path': _pointer(path)})
+
+        return jsonpatch.JsonPatch(operations).to_string()
+
+    def partial(self):
+        """Returns the dictionary with the modified fields only. The lists
+        are included as a whole. The removed fields and the fields set to
+        their original values are skipped.
+        """
+        original = self.__dict__['__original__']
+        paths = []
+        for path in self._dirty_paths():
+            for i, key in enumerate(path):
+                if isinstance(key, int):
+                    path = path[:i]
+                    break
+            paths.append(path)
+
+        payload = {}
+        for path in _minimal_paths(paths):
+            found, value = _resolve(self, path)
+            if not found:
+                continue
+            found_before, value_before = _resolve(original, path)
+            if found_before and value == value_before:
+                continue
+            if not path:
+                return dict(self)
+
+            node = payload
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = value
+        return payload
+
+    def clear_changes(self):
+        """Forget the recorded modifications"""
+        self.__dict__.pop('__dirty__', None)
+
+
+class RecursiveList(_Tracking, list):
+    """List wrapping the nested JSON values lazily.
+
+    The elements are kept as parsed from JSON and wrapped on the first
+    access only. The wrapped value replaces the original element, so the
+    nested value is wrapped once. Any modification marks the whole list
+    as changed.
+    """
 
     def __init__(self, value):
         if value is None:
             pass
         elif isinstance(value, list):
-            for index, data in enumerate(value):
-                self.append(data)
-                self.__setitem__(index, data)
+            list.__init__(self, value)
         else:
             raise TypeError, 'Expected list'
 
         self.__dict__['__original__'] = value
 
+    def _wrapped(self, index):
+        value = list.__getitem__(self, index)
+        wrapped = _wrap(value)
+        if wrapped is not value:
+            list.__setitem__(self, index, wrapped)
+            self._adopt(index % len(self), wrapped)
+        return wrapped
+
     def __getitem__(self, key):
-        return list.__getitem__(self, key)
+        if isinstance(key, slice):
+            return [self._wrapped(index)
+                    for index in xrange(*key.indices(len(self)))]
+        return self._wrapped(key)
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(i, j))
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self._wrapped(index)
 
     def __setitem__(self, key, value):
-        if isinstance(value, str):
-            value = unicode(value)
-        if isinstance(value, list) and not isinstance(value, RecursiveList):
-            value = RecursiveList(value)
+        list.__setitem__(self, key, _wrap(value))
+        self._mark(())
+
+    def __delitem__(self, key):
+        list.__delitem__(self, key)
+        self._mark(())
+
+    def __setslice__(self, i, j, values):
+        list.__setslice__(self, i, j, values)
+        self._mark(())
+
+    def __delslice__(self, i, j):
+        list.__delslice__(self, i, j)
+        self._mark(())
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def append(self, value):
+        list.append(self, value)
+        self._mark(())
 
-        if isinstance(value, dict) and not isinstance(value, RecursiveDict):
-            value = RecursiveDict(value)
+    def extend(self, values):
+        list.extend(self, values)
+        self._mark(())
 
-        list.__setitem__(self, key, value)
+    def insert(self, index, value):
+        list.insert(self, index, value)
+        self._mark(())
+
+    def remove(self, value):
+        list.remove(self, value)
+        self._mark(())
+
+    def reverse(self):
+        list.reverse(self)
+        self._mark(())
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._mark(())
+
+    def pop(self, index=-1):
+        value = self._wrapped(index)
+        list.pop(self, index)
+        self._mark(())
+        return value
 
     __setattr__ = __setitem__
     __getattr__ = __getitem__
 
 
-class RecursiveDict(dict):
+class RecursiveDict(_Tracking, dict):
+    """Dictionary wrapping the nested JSON values lazily.
+
+    The values are kept as parsed from JSON and wrapped on the first
+    access only. The nested containers are copied when wrapped, so the
+    ``__original__`` value passed to the constructor is never modified
+    and does not need to be copied. The modified keys are recorded.
+    """
+
     def __init__(self, value=None):
         if value is None:
             pass
         elif isinstance(value, dict):
-            for key in value:
-                self.__setitem__(key, value[key])
+            dict.update(self, value)
         else:
             raise TypeError, 'Expected dict'
         self.__dict__['__original__'] = value
 
-    def changes(self):
-        original = self.__dict__['__original__']
-        return jsonpatch.make_patch(original, dict(self)).to_string()
-
     def __setitem__(self, key, value):
-        if isinstance(value, str):
-            value = unicode(value)
-        if isinstance(value, dict) and not isinstance(value, RecursiveDict):
-            value = RecursiveDict(value)
-
-        if isinstance(value, list) and not isinstance(value, RecursiveList):
-            value = RecursiveList(value)
+        value = _wrap(value)
 
         if not callable(value):
-            dict.__setitem__(self, key, value)
+            dict.__setitem__(self, key, self._adopt(key, value))
+            self._mark((key,))
         else:
             # actions are callable so added only to the local dict
             self.__dict__[key] = value
 
     def __getitem__(self, key):
-        return dict.__getitem__(self, key)
+        value = dict.__getitem__(self, key)
+        wrapped = _wrap(value)
+        if wrapped is not value:
+            dict.__setitem__(self, key, self._adopt(key, wrapped))
+        return wrapped
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._mark((key,))
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        for key in self:
+            return key, self.pop(key)
+        raise KeyError('popitem(): dictionary is empty')
 
     def setdefault(self, key, default=None):
         if key not in self:
             self[key] = default
         return self[key]
 
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def iteritems(self):
+        for key in self:
+            yield key, self[key]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
     __setattr__ = __setitem__
     __getattr__ = __getitem__
 
@@ -135,32 +381,58 @@ class GenericModel(RecursiveDict):
 
 
 class DeviceModel(GenericModel):
-    def __init__(self, controller, item):
-        super(DeviceModel, self).__init__(controller, item)
-
-        if 'actions' in self:
-            def action(action_name, argn, *args, **kwargs):
-                _logger.info("{0}({1})->{2}{3}".format(
-                    self.name, self.id, action_name, args)
+    """Home Center specific subclass for the Device. The actions are
+    provided by the subclasses generated by :func:`device_model_class`
+    """
+    pass
+
+
+def _make_action(action_name, argn):
+    def action(self, *args):
+        _logger.info("{0}({1})->{2}{3}".format(
+            self.name, self.id, action_name, args)
+        )
+        if len(args) != argn:
+            # hack due to http://bugzilla.fibaro.com/view.php?id=1125
+            if action_name != 'setTargetLevel':
+                raise TypeError(
+                    "%s() takes exactly %d argument(s) (%d given)" % (
+                        action_name, argn, len(args))
                 )
-                if len(args) != argn:
-                    # hack due to http://bugzilla.fibaro.com/view.php?id=1125
-                    if action_name != 'setTargetLevel':
-                        raise TypeError(
-                            "%s() takes exactly %d argument(s) (%d given)" % (
-                                action_name, argn, len(args))
-                        )
-                return self.controller.action(self.id, action_name, *args)
-
-            for action_name, argn in six.iteritems(self['actions']):
-                _logger.debug("{0}({1})<-{2}({3})".format(
-                    self.name,
-                    self.id,
-                    action_name,
-                    argn))
-
-                self.__dict__[str(action_name)] = functools.partial(
-                    action, action_name, argn)
+        return self.controller.action(self.id, action_name, *args)
+
+    action.__name__ = action_name
+    return action
+
+
+def device_model_class(item):
+    """Returns the :class:`DeviceModel` subclass providing the methods
+    for the actions defined by the device ``item``. The classes are
+    generated once per device type and actions signature.
+    """
+    actions = item.get('actions')
+    if not isinstance(actions, dict) or not actions:
+        return DeviceModel
+
+    device_type = item.get('type') or ''
+    key = (device_type, tuple(sorted(actions.items())))
+    cls = _device_classes.get(key)
+    if cls is None:
+        with _device_classes_lock:
+            cls = _device_classes.get(key)
+            if cls is None:
+                attrs = {}
+                for action_name, argn in actions.items():
+                    action_name = str(action_name)
+                    _logger.debug("{0}<-{1}({2})".format(
+                        device_type, action_name, argn))
+                    attrs[action_name] = _make_action(action_name, argn)
+
+                name = "DeviceModel_{}".format(
+                    re.sub(r'\W', '_', device_type))
+                cls = type(str(name), (DeviceModel,), attrs)
+                _device_classes[key] = cls
+    return cls
 
 
 class SceneModel(GenericModel):
@@ -0,0 +1,193 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.replica
+ ~~~~~~~~~~~~~~~
+
+ Home Center In-Memory Resource Replica Implementation
+"""
+
+import logging
+import threading
+import time
+
+
+_logger = logging.getLogger(__name__)
+
+
+class Replica(object):
+    """In-memory replica of the resource list i.e. devices.
+
+    The replica is bootstrapped with the full list of items and then kept
+    up to date with the ``changes`` delivered by the ``refreshStates``
+    long-poll. The stored items are never modified in place. Every change
+    replaces the item with the patched copy, so the items returned by
+    :meth:`get` and :meth:`list` can be safely used without locking.
+
+    If the :class:`index.Index` is given it is kept up to date with the
+    items and used to answer the queries.
+
+    The changes are stored in the item ``properties`` except the ``fields``
+    which are replaced at the top level of the item i.e. ``roomID`` of the
+    device moved to the other room.
+    """
+
+    def __init__(self, key='id', index=None, fields=()):
+        self.key = key
+        self.index = index
+        self.fields = fields
+        self.last = None
+        self.synced = None
+        self.stale = False  # loaded from the snapshot, not refetched yet
+        self._items = {}
+        self._updated = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def load(self, items, last=None):
+        """Replace the replica content with ``items``
+
+        :param items: A list of items (dicts) as returned by Home Center
+        :param last: The refreshStates cursor the items are valid for
+        """
+        now = time.time()
+        with self._lock:
+            self._items = dict((item[self.key], item) for item in items)
+            self._updated = dict.fromkeys(self._items, now)
+            if self.index is not None:
+                self.index.clear()
+                for item in items:
+                    self.index.add(item)
+            self.synced = now
+            self.stale = False
+            if last is not None:
+                self.last = last
+        _logger.info("Replica loaded with {} item(s)".format(len(items)))
+
+    def get(self, item_id):
+        """Returns the item identified by ``item_id`` or None"""
+        return self._items.get(item_id)
+
+    def list(self):
+        """Returns the list of all items ordered by the key"""
+        items = self._items
+        return [items[key] for key in sorted(items)]
+
+    def put(self, item):
+        """Add or replace the single item"""
+        with self._lock:
+            self._items[item[self.key]] = item
+            self._updated[item[self.key]] = time.time()
+            if self.index is not None:
+                self.index.add(item)
+
+    def remove(self, item_id):
+        """Remove the item identified by ``item_id`` if exists"""
+        with self._lock:
+            self._items.pop(item_id, None)
+            self._updated.pop(item_id, None)
+            if self.index is not None:
+                self.index.discard(item_id)
+
+    def apply_state(self, state):
+        """Patch the items with the changes from refreshStates response
+
+        :param state: A refreshStates response dictionary
+        :returns: A set of ids of the changed items not found in replica
+        """
+        unknown = set()
+        now = time.time()
+        with self._lock:
+            for change in state.get('changes', []):
+                item_id = change.get(self.key)
+                item = self._items.get(item_id)
+                if item is None:
+                    unknown.add(item_id)
+                    continue
+
+                item = dict(item)
+                properties = dict(item.get('properties', {}))
+                for name, value in change.items():
+                    if name == self.key:
+                        continue
+                    if name in self.fields:
+                        item[name] = value
+                    else:
+                        properties[name] = value
+                item['properties'] = properties
+                self._items[item_id] = item
+                self._updated[item_id] = now
+                if self.index is not None:
+                    self.index.add(item)
+
+            self.synced = now
+            self.last = state.get('last', self.last)
+
+        if unknown:
+            _logger.debug("Changes for unknown item(s): {}".format(unknown))
+        return unknown
+
+    def query(self, **kwargs):
+        """Returns the list of items with the fields equal to the values
+        ordered by the key or None if the query can not be answered by
+        the index.
+
+        :param kwargs: The same keyword arguments as accepted by the
+                       controller list method i.e. roomID=5, p_value='0'
+        """
+        if self.index is None:
+            return None
+        with self._lock:
+            ids = self.index.lookup(**kwargs)
+            if ids is None:
+                return None
+            items = self._items
+            return [items[item_id] for item_id in sorted(ids)]
+
+    def between(self, field, low=None, high=None):
+        """Returns the list of items with the numeric value of the field
+        in the <low, high> range ordered by the value.
+
+        :param field: The field with the range index i.e. 'p_value'
+        """
+        if self.index is None:
+            raise KeyError(field)
+        with self._lock:
+            items = self._items
+            return [items[item_id]
+                    for item_id in self.index.between(field, low, high)]
+
+    def age(self, item_id):
+        """Returns number of seconds since the item was last changed"""
+        updated = self._updated.get(item_id)
+        if updated is None:
+            return None
+        return time.time() - updated
+
+    def staleness(self, item_id):
+        """Returns number of seconds since the item was last known to be
+        in sync with Home Center. This is the time since the last change of
+        the item or since the last refreshStates response applied,
+        whichever is more recent.
+        """
+        updated = self._updated.get(item_id)
+        if updated is None:
+            return None
+        return time.time() - max(updated, self.synced)
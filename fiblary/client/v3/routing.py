@@ -0,0 +1,131 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.routing
+ ~~~~~~~~~~~~~~~
+
+ Property Change Routing Implementation
+"""
+
+import logging
+import threading
+
+
+_logger = logging.getLogger(__name__)
+
+FIELDS = ('id', 'roomID', 'type')
+"""The device fields the subscriptions can be filtered by"""
+
+
+def route_key(property_name, filters):
+    """Returns the route key of the subscription i.e.
+    ('value', ('roomID', 'type'), (5, 'com.fibaro.binarySwitch'))
+    """
+    fields = tuple(sorted(filters))
+    for field in fields:
+        if field not in FIELDS:
+            raise ValueError("Unsupported filter field: {}".format(field))
+    return property_name, fields, tuple(filters[field] for field in fields)
+
+
+def route_name(key):
+    """Returns the readable name of the route i.e. 'value[id=3]'"""
+    property_name, fields, values = key
+    return "{}[{}]".format(property_name, ','.join(
+        "{}={}".format(field, value) for field, value in zip(fields, values)))
+
+
+class Router(object):
+    """Dispatch index of the filtered subscriptions.
+
+    The subscriptions are stored in a dictionary keyed by the property
+    name, the filter fields and their values. A property change is
+    matched with a single dictionary lookup per distinct combination of
+    the filter fields used for the property, so the cost of the routing
+    does not depend on the number of the subscriptions.
+    """
+
+    def __init__(self, lookup, new_hook):
+        """
+        :param lookup: The function returning the device dictionary
+                       for the device id or None. Called only when the
+                       subscriptions filter by other fields than id.
+        :param new_hook: The function returning the new
+                         :class:`event.EventHook` for the route name
+        """
+        self.lookup = lookup
+        self.new_hook = new_hook
+        self._hooks = {}
+        # the number of routes per property and filter fields
+        self._fields = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hooks)
+
+    def hook(self, key, create=False):
+        """Returns the event hook of the route or None"""
+        hook = self._hooks.get(key)
+        if hook is None and create:
+            with self._lock:
+                hook = self._hooks.get(key)
+                if hook is None:
+                    hook = self._hooks[key] = self.new_hook(route_name(key))
+                    property_name, fields, _ = key
+                    counts = self._fields.setdefault(property_name, {})
+                    counts[fields] = counts.get(fields, 0) + 1
+        return hook
+
+    def discard(self, key):
+        """Remove the route if it has no handlers"""
+        with self._lock:
+            hook = self._hooks.get(key)
+            if hook is None or hook.get_handler_count():
+                return
+            del self._hooks[key]
+            property_name, fields, _ = key
+            counts = self._fields[property_name]
+            counts[fields] -= 1
+            if not counts[fields]:
+                del counts[fields]
+            if not counts:
+                del self._fields[property_name]
+
+    def match(self, property_name, device_id):
+        """Returns the event hooks of the routes matching the change"""
+        combinations = self._fields.get(property_name)
+        if not combinations:
+            return []
+
+        hooks = []
+        device = None
+        for fields in list(combinations):
+            if device is None and fields != ('id',):
+                device = self.lookup(device_id) or {}
+            values = tuple(
+                device_id if field == 'id' else device.get(field)
+                for field in fields)
+            hook = self._hooks.get((property_name, fields, values))
+            if hook is not None:
+                hooks.append(hook)
+        return hooks
+
+    def depths(self):
+        """Returns the dictionary of events waiting for the handlers
+        per route name
+        """
+        return dict(
+            (route_name(key), hook.get_queue_depth())
+            for key, hook in list(self._hooks.items()))
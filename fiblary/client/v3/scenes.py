@@ -23,6 +23,7 @@ import logging
 
 from fiblary.client.v3 import base
 from fiblary.common import exceptions
+from fiblary.common import throttle
 
 
 _logger = logging.getLogger(__name__)
@@ -31,18 +32,37 @@ _logger = logging.getLogger(__name__)
 class Controller(base.CommonController):
     RESOURCE = 'scenes'
 
-    def _scene_control(self, scene_id, action):
+    def _send_control(self, scene_id, action):
         cmd = "sceneControl"
         params = {
             "id": scene_id,
             "action": action
         }
-        resp = self.http_client.get(cmd, params=params)
+        resp = self.http_client.get(
+            cmd, params=params, priority=throttle.INTERACTIVE)
         if resp.status_code != 202:
             exceptions.from_response(resp)
 
+    @base.traced('fiblary.scene_control', ('id', 'action'))
+    def _scene_control(self, scene_id, action):
+        self._send_control(scene_id, action)
         return self.get(scene_id)
 
+    def bulk_control(self, scene_ids, action, **kwargs):
+        """Sends the control action to many scenes concurrently.
+        The scenes are not retrieved again.
+
+        :param scene_ids: An iterable of the scene ids
+        :param action: 'start', 'stop', 'enable' or 'disable'
+        :param max_workers: The maximum number of concurrent calls
+        :param stop_on_error: Skip the remaining scenes on first failure
+        :returns: A list of :class:`base.BulkResult`
+        """
+        def call(scene_id):
+            return self._send_control(scene_id, action)
+
+        return self._bulk(call, scene_ids, **kwargs)
+
     def start(self, scene_id):
         scene = self._scene_control(scene_id, "start")
         _logger.info("Scene {}({}) started".format(scene.name, scene.id))
@@ -63,11 +83,11 @@ class Controller(base.CommonController):
         _logger.info("Scene {}({}) disabled".format(scene.name, scene.id))
         return scene
 
-    def update(self, data):
+    def update(self, data, partial=False):
         # scene is Null due to
         # http://bugzilla.fibaro.com/view.php?id=1176
         # must be retrieved again
-        scene = super(Controller, self).update(data)
+        scene = super(Controller, self).update(data, partial)
         try:
             scene_id = data['id']
             if scene_id:
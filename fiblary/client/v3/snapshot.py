@@ -0,0 +1,188 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.snapshot
+ ~~~~~~~~~~~~~~~~
+
+ Home Center Resource Snapshot File Implementation
+
+ The file starts with the fixed size header followed by the JSON table
+ of contents and the JSON encoded resources::
+
+    magic (8 bytes) | version (uint16) | toc length (uint32) | toc | blobs
+
+ The table of contents holds the metadata and the (offset, length) of
+ every resource blob, so the file can be memory mapped and a single
+ resource decoded without reading the others.
+"""
+
+import contextlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from fiblary.common import codec
+from fiblary.common import exceptions
+
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b'FIBLSNAP'
+VERSION = 1
+
+_HEADER = struct.Struct('>8sHI')
+
+RESOURCES = ('devices', 'rooms', 'sections', 'scenes', 'globalVariables')
+"""The resources stored in the snapshot by default"""
+
+
+def save(path, resources, last, endpoint=None):
+    """Write the snapshot file atomically
+
+    :param path: The snapshot file path
+    :param resources: A dictionary of the item lists keyed by resource name
+    :param last: The refreshStates cursor the resources are valid for
+    :param endpoint: The Home Center API url
+    :returns: The number of bytes written
+    """
+    blobs = []
+    toc = {
+        'created': time.time(),
+        'endpoint': endpoint,
+        'last': last,
+        'resources': {},
+    }
+    offset = 0
+    for name, items in sorted(resources.items()):
+        blob = codec.dumps(items)
+        if not isinstance(blob, bytes):
+            blob = blob.encode('utf-8')
+        toc['resources'][name] = [offset, len(blob)]
+        blobs.append(blob)
+        offset += len(blob)
+
+    toc = codec.dumps(toc)
+    if not isinstance(toc, bytes):
+        toc = toc.encode('utf-8')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.snapshot', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(toc)))
+            f.write(toc)
+            for blob in blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+    size = _HEADER.size + len(toc) + offset
+    _logger.info("Snapshot saved to {} ({} bytes)".format(path, size))
+    return size
+
+
+class Snapshot(object):
+    """Memory mapped snapshot file
+
+    Usage::
+
+        with snapshot.Snapshot('hc2.snap') as snap:
+            devices = snap.get('devices')
+    """
+
+    def __init__(self, path):
+        """
+        :raises exceptions.SnapshotError: If the file is missing or invalid
+        """
+        self.path = path
+        try:
+            with contextlib.closing(open(path, 'rb')) as f:
+                self._map = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, ValueError) as e:
+            # ValueError is raised for the empty file
+            raise exceptions.SnapshotError(
+                "Can not open snapshot file {}: {}".format(path, e))
+
+        try:
+            magic, version, toc_length = _HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise exceptions.SnapshotError(
+                    "Not a snapshot file: {}".format(path))
+            if version != VERSION:
+                raise exceptions.SnapshotError(
+                    "Unsupported snapshot version {}: {}".format(
+                        version, path))
+
+            self._base = _HEADER.size + toc_length
+            toc = codec.loads(self._map[_HEADER.size:self._base])
+        except (struct.error, ValueError) as e:
+            self.close()
+            raise exceptions.SnapshotError(
+                "Corrupted snapshot file {}: {}".format(path, e))
+        except exceptions.SnapshotError:
+            self.close()
+            raise
+
+        try:
+            self.created = float(toc['created'])
+            self.endpoint = toc['endpoint']
+            self.last = toc['last']
+            self._resources = dict(
+                (name, (int(offset), int(length)))
+                for name, (offset, length) in toc['resources'].items())
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            self.close()
+            raise exceptions.SnapshotError(
+                "Corrupted table of contents in {}: {!r}".format(path, e))
+
+    @property
+    def resources(self):
+        """The names of the stored resources"""
+        return sorted(self._resources)
+
+    def age(self):
+        """Returns the number of seconds since the snapshot was saved"""
+        return time.time() - self.created
+
+    def get(self, name):
+        """Returns the decoded items of the resource or None"""
+        entry = self._resources.get(name)
+        if entry is None:
+            return None
+        offset, length = entry
+        start = self._base + offset
+        try:
+            return codec.loads(self._map[start:start + length])
+        except ValueError as e:
+            raise exceptions.SnapshotError(
+                "Corrupted resource '{}' in {}: {}".format(
+                    name, self.path, e))
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
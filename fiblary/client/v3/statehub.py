@@ -0,0 +1,477 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.statehub
+ ~~~~~~~~~~~~~~~~
+
+ Home Center State Hub Implementation
+
+ The refreshStates long-polls of many Home Centers are multiplexed over
+ the non-blocking sockets served by the single thread, instead of the
+ thread per :class:`client.StateHandler`. The states are delivered to
+ the single queue in the order they arrive, tagged with the client.
+"""
+
+import base64
+import collections
+import errno
+import logging
+import select
+import socket
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from fiblary.common import codec
+
+
+_logger = logging.getLogger(__name__)
+
+TIMEOUT = 60
+"""The refreshStates long-poll timeout in seconds"""
+
+RETRY_INTERVAL = 1
+MAX_RETRY_INTERVAL = 30
+SELECT_INTERVAL = 1
+RECV_SIZE = 64 * 1024
+
+HubState = collections.namedtuple('HubState', ['client', 'state'])
+"""The refreshStates response of the client"""
+
+_CONNECTING, _SENDING, _RECEIVING, _WAITING = range(4)
+
+
+class _Response(object):
+    """Incremental HTTP/1.1 response parser"""
+
+    def __init__(self):
+        self.data = b''
+        self.version = None
+        self.status = None
+        self.headers = None
+        self.body_start = None
+
+    def feed(self, data):
+        """Returns True when the response is complete"""
+        self.data += data
+        if self.headers is None:
+            end = self.data.find(b'\r\n\r\n')
+            if end == -1:
+                return False
+            lines = self.data[:end].decode('iso-8859-1').split('\r\n')
+            status_line = lines[0].split(' ', 2)
+            self.version = status_line[0].upper()
+            self.status = int(status_line[1])
+            self.headers = dict(
+                (name.strip().lower(), value.strip())
+                for name, value in (
+                    line.split(':', 1) for line in lines[1:] if ':' in line))
+            self.body_start = end + 4
+        return self.body() is not None
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    def body(self, eof=False):
+        """Returns the body or None if not complete yet"""
+        body = self.data[self.body_start:]
+        if 'content-length' in self.headers:
+            length = int(self.headers['content-length'])
+            return body[:length] if len(body) >= length else None
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            return _dechunk(body)
+        return body if eof else None
+
+
+def _dechunk(data):
+    """Returns the decoded chunked body or None if not complete yet"""
+    chunks = []
+    pos = 0
+    while True:
+        end = data.find(b'\r\n', pos)
+        if end == -1:
+            return None
+        size = int(data[pos:end].split(b';', 1)[0], 16)
+        start = end + 2
+        if size == 0:
+            # the last chunk is followed by optional trailers and CRLF
+            trailers = data[start:]
+            if trailers.startswith(b'\r\n') or b'\r\n\r\n' in trailers:
+                return b''.join(chunks)
+            return None
+        if len(data) < start + size + 2:
+            return None
+        chunks.append(data[start:start + size])
+        pos = start + size + 2
+
+
+class _Poll(object):
+    """refreshStates long-poll state of the single client"""
+
+    def __init__(self, client, last, timeout):
+        self.client = client
+        self.last = last or "0"
+        self.timeout = timeout
+
+        url = urlparse(client.client.base_url)
+        if url.scheme != 'http':
+            raise ValueError(
+                "StateHub supports http endpoints only: {}".format(
+                    client.client.base_url))
+        self.address = (url.hostname, url.port or 80)
+        self.path = url.path or '/'
+        self.host = url.netloc
+
+        self.headers = ''
+        auth = client.client.auth_header
+        if auth:
+            self.headers = 'Authorization: Basic {}\r\n'.format(
+                base64.b64encode('{}:{}'.format(*auth).encode('utf-8'))
+                .decode('ascii'))
+
+        self.sock = None
+        self.phase = _WAITING
+        self.deadline = 0  # the time of the next attempt or the timeout
+        self.retry = RETRY_INTERVAL
+        self.out = b''
+        self.response = None
+        self.reused = False  # the keep-alive connection
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def request(self):
+        return (
+            'GET {}refreshStates?last={} HTTP/1.1\r\n'
+            'Host: {}\r\n'
+            'Accept: application/json\r\n'
+            'Connection: keep-alive\r\n'
+            '{}\r\n'.format(self.path, self.last, self.host, self.headers)
+        ).encode('iso-8859-1')
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+
+class StateHub(threading.Thread):
+    """Single thread long-polling refreshStates of many clients.
+
+    Usage::
+
+        hub = StateHub()
+        for endpoint in endpoints:
+            hub.add(Client('v3', endpoint, 'admin', 'admin'))
+
+        for client, state in hub:
+            ...
+
+    The hub does not call the client event handlers nor updates the
+    replica. The consumer of the stream does it if needed.
+    """
+
+    def __init__(self, timeout=TIMEOUT, maxsize=0, name=None):
+        """
+        :param timeout: The refreshStates long-poll timeout in seconds
+        :param maxsize: The maximum number of states waiting in the
+                        queue. The polling of all clients pauses when the
+                        queue is full. default 0 (unbounded)
+        """
+        super(StateHub, self).__init__(name=name or self.__class__.__name__)
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize)
+        self.daemon = True  # stop unconditionally on exit
+
+        self._polls = {}
+        self._removed = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup_r, self._wakeup_w = _socketpair()
+
+        self.start()
+
+    def add(self, client, last=None):
+        """Start polling the client
+
+        :param client: :class:`client.Client` object
+        :param last: The refreshStates cursor to start from. default the
+                     cursor of the client devices replica or "0"
+        """
+        if last is None and client.devices.replica is not None:
+            last = client.devices.replica.last
+        poll = _Poll(client, last, self.timeout)
+        with self._lock:
+            previous = self._polls.get(client)
+            if previous is not None:
+                self._removed.append(previous)
+            self._polls[client] = poll
+        self._wakeup()
+        _logger.info("StateHub polling {}".format(client.client.base_url))
+
+    def remove(self, client):
+        """Stop polling the client"""
+        with self._lock:
+            poll = self._polls.pop(client, None)
+            if poll is not None:
+                # closed by the hub thread
+                self._removed.append(poll)
+        self._wakeup()
+
+    def cursor(self, client):
+        """Returns the refreshStates cursor of the client"""
+        with self._lock:
+            poll = self._polls.get(client)
+        return poll.last if poll else None
+
+    def get(self, block=True, timeout=None):
+        """Returns the next :class:`HubState`
+
+        :raises Queue.Empty: If there is no state within the timeout
+        """
+        return self.queue.get(block, timeout)
+
+    def __iter__(self):
+        while not self.stopped() or not self.queue.empty():
+            try:
+                yield self.queue.get(True, SELECT_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def changes(self):
+        """Yields (client, change) for every device change in the stream"""
+        for client, state in self:
+            for change in state.get('changes', []):
+                yield client, change
+
+    def stopped(self):
+        return self._stop.isSet()
+
+    def stop(self):
+        _logger.info("Stopping the state hub")
+        self._stop.set()
+        self._wakeup()
+
+    def _wakeup(self):
+        if self._wakeup_w is not None:
+            try:
+                self._wakeup_w.send(b'x')
+            except socket.error:
+                pass
+
+    def run(self):
+        """The select loop of the hub"""
+        _logger.info("Starting the state hub")
+        while not self.stopped():
+            with self._lock:
+                polls = list(self._polls.values())
+                removed, self._removed = self._removed, []
+            for poll in removed:
+                poll.close()
+
+            now = time.time()
+            rlist = [self._wakeup_r] if self._wakeup_r is not None else []
+            wlist = []
+            timeout = SELECT_INTERVAL
+            for poll in polls:
+                if poll.phase == _WAITING:
+                    if poll.deadline <= now:
+                        self._connect(poll, now)
+                    else:
+                        timeout = min(timeout, poll.deadline - now)
+                        continue
+                elif poll.deadline <= now:
+                    self._fail(poll, now, "timeout")
+                    continue
+
+                if poll.sock is None:
+                    continue
+                if poll.phase in (_CONNECTING, _SENDING):
+                    wlist.append(poll)
+                elif poll.phase == _RECEIVING:
+                    rlist.append(poll)
+
+            try:
+                readable, writable, _ = select.select(
+                    rlist, wlist, [], max(0, timeout))
+            except (select.error, socket.error, ValueError) as e:
+                # one of the sockets closed in the meantime
+                _logger.debug("StateHub select: {}".format(e))
+                continue
+
+            now = time.time()
+            for poll in writable:
+                self._write(poll, now)
+            for poll in readable:
+                if poll is self._wakeup_r:
+                    self._drain_wakeup()
+                else:
+                    self._read(poll, now)
+
+        with self._lock:
+            for poll in self._polls.values():
+                poll.close()
+        _logger.info("State hub stopped.")
+
+    def _drain_wakeup(self):
+        try:
+            self._wakeup_r.recv(4096)
+        except socket.error:
+            pass
+
+    def _connect(self, poll, now):
+        poll.close()
+        poll.reused = False
+        poll.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        poll.sock.setblocking(0)
+        poll.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            error = poll.sock.connect_ex(poll.address)
+        except socket.error as e:
+            self._fail(poll, now, e)
+            return
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK,
+                         getattr(errno, 'WSAEWOULDBLOCK', -1)):
+            self._fail(poll, now, socket.error(error, errno.errorcode.get(
+                error, error)))
+            return
+        poll.phase = _CONNECTING
+        poll.deadline = now + poll.timeout + 10
+
+    def _send_request(self, poll, now):
+        poll.out = poll.request()
+        poll.response = _Response()
+        poll.phase = _SENDING
+        poll.deadline = now + poll.timeout + 10
+
+    def _write(self, poll, now):
+        if poll.sock is None:
+            return
+        if poll.phase == _CONNECTING:
+            error = poll.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self._fail(poll, now, socket.error(
+                    error, errno.errorcode.get(error, error)))
+                return
+            self._send_request(poll, now)
+
+        try:
+            sent = poll.sock.send(poll.out)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self._fail(poll, now, e)
+            return
+        poll.out = poll.out[sent:]
+        if not poll.out:
+            poll.phase = _RECEIVING
+
+    def _read(self, poll, now):
+        if poll.sock is None:
+            return
+        try:
+            data = poll.sock.recv(RECV_SIZE)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self._fail(poll, now, e)
+            return
+
+        response = poll.response
+        if not data and not response.data and poll.reused:
+            # the idle keep-alive connection closed by Home Center
+            poll.close()
+            poll.phase = _WAITING
+            poll.deadline = now
+            return
+
+        if not data:
+            # connection closed by Home Center
+            body = response.body(eof=True) if response.headers else None
+            if body is None:
+                self._fail(poll, now, "connection closed")
+                return
+            self._complete(poll, now, response.status, body, False)
+            return
+
+        try:
+            done = response.feed(data)
+        except (ValueError, IndexError) as e:
+            self._fail(poll, now, "malformed response: {}".format(e))
+            return
+        if done:
+            self._complete(
+                poll, now, response.status, response.body(),
+                response.keep_alive)
+
+    def _complete(self, poll, now, status, body, keep_alive):
+        if status != 200:
+            self._fail(poll, now, "HTTP {}".format(status))
+            return
+
+        try:
+            state = codec.loads(body)
+            last = state['last']
+        except (ValueError, KeyError, TypeError) as e:
+            self._fail(poll, now, "invalid state: {}".format(e))
+            return
+
+        poll.last = last
+        poll.retry = RETRY_INTERVAL
+        # blocks the hub if the consumer does not keep up
+        self.queue.put(HubState(poll.client, state))
+
+        if keep_alive:
+            poll.reused = True
+            self._send_request(poll, now)
+        else:
+            poll.close()
+            poll.phase = _WAITING
+            poll.deadline = now
+
+    def _fail(self, poll, now, error):
+        _logger.warning("StateHub {} error: {}. Retry in {} second(s)".format(
+            poll.client.client.base_url,
+            error, poll.retry))
+        poll.close()
+        poll.phase = _WAITING
+        poll.deadline = now + poll.retry
+        poll.retry = min(poll.retry * 2, MAX_RETRY_INTERVAL)
+
+
+def _socketpair():
+    """Returns the pair of connected sockets used to wake up the select
+    or (None, None) if not supported
+    """
+    try:
+        return socket.socketpair()
+    except (AttributeError, socket.error):
+        return None, None
@@ -32,12 +32,15 @@ _logger = logging.getLogger(__name__)
 
 class Controller(base.CommonController):
     RESOURCE = 'globalVariables'
+    ITEM_KEY = 'name'
 
+    @base.traced('fiblary.get')
     def get(self, item_id):
         url = '{0}?name={1}'.format(self.RESOURCE, item_id)
-        item = self.http_client.get(url).json()
+        item = self._decode(self.http_client.get(url))
         return self.model(**item)
 
+    @base.traced('fiblary.delete')
     def delete(self, item_id):
         url = '{0}?name={1}'.format(self.RESOURCE, item_id)
         self.http_client.delete(url)
@@ -0,0 +1,204 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.cache
+ ~~~~~~~~~~~~~~~~~~~~
+
+ Response Cache Implementation
+"""
+
+import collections
+import logging
+import threading
+import time
+
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TTLS = {
+    'settings/info': 300,
+    'loginStatus': 60,
+    'weather': 300,
+    'sections': 60,
+    'rooms': 60,
+    'users': 60,
+    'scenes': 30,
+}
+"""Time to live in seconds of the read-mostly resources"""
+
+INVALIDATES = {
+    'sceneControl': ('scenes',),
+    'callAction': ('devices',),
+}
+"""GET requests changing the state of other resources"""
+
+MAX_ENTRIES = 256
+MAX_BYTES = 8 * 1024 * 1024
+
+
+def resource_of(url):
+    """Returns the resource name of the request url i.e.
+    'globalVariables?name=x' -> 'globalVariables'
+    """
+    return url.split('?', 1)[0].strip('/')
+
+
+class ResponseCache(object):
+    """LRU cache of the responses with per resource time to live.
+
+    The entries are bound by number and by the total size of the response
+    bodies. The resources without TTL defined are not cached.
+
+    The response fetched before the resource was invalidated is not
+    cached, so the GET racing with PUT or POST does not bring the old
+    response back. The fill passes the :meth:`generation` taken before
+    the request to :meth:`put`.
+    """
+
+    def __init__(self, ttls=None, default_ttl=0,
+                 max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        """
+        :param dict ttls: The time to live in seconds per resource.
+                          default DEFAULT_TTLS (optional)
+        :param default_ttl: The time to live of other resources
+        :param max_entries: The maximum number of cached responses
+        :param max_bytes: The maximum total size of cached responses
+        """
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        # the generation is bumped by every invalidation, the resources
+        # keep the generation they were invalidated last at
+        self._generation = 0
+        self._invalidated = {}
+        self._cleared = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def ttl(self, resource):
+        return self.ttls.get(resource, self.default_ttl)
+
+    def get(self, key):
+        """Returns the cached response for the key or None"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            response, size, expires = entry
+            if expires < time.time():
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries[key] = entry  # most recently used
+            self.hits += 1
+            return response
+
+    def generation(self):
+        """Returns the current generation to be passed to :meth:`put`"""
+        return self._generation
+
+    def put(self, key, response, generation=None):
+        """Cache the response if the resource has TTL defined
+
+        :param key: A tuple (url, params)
+        :param response: :class:`requests.Response` object
+        :param generation: The :meth:`generation` taken before the request.
+                           The response is dropped if the resource was
+                           invalidated since. (optional)
+        """
+        resource = resource_of(key[0])
+        ttl = self.ttl(resource)
+        if ttl <= 0:
+            return
+
+        size = len(response.content or '')
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation is not None:
+                invalidated = max(
+                    self._invalidated.get(resource, 0), self._cleared)
+                if generation < invalidated:
+                    self.stale += 1
+                    return
+
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[1]
+
+            self._entries[key] = (response, size, time.time() + ttl)
+            self._bytes += size
+
+            while self._entries and not self._fits():
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def invalidate(self, resource):
+        """Drop all cached responses of the resource and the resources
+        changed by it
+        """
+        resources = (resource,) + INVALIDATES.get(resource, ())
+        with self._lock:
+            self._generation += 1
+            for name in resources:
+                self._invalidated[name] = self._generation
+            for key in list(self._entries):
+                if resource_of(key[0]) in resources:
+                    _, size, _ = self._entries.pop(key)
+                    self._bytes -= size
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._cleared = self._generation
+            self._entries.clear()
+            self._bytes = 0
+
+    def _fits(self):
+        if len(self._entries) > self.max_entries:
+            return False
+        return self._bytes <= self.max_bytes
+
+    def stats(self):
+        """Returns the dictionary with the cache metrics"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale': self.stale,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
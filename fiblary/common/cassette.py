@@ -0,0 +1,316 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.cassette
+ ~~~~~~~~~~~~~~~~~~~~~~~
+
+ Record/Replay HTTP Session Implementation
+
+ The cassette is a gzip compressed file with one JSON document per line.
+ The first line is the header, every next line is a single request with
+ its response::
+
+    {"method": "GET", "path": "/api/devices", "query": "id=3",
+     "body": null, "t": 0.012, "elapsed": 0.011, "status": 200,
+     "reason": "OK", "content_type": "application/json", "content": "..."}
+
+ The authentication headers are never stored and the secret fields of
+ the query and of the JSON request and response bodies are scrubbed,
+ i.e. ``properties.password`` of the IP cameras in GET devices.
+"""
+
+import base64
+import collections
+import gzip
+import logging
+import threading
+import time
+
+import requests
+from requests import structures
+
+from fiblary.common import codec
+
+try:
+    from urllib.parse import parse_qsl
+    from urllib.parse import urlencode
+    from urllib.parse import urlsplit
+except ImportError:
+    from urllib import urlencode
+    from urlparse import parse_qsl
+    from urlparse import urlsplit
+
+
+_logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+FAST = 'fast'
+REALTIME = 'realtime'
+
+SECRETS = ('password', 'pin', 'token', 'apikey', 'auth', 'authorization')
+"""The query parameters and the JSON fields scrubbed from the cassette"""
+
+SCRUBBED = '***'
+
+
+def _scrub(value):
+    """Returns the copy of the decoded JSON value with the secrets
+    scrubbed
+    """
+    if isinstance(value, dict):
+        return dict(
+            (key, SCRUBBED if key.lower() in SECRETS else _scrub(item))
+            for key, item in value.items())
+    if isinstance(value, list):
+        return [_scrub(item) for item in value]
+    return value
+
+
+def _scrub_body(body):
+    if not body:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    try:
+        return codec.dumps(_scrub(codec.loads(body)))
+    except (TypeError, ValueError):
+        # not a JSON body, stored only if there is nothing to hide
+        lowered = body.lower()
+        if any(secret in lowered for secret in SECRETS):
+            return SCRUBBED
+        return body
+
+
+def _scrub_content(content):
+    """Returns the response content with the secrets scrubbed. The content
+    is encoded again only if it is JSON holding any secret.
+    """
+    try:
+        data = codec.loads(content)
+    except (TypeError, ValueError):
+        return content
+    scrubbed = _scrub(data)
+    if scrubbed == data:
+        return content
+    return codec.dumps(scrubbed)
+
+
+def request_key(method, url, params=None):
+    """Returns the (method, path, query) of the request with the query
+    parameters sorted and the secrets scrubbed
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if isinstance(params, dict):
+        query.extend(params.items())
+    elif params:
+        query.extend(params)
+    query = sorted(
+        (str(name), SCRUBBED if str(name).lower() in SECRETS else str(value))
+        for name, value in query)
+    return method.upper(), parts.path, urlencode(query)
+
+
+def _encode_content(content):
+    try:
+        return content.decode('utf-8'), None
+    except UnicodeDecodeError:
+        return base64.b64encode(content).decode('ascii'), 'base64'
+
+
+def _decode_content(entry):
+    content = entry.get('content') or ''
+    if entry.get('content_encoding') == 'base64':
+        return base64.b64decode(content)
+    return content.encode('utf-8')
+
+
+class Recorder(requests.Session):
+    """HTTP session recording the traffic to the cassette file.
+
+    Usage::
+
+        with cassette.Recorder('hc2.cassette.gz') as session:
+            client = Client('v3', url, 'admin', 'admin', session=session)
+            ...
+
+    The session can be closed and reused as :class:`requests.Session`
+    (the state handler does it when stopped), the cassette is closed by
+    :meth:`finish`.
+    """
+
+    def __init__(self, path):
+        super(Recorder, self).__init__()
+        self.path = path
+        self.count = 0
+        self._file = gzip.open(path, 'wb')
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._write({'cassette': VERSION, 'created': self._start})
+
+    def _write(self, entry):
+        line = codec.dumps(entry)
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        self._file.write(line + b'\n')
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        start = time.time()
+        response = super(Recorder, self).request(
+            method, url, params=params, data=data, **kwargs)
+
+        method, path, query = request_key(method, url, params)
+        content, content_encoding = _encode_content(response.content or b'')
+        if content_encoding is None:
+            content = _scrub_content(content)
+        entry = {
+            'method': method,
+            'path': path,
+            'query': query,
+            'body': _scrub_body(data),
+            't': time.time() - self._start,
+            'elapsed': time.time() - start,
+            'status': response.status_code,
+            'reason': response.reason,
+            'content_type': response.headers.get('Content-Type'),
+            'content': content,
+        }
+        if content_encoding:
+            entry['content_encoding'] = content_encoding
+
+        with self._lock:
+            if self._file is not None:
+                self._write(entry)
+                self.count += 1
+        return response
+
+    def finish(self):
+        """Close the cassette file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                _logger.info("Recorded {} request(s) to {}".format(
+                    self.count, self.path))
+
+    def __exit__(self, *args):
+        self.finish()
+        self.close()
+
+
+def load(path):
+    """Returns the list of the recorded entries of the cassette"""
+    with gzip.open(path, 'rb') as f:
+        lines = iter(f)
+        header = codec.loads(next(lines))
+        if header.get('cassette') != VERSION:
+            raise ValueError(
+                "Unsupported cassette version: {}".format(
+                    header.get('cassette')))
+        return [codec.loads(line) for line in lines if line.strip()]
+
+
+class Player(requests.Session):
+    """HTTP session replaying the responses from the cassette file.
+
+    The requests are matched by the method, the path and the query. If no
+    such request is left the first unused response of the same method and
+    path is returned, so the refreshStates long-poll is replayed even if
+    started from a different cursor.
+
+    Usage::
+
+        session = cassette.Player('hc2.cassette.gz', pacing='realtime')
+        client = Client('v3', url, 'admin', 'admin', session=session)
+    """
+
+    def __init__(self, path, pacing=FAST, speed=1.0):
+        """
+        :param path: The cassette file path
+        :param pacing: FAST returns the responses immediately, REALTIME
+                       keeps the recorded time between the responses
+        :param speed: The replay speed factor of the REALTIME pacing
+        """
+        super(Player, self).__init__()
+        if pacing not in (FAST, REALTIME):
+            raise ValueError("Unknown pacing: {}".format(pacing))
+        self.path = path
+        self.pacing = pacing
+        self.speed = float(speed)
+
+        self.entries = load(path)
+        self.played = 0
+        self.misses = 0
+        self._used = [False] * len(self.entries)
+        self._exact = collections.defaultdict(collections.deque)
+        self._paths = collections.defaultdict(collections.deque)
+        for n, entry in enumerate(self.entries):
+            method, path = entry['method'], entry['path']
+            self._exact[(method, path, entry['query'])].append(n)
+            self._paths[(method, path)].append(n)
+
+        self._lock = threading.Lock()
+        self._origin = None
+
+    @property
+    def remaining(self):
+        """The number of the responses not replayed yet"""
+        return len(self.entries) - self.played
+
+    def _next(self, queue):
+        while queue and self._used[queue[0]]:
+            queue.popleft()
+        return queue.popleft() if queue else None
+
+    def _match(self, method, path, query):
+        with self._lock:
+            n = self._next(self._exact.get((method, path, query), ()))
+            if n is None:
+                n = self._next(self._paths.get((method, path), ()))
+            if n is None:
+                self.misses += 1
+                return None
+            self._used[n] = True
+            self.played += 1
+            if self._origin is None:
+                self._origin = time.time() - (
+                    self.entries[n]['t'] / self.speed)
+            return self.entries[n]
+
+    def request(self, method, url, params=None, **kwargs):
+        method, path, query = request_key(method, url, params)
+        entry = self._match(method, path, query)
+        if entry is None:
+            raise requests.exceptions.ConnectionError(
+                "No recorded response for {} {}?{}".format(
+                    method, path, query))
+
+        if self.pacing == REALTIME:
+            delay = self._origin + entry['t'] / self.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry.get('reason')
+        response.url = url
+        response.encoding = 'utf-8'
+        response.headers = structures.CaseInsensitiveDict()
+        if entry.get('content_type'):
+            response.headers['Content-Type'] = entry['content_type']
+        response._content = _decode_content(entry)
+        response._content_consumed = True
+        return response
@@ -0,0 +1,98 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.codec
+ ~~~~~~~~~~~~~~~~~~~~
+
+ JSON Codec Implementation
+
+ The fastest installed JSON library is selected on import in the
+ BACKENDS order. The standard library :mod:`json` is always available.
+ All the decoding errors are :class:`ValueError`.
+"""
+
+import importlib
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+BACKENDS = ('ujson', 'simplejson', 'json')
+
+
+class Codec(object):
+    """JSON encoder and decoder backed by the given module"""
+
+    def __init__(self, name):
+        self.name = name
+        module = importlib.import_module(name)
+        self.loads = module.loads
+        if name == 'ujson':
+            self.dumps = _ujson_dumps(module)
+        else:
+            self.dumps = module.dumps
+
+    def decode(self, response):
+        """Returns the decoded body of :class:`requests.Response`"""
+        encoding = (response.encoding or 'utf-8').lower()
+        if encoding in ('utf-8', 'utf8'):
+            return self.loads(response.content)
+        return self.loads(response.text)
+
+    def __repr__(self):
+        return "Codec({!r})".format(self.name)
+
+
+def _ujson_dumps(module):
+    def dumps(obj):
+        return module.dumps(obj, escape_forward_slashes=False)
+    return dumps
+
+
+def select(backends=BACKENDS):
+    """Returns the codec of the first importable backend"""
+    for name in backends:
+        try:
+            return Codec(name)
+        except ImportError:
+            continue
+    raise ImportError("None of JSON backends available: {}".format(
+        ", ".join(backends)))
+
+
+default = select()
+_logger.debug("JSON backend: {}".format(default.name))
+
+
+def use(backend):
+    """Sets the codec used by the client
+
+    :param backend: The backend name i.e. 'simplejson' or :class:`Codec`
+    """
+    global default
+    default = backend if isinstance(backend, Codec) else Codec(backend)
+
+
+def dumps(obj):
+    return default.dumps(obj)
+
+
+def loads(data):
+    return default.loads(data)
+
+
+def decode(response):
+    """Returns the decoded body of :class:`requests.Response`"""
+    return default.decode(response)
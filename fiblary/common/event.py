@@ -18,10 +18,15 @@
 
  Event Implementation
 """
+import collections
+import heapq
+import itertools
 import logging
 import threading
+import time
 
 from fiblary.common import exceptions
+from fiblary.common import tracing
 
 try:
     import Queue as queue
@@ -58,7 +63,7 @@ class EventQueue(threading.Thread):
     def put(self, event, function=None, a=(), kw=None):
         """Queue the call to function, return the number of the call.
         """
-        self.queue.put((event, function, a, kw or {}))
+        self.queue.put((event, function, a, kw or {}, time.time()))
         return self.n + self.queue.qsize()
 
     def stop(self):
@@ -72,7 +77,7 @@ class EventQueue(threading.Thread):
         """
         while not self.stopped():
             try:
-                event, function, a, kw = self.queue.get(True, 120)
+                event, function, a, kw, queued = self.queue.get(True, 120)
             except queue.Empty:
                 _logger.warning("Event queue timeout: {}".format(self.name))
                 continue
@@ -83,7 +88,9 @@ class EventQueue(threading.Thread):
             _logger.debug("Calling on {} changed handlers".format(event))
             self.serving = (function, a, kw)
             try:
-                function(*a, **kw)
+                with tracing.span('fiblary.event', event=event,
+                                  queue_wait=time.time() - queued):
+                    function(*a, **kw)
             except Exception as e:
                 self.error(e, function, a, kw)
             self.n += 1
@@ -92,6 +99,299 @@ class EventQueue(threading.Thread):
         return self._stop.isSet()
 
 
+class Dispatcher(object):
+    """Shared pool of workers calling the event handlers.
+
+    Each event hook gets its own queue of pending calls, but the worker
+    threads are shared between all the hooks. A queue is served by at most
+    one worker at a time, so the calls queued for a single hook are
+    executed in order, while different hooks are served concurrently.
+
+    The worker threads are started with the first queued call.
+    """
+
+    def __init__(self, workers=4, name=None):
+        self.name = name or self.__class__.__name__
+        self.workers = workers
+        self.n = 0
+        self._ready = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _start(self):
+        _logger.info("Starting the dispatcher {} with {} worker(s)".format(
+            self.name, self.workers))
+
+        for i in range(self.workers):
+            worker = threading.Thread(
+                name="{}-{}".format(self.name, i),
+                target=self._run)
+            worker.daemon = True  # stop unconditionally on exit
+            worker.start()
+            self._workers.append(worker)
+
+    def error(self, error, function, a=(), kw=None):
+        """Called when function raises error.
+        """
+        _logger.exception(
+            "Dispatcher event raised exception ({}, {}, {}):{}".format(
+                function, a, kw or {}, error)
+        )
+
+    def put(self, key, function, a=(), kw=None):
+        """Queue the call to function in the queue identified by key,
+        return the number of the calls pending in this queue.
+        """
+        with self._lock:
+            if not self._workers:
+                self._start()
+            pending = self._pending.get(key)
+            if pending is None:
+                # the queue is idle so schedule it for the worker
+                pending = self._pending[key] = collections.deque()
+                self._ready.put(key)
+            pending.append((function, a, kw or {}, time.time()))
+            return len(pending)
+
+    def queue_depth(self, key):
+        """Returns the number of calls pending for the key"""
+        pending = self._pending.get(key)
+        return len(pending) if pending else 0
+
+    def queue_depths(self):
+        """Returns the dictionary of pending calls per queue name"""
+        depths = {}
+        with self._lock:
+            for key, pending in self._pending.items():
+                name = repr(key)
+                depths[name] = depths.get(name, 0) + len(pending)
+        return depths
+
+    def stop(self):
+        _logger.info("Stopping the dispatcher {}".format(self.name))
+        for worker in self._workers:
+            self._ready.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _run(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                break
+
+            with self._lock:
+                function, a, kw, queued = self._pending[key][0]
+
+            try:
+                with tracing.span('fiblary.event', event=repr(key),
+                                  queue_wait=time.time() - queued):
+                    function(*a, **kw)
+            except Exception as e:
+                self.error(e, function, a, kw)
+
+            with self._lock:
+                self.n += 1
+                pending = self._pending[key]
+                pending.popleft()
+                if pending:
+                    # give other queues a chance before the next call
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+
+
+class DispatcherQueue(object):
+    """Event queue of a single hook served by the shared
+    :class:`Dispatcher`. Provides the same interface as :class:`EventQueue`.
+    """
+
+    def __init__(self, dispatcher, key):
+        self.dispatcher = dispatcher
+        self.key = key
+
+    def put(self, event, function=None, a=(), kw=None):
+        return self.dispatcher.put(self.key, function, a, kw)
+
+    def qsize(self):
+        return self.dispatcher.queue_depth(self.key)
+
+    def stop(self):
+        # workers are shared so there is nothing to stop
+        pass
+
+    def join(self, timeout=None):
+        pass
+
+
+class Scheduler(threading.Thread):
+    """Single timer thread calling the functions at the given time.
+    The functions are expected to return quickly i.e. to queue the work
+    for the :class:`Dispatcher`.
+    """
+
+    def __init__(self, name=None):
+        super(Scheduler, self).__init__(name=name or self.__class__.__name__)
+        self._timers = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self.daemon = True  # stop unconditionally on exit
+        self.start()
+
+    def call_at(self, when, function, *args):
+        """Schedule function(*args) at the time ``when``. Returns the
+        timer which can be cancelled.
+        """
+        timer = [when, next(self._sequence), function, args]
+        with self._cond:
+            heapq.heappush(self._timers, timer)
+            self._cond.notify()
+        return timer
+
+    def cancel(self, timer):
+        """Cancel the timer returned by :meth:`call_at`"""
+        with self._cond:
+            timer[2] = None
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+
+    def run(self):
+        while not self._stop.isSet():
+            with self._cond:
+                while self._timers and self._timers[0][2] is None:
+                    heapq.heappop(self._timers)
+                if not self._timers:
+                    self._cond.wait()
+                    continue
+                delay = self._timers[0][0] - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _, _, function, args = heapq.heappop(self._timers)
+
+            try:
+                function(*args)
+            except Exception as e:
+                _logger.exception(
+                    "Scheduled call raised exception ({}, {}):{}".format(
+                        function, args, e))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the scheduler shared by all the clients"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = Scheduler()
+        return _scheduler
+
+
+def _device_key(kwargs):
+    return kwargs.get('id')
+
+
+class Coalescer(object):
+    """Event handler wrapper coalescing the bursts of events.
+
+    The events are grouped by key (the device id by default) and only the
+    last event of the group is delivered to the handler (last value
+    wins). The event is delivered ``window`` seconds after the first
+    event of the burst and not more often than ``max_rate`` times per
+    second per key.
+    """
+
+    def __init__(self, handler, window=0, max_rate=None, key=_device_key,
+                 scheduler=None, deliver=None):
+        """
+        :param handler: The event handler
+        :param window: The number of seconds the events are collected
+        :param max_rate: The maximum number of events per second per key
+        :param key: The function returning the group key of the event
+        :param scheduler: :class:`Scheduler` object.
+                          default the shared scheduler
+        :param deliver: The function deliver(handler, kwargs) calling the
+                        handler. default the handler is called directly
+        """
+        self.handler = handler
+        self.window = window or 0
+        self.interval = 1.0 / max_rate if max_rate else 0
+        self.key = key
+        self.scheduler = scheduler or get_scheduler()
+        self.deliver = deliver or _call
+
+        self.received = 0
+        self.delivered = 0
+
+        self._pending = {}
+        self._timers = {}
+        self._last_delivery = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        key = self.key(kwargs)
+        now = time.time()
+        with self._lock:
+            self.received += 1
+            self._pending[key] = kwargs
+            if key in self._timers:
+                return
+
+            due = max(now + self.window,
+                      self._last_delivery.get(key, 0) + self.interval)
+            if due > now:
+                self._timers[key] = self.scheduler.call_at(
+                    due, self._flush, key)
+                return
+
+        self._flush(key)
+
+    def _flush(self, key):
+        with self._lock:
+            self._timers.pop(key, None)
+            kwargs = self._pending.pop(key, None)
+            if kwargs is None:
+                return
+            self._last_delivery[key] = time.time()
+            self.delivered += 1
+        self.deliver(self.handler, kwargs)
+
+    def cancel(self):
+        """Drop the pending events"""
+        with self._lock:
+            for timer in self._timers.values():
+                self.scheduler.cancel(timer)
+            self._timers.clear()
+            self._pending.clear()
+
+    def __eq__(self, other):
+        if isinstance(other, Coalescer):
+            return self is other
+        return self.handler == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.handler)
+
+    def __repr__(self):
+        return "Coalescer({!r})".format(self.handler)
+
+
+def _call(handler, kwargs):
+    handler(**kwargs)
+
+
 def queue_event(f):
     """Decorator which queues method/function calls in
     self.eventqueue and self.name [if f is a method whose
@@ -120,17 +420,29 @@ class EventHook(object):
     Extended with queue event
     """
 
-    def __init__(self, name=""):
+    def __init__(self, name="", dispatcher=None):
         self.__handlers = []
         self.name = name
+        self.dispatcher = dispatcher
         self.event_queue = None
 
     def get_handler_count(self):
         return len(self.__handlers)
 
+    def get_queue_depth(self):
+        """Returns the number of events waiting for the handlers"""
+        if not self.event_queue:
+            return 0
+        if isinstance(self.event_queue, EventQueue):
+            return self.event_queue.queue.qsize()
+        return self.event_queue.qsize()
+
     def __iadd__(self, handler):
         if not self.event_queue:
-            self.event_queue = EventQueue(self.name)
+            if self.dispatcher:
+                self.event_queue = DispatcherQueue(self.dispatcher, self)
+            else:
+                self.event_queue = EventQueue(self.name)
         self.__handlers.append(handler)
         return self
 
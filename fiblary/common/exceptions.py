@@ -52,6 +52,11 @@ class HandlerNotFound(BaseException):
     pass
 
 
+class SnapshotError(BaseException):
+    """Invalid snapshot file"""
+    pass
+
+
 class WrongArgumentsNumber(Exception):
     def __init__(self, action, expected_num_arg, num_arg):
             self.action = action
@@ -0,0 +1,423 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.jsonpath
+ ~~~~~~~~~~~~~~~~~~~~~~~
+
+ JSON Path Compiler Implementation
+
+ The expression is parsed once into a chain of python closures, so
+ evaluating it does not involve any regular expression or ``eval``.
+ The compiled expressions are kept in the LRU cache keyed by the
+ expression string. The expressions the compiler does not understand
+ are passed to :mod:`fiblary.external.jsonpath`.
+"""
+
+import ast
+import logging
+import operator
+import re
+
+import fiblary.external.jsonpath as external
+from fiblary.common.utils import LRUCache
+
+
+_logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 256
+
+_cache = LRUCache(CACHE_SIZE)
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+    |(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<path>@(?:\.\w+)*)
+    |(?P<name>[A-Za-z_]\w*)
+    |(?P<op>==|!=|<=|>=|<|>|&&|\|\||\(|\)|!)
+    )""", re.X)
+
+_NAME = re.compile(r'\*|\w+')
+_BRACKET = re.compile(r"\[(?:'(\w+)'|\"(\w+)\"|(\d+|\*))\]")
+
+_COMPARE = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda a, b: a in b,
+    'not in': lambda a, b: a not in b,
+}
+
+_CONSTANTS = {
+    'True': True,
+    'False': False,
+    'None': None,
+}
+
+
+class Unsupported(Exception):
+    """Expression not supported by the compiler"""
+    pass
+
+
+# Filter expression
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m or m.end() == pos:
+            raise Unsupported(text[pos:])
+        kind = m.lastgroup
+        tokens.append((kind, m.group(kind)))
+        pos = m.end()
+    return tokens
+
+
+def _path_getter(path):
+    keys = []
+    for name in path.split('.')[1:]:
+        keys.append(int(name) if name.isdigit() else name)
+
+    length = False
+    if keys and keys[-1] == 'length':
+        # a nod to JavaScript
+        keys.pop()
+        length = True
+
+    def getter(obj):
+        for key in keys:
+            obj = obj[key]
+        return len(obj) if length else obj
+
+    return getter
+
+
+class _FilterParser(object):
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, value):
+        if self.take()[1] != value:
+            raise Unsupported("Expected '{}'".format(value))
+
+    def parse(self):
+        expr = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise Unsupported("Unexpected '{}'".format(self.peek()[1]))
+        return expr
+
+    def parse_or(self):
+        left = self.parse_and()
+        while self.peek()[1] in ('or', '||'):
+            self.take()
+            right = self.parse_and()
+            left = (lambda l, r: lambda obj: l(obj) or r(obj))(left, right)
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self.peek()[1] in ('and', '&&'):
+            self.take()
+            right = self.parse_not()
+            left = (lambda l, r: lambda obj: l(obj) and r(obj))(left, right)
+        return left
+
+    def parse_not(self):
+        if self.peek()[1] == 'not':
+            self.take()
+            operand = self.parse_not()
+            return lambda obj: not operand(obj)
+        return self.parse_compare()
+
+    def parse_compare(self):
+        operands = [self.parse_operand()]
+        operators = []
+        while True:
+            value = self.peek()[1]
+            if value in _COMPARE:
+                self.take()
+            elif value == 'not' and self.pos + 1 < len(self.tokens) and \
+                    self.tokens[self.pos + 1][1] == 'in':
+                self.pos += 2
+                value = 'not in'
+            else:
+                break
+            operators.append(_COMPARE[value])
+            operands.append(self.parse_operand())
+
+        if not operators:
+            return operands[0]
+
+        if len(operators) == 1:
+            op, left, right = operators[0], operands[0], operands[1]
+            return lambda obj: op(left(obj), right(obj))
+
+        def chained(obj):
+            # python chained comparison semantics
+            left = operands[0](obj)
+            for op, operand in zip(operators, operands[1:]):
+                right = operand(obj)
+                if not op(left, right):
+                    return False
+                left = right
+            return True
+
+        return chained
+
+    def parse_operand(self):
+        kind, value = self.take()
+        if kind == 'number' or kind == 'string':
+            constant = ast.literal_eval(value)
+            return lambda obj: constant
+
+        if kind == 'path':
+            return _path_getter(value)
+
+        if kind == 'name' and value in _CONSTANTS:
+            constant = _CONSTANTS[value]
+            return lambda obj: constant
+
+        if value == '(':
+            expr = self.parse_or()
+            self.expect(')')
+            return expr
+
+        if value == '!':
+            # !@.name means 'name' not in @
+            kind, value = self.take()
+            if kind == 'path' and value.count('.') == 1:
+                name = value[2:]
+                return lambda obj: name not in obj
+
+        raise Unsupported("Unexpected '{}'".format(value))
+
+
+def compile_filter(text):
+    """Compile the filter expression (without ``?(`` and ``)``) to the
+    predicate returning True for the matching objects.
+    """
+    expr = _FilterParser(text).parse()
+
+    def predicate(obj):
+        try:
+            return expr(obj)
+        except Exception:
+            # the same as the eval based implementation
+            return False
+
+    return predicate
+
+
+# Path expression
+
+def _children(obj):
+    if isinstance(obj, list):
+        return obj
+    if isinstance(obj, dict):
+        return list(obj.values())
+    return []
+
+
+def _descendants(obj):
+    yield obj
+    for child in _children(obj):
+        for descendant in _descendants(child):
+            yield descendant
+
+
+def _member_step(name):
+    index = int(name) if name.isdigit() else None
+
+    def step(values):
+        for obj in values:
+            if isinstance(obj, dict):
+                if name in obj:
+                    yield obj[name]
+            elif isinstance(obj, list) and index is not None:
+                if index < len(obj):
+                    yield obj[index]
+    return step
+
+
+def _wildcard_step(values):
+    for obj in values:
+        for child in _children(obj):
+            yield child
+
+
+def _descendant_step(values):
+    for obj in values:
+        for descendant in _descendants(obj):
+            yield descendant
+
+
+def _filter_step(predicate):
+    def step(values):
+        for obj in values:
+            for child in _children(obj):
+                if predicate(child):
+                    yield child
+    return step
+
+
+def _split_path(expr):
+    """Split the path expression into the list of segments"""
+    if not expr.startswith('$'):
+        raise Unsupported(expr)
+
+    segments = []
+    pos = 1
+    while pos < len(expr):
+        if expr.startswith('..', pos):
+            segments.append(('..', None))
+            pos += 2
+            if expr.startswith('[', pos):
+                continue
+            m = _NAME.match(expr, pos)
+            if not m:
+                raise Unsupported(expr)
+        elif expr[pos] == '.':
+            m = _NAME.match(expr, pos + 1)
+            if not m:
+                raise Unsupported(expr)
+        elif expr.startswith('[?(', pos):
+            end = expr.find(')]', pos)
+            # the filter may contain ')]' sequence inside the string
+            while end != -1:
+                try:
+                    predicate = compile_filter(expr[pos + 3:end])
+                except Unsupported:
+                    end = expr.find(')]', end + 1)
+                    continue
+                segments.append(('?', predicate))
+                break
+            else:
+                raise Unsupported(expr)
+            pos = end + 2
+            continue
+        elif expr[pos] == '[':
+            m = _BRACKET.match(expr, pos)
+            if not m:
+                raise Unsupported(expr)
+            name = m.group(1) or m.group(2) or m.group(3)
+            segments.append(('*', None) if name == '*' else ('.', name))
+            pos = m.end()
+            continue
+        else:
+            raise Unsupported(expr)
+
+        name = m.group(0)
+        segments.append(('*', None) if name == '*' else ('.', name))
+        pos = m.end()
+
+    return segments
+
+
+class CompiledPath(object):
+    """Compiled JSON Path expression
+
+    Calling the object with the JSON document returns the list of the
+    matching values. If the expression is a single filter (i.e.
+    ``$[?(@.id==1)]``) the predicate applied to the list elements is
+    available as ``predicate`` attribute.
+    """
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.predicate = None
+        self._steps = []
+
+        segments = _split_path(expr)
+        for kind, arg in segments:
+            if kind == '.':
+                self._steps.append(_member_step(arg))
+            elif kind == '*':
+                self._steps.append(_wildcard_step)
+            elif kind == '..':
+                self._steps.append(_descendant_step)
+            elif kind == '?':
+                self._steps.append(_filter_step(arg))
+
+        if len(segments) == 1 and segments[0][0] == '?':
+            self.predicate = segments[0][1]
+
+    def __call__(self, obj):
+        values = [obj]
+        for step in self._steps:
+            values = step(values)
+        return list(values)
+
+    def __repr__(self):
+        return "CompiledPath({!r})".format(self.expr)
+
+
+class FallbackPath(object):
+    """Expression evaluated by :mod:`fiblary.external.jsonpath`"""
+
+    predicate = None
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def __call__(self, obj):
+        return external.jsonpath(obj, self.expr) or []
+
+    def __repr__(self):
+        return "FallbackPath({!r})".format(self.expr)
+
+
+def compile(expr):
+    """Returns the compiled JSON Path expression. The compiled expressions
+    are cached.
+
+    :param expr: JSON Path expression string i.e. ``$[?(@.id==1)]``
+    :returns: :class:`CompiledPath` or :class:`FallbackPath` object
+    """
+    path = _cache.get(expr)
+    if path is None:
+        try:
+            path = CompiledPath(expr)
+        except Unsupported as e:
+            _logger.debug(
+                "JSON Path '{}' not supported by compiler: {}".format(
+                    expr, e))
+            path = FallbackPath(expr)
+        _cache.put(expr, path)
+    return path
+
+
+def jsonpath(obj, expr):
+    """Drop-in replacement of :func:`fiblary.external.jsonpath.jsonpath`
+    returning the matching values or False if nothing matches.
+    """
+    if not expr or not obj:
+        return False
+    return compile(expr)(obj) or False
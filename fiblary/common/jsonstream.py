@@ -0,0 +1,137 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.jsonstream
+ ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+ Incremental JSON Array Parser Implementation
+
+ The elements of the top level JSON array are decoded one at a time as
+ the chunks of the document arrive, so only the current element and the
+ unparsed part of the current chunk are kept in memory.
+"""
+
+import codecs
+import json
+import re
+
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _Buffer(object):
+    def __init__(self, chunks, encoding):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.text = u''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """Reads the next chunk. Returns False at the end of the document"""
+        if self.eof:
+            return False
+
+        # drop the consumed text
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.text += self.decoder.decode(chunk)
+                return True
+
+        self.text += self.decoder.decode(b'', final=True)
+        self.eof = True
+        return True
+
+    def skip(self):
+        """Skips the whitespaces and returns the next character or None"""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return None
+
+    def rest(self):
+        while self.more():
+            pass
+        return self.text[self.pos:]
+
+
+def iter_array(chunks, encoding='utf-8', decoder=None):
+    """Yields the elements of the JSON array read from the byte chunks
+
+    The document which is not an array is yielded as a single element.
+
+    :param chunks: An iterable of byte strings i.e.
+                   ``response.iter_content(CHUNK_SIZE)``
+    :param encoding: The document encoding
+    :param decoder: A :class:`json.JSONDecoder` object (optional)
+    :raises ValueError: If the document is malformed
+    """
+    decoder = decoder or json.JSONDecoder()
+    buf = _Buffer(chunks, encoding)
+
+    first = buf.skip()
+    if first is None:
+        raise ValueError("No JSON object could be decoded")
+
+    if first != '[':
+        yield decoder.decode(buf.rest())
+        return
+
+    buf.pos += 1
+    expect_value = None  # the first element or the end of the array
+    while True:
+        char = buf.skip()
+        if char is None:
+            raise ValueError("Unterminated JSON array")
+
+        if char == ']' and expect_value is not True:
+            buf.pos += 1
+            break
+
+        if expect_value is False:
+            if char != ',':
+                raise ValueError(
+                    "Expecting ',' delimiter: char {}".format(buf.pos))
+            buf.pos += 1
+            expect_value = True
+            continue
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf.text, buf.pos)
+            except ValueError:
+                if buf.more():
+                    continue
+                raise
+            # the number may continue in the next chunk so the delimiter
+            # following the value must be already read
+            after = _WHITESPACE.match(buf.text, end).end()
+            delimited = after < len(buf.text) and buf.text[after] in ',]'
+            if not delimited and buf.more():
+                continue
+            break
+
+        buf.pos = end
+        expect_value = False
+        yield value
+
+    if buf.skip() is not None:
+        raise ValueError("Extra data: char {}".format(buf.pos))
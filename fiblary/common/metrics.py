@@ -0,0 +1,225 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.metrics
+ ~~~~~~~~~~~~~~~~~~~~~~
+
+ Request Timing Metrics Implementation
+
+ The latency of every request is split into the phases:
+
+ * wait - the admission by the throttle
+ * server - sending the request until the response headers are parsed
+   (includes the connection setup if the connection was not reused)
+ * download - reading the response body
+ * decode - JSON decoding of the body
+ * model - building the model object of a single item
+"""
+
+import bisect
+import collections
+import threading
+
+
+PHASES = ('wait', 'server', 'download', 'decode', 'model')
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""The upper bounds in seconds of the latency histogram buckets"""
+
+
+class Histogram(object):
+    """Latency histogram with fixed buckets.
+
+    Not thread safe, :class:`Metrics` updates it under its lock.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last counter is the +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket containing the quantile or
+        the maximum observed value for the +Inf bucket
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        """Returns the list of (upper bound, cumulative count) tuples"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+
+class Metrics(object):
+    """Request metrics per resource and verb.
+
+    Usage::
+
+        client = Client('v3', url, 'admin', 'admin', metrics=True)
+        ...
+        client.metrics.snapshot()['latency']['devices']['GET']['server']
+        print(client.metrics.to_prometheus())
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._status = collections.Counter()
+        self._errors = collections.Counter()
+        self._bytes = collections.Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, resource, verb, phase, seconds):
+        """Record the duration of the request phase"""
+        key = (resource, verb, phase)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def count_status(self, resource, verb, status):
+        with self._lock:
+            self._status[(resource, verb, status)] += 1
+
+    def count_error(self, resource, verb, error):
+        """Count the request failed with the error i.e. 'ConnectionError'"""
+        with self._lock:
+            self._errors[(resource, verb, error)] += 1
+
+    def count_bytes(self, resource, verb, size):
+        """Count the response body bytes"""
+        with self._lock:
+            self._bytes[(resource, verb)] += size
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._status.clear()
+            self._errors.clear()
+            self._bytes.clear()
+
+    def snapshot(self):
+        """Returns the dictionary of the metrics::
+
+            {'latency': {resource: {verb: {phase: {count, sum, mean, max,
+                                                   p50, p95, p99}}}},
+             'status': {resource: {verb: {status: count}}},
+             'errors': {resource: {verb: {error: count}}},
+             'bytes': {resource: {verb: bytes}}}
+        """
+        result = {'latency': {}, 'status': {}, 'errors': {}, 'bytes': {}}
+        with self._lock:
+            for (resource, verb, phase), histogram in \
+                    self._histograms.items():
+                result['latency'].setdefault(resource, {}).setdefault(
+                    verb, {})[phase] = histogram.snapshot()
+            for name, counter in (('status', self._status),
+                                  ('errors', self._errors)):
+                for (resource, verb, key), count in counter.items():
+                    result[name].setdefault(resource, {}).setdefault(
+                        verb, {})[key] = count
+            for (resource, verb), size in self._bytes.items():
+                result['bytes'].setdefault(resource, {})[verb] = size
+        return result
+
+    def to_prometheus(self, prefix='fiblary'):
+        """Returns the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            name = prefix + '_request_seconds'
+            lines.append('# HELP {} Request phase latency'.format(name))
+            lines.append('# TYPE {} histogram'.format(name))
+            for key, histogram in sorted(self._histograms.items()):
+                labels = _labels(
+                    ('resource', 'verb', 'phase'), key)
+                for bound, count in histogram.cumulative():
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        name, labels, _number(bound), count))
+                lines.append('{}_sum{{{}}} {}'.format(
+                    name, labels, repr(histogram.sum)))
+                lines.append('{}_count{{{}}} {}'.format(
+                    name, labels, histogram.count))
+
+            for suffix, help_text, label, counter in (
+                    ('_responses_total', 'Responses by status code',
+                     'status', self._status),
+                    ('_errors_total', 'Failed requests by error',
+                     'error', self._errors)):
+                name = prefix + suffix
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} counter'.format(name))
+                for key, count in sorted(counter.items()):
+                    lines.append('{}{{{}}} {}'.format(
+                        name, _labels(('resource', 'verb', label), key),
+                        count))
+
+            name = prefix + '_response_bytes_total'
+            lines.append('# HELP {} Response body bytes'.format(name))
+            lines.append('# TYPE {} counter'.format(name))
+            for key, size in sorted(self._bytes.items()):
+                lines.append('{}{{{}}} {}'.format(
+                    name, _labels(('resource', 'verb'), key), size))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ','.join('{}="{}"'.format(name, _escape(value))
+                    for name, value in zip(names, values))
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value)
@@ -15,11 +15,18 @@
 
 """REST API bits"""
 
-import json
+from concurrent import futures
+import contextlib
 import logging
+import random
 import requests
+import time
 
+from fiblary.common import cache
+from fiblary.common import codec
 from fiblary.common import exceptions
+from fiblary.common import singleflight
+from fiblary.common import throttle
 
 try:
     from urllib.parse import urlencode
@@ -28,6 +35,9 @@ except ImportError:
 
 
 USER_AGENT = 'RAPI'
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+CONCURRENT_WORKERS = 32
+TRACE_BODY_LIMIT = 1024
 
 _logger = logging.getLogger(__name__)
 
@@ -59,6 +69,12 @@ class RESTApi(object):
         logger=None,
         debug=None,
         base_url=None,
+        coalesce=False,
+        cache=None,
+        throttle=None,
+        trace_body_limit=TRACE_BODY_LIMIT,
+        trace_sample_rate=1.0,
+        metrics=None,
     ):
         """Construct a new REST client
 
@@ -74,6 +90,25 @@ class RESTApi(object):
         :param boolean debug: Enables debug logging of all request and
                               responses to identity service.
                               default False (optional)
+        :param boolean coalesce: Concurrent identical idempotent requests
+                                 share a single HTTP call.
+                                 default False (optional)
+        :param cache: A response cache i.e. :class:`cache.ResponseCache`
+                      The GET responses are served from the cache and
+                      invalidated by other requests to the same resource.
+                      default None (optional)
+        :param throttle: A :class:`throttle.Throttle` object controlling
+                         the admission of the requests. The requests
+                         accept ``priority`` argument.
+                         default None (optional)
+        :param trace_body_limit: The maximum number of body bytes logged
+                                 with the request and response trace.
+                                 None logs the whole body.
+        :param trace_sample_rate: The fraction of requests traced when
+                                  ``debug`` is enabled. default 1.0
+        :param metrics: A :class:`metrics.Metrics` object recording the
+                        request timing, the status codes and the response
+                        size. default None (optional)
         """
 
         if username and password:
@@ -82,6 +117,8 @@ class RESTApi(object):
             self.set_auth(None)
 
         self.debug = debug
+        self.trace_body_limit = trace_body_limit
+        self.trace_sample_rate = trace_sample_rate
         self.base_url = base_url or ""
 
         if not session:
@@ -97,6 +134,11 @@ class RESTApi(object):
         else:
             self.logger = _logger
 
+        self.single_flight = singleflight.SingleFlight() if coalesce else None
+        self.cache = cache
+        self.throttle = throttle
+        self.metrics = metrics
+
     def set_auth(self, auth_header):
         """Sets the current auth blob"""
         self.auth_header = auth_header
@@ -121,6 +163,40 @@ class RESTApi(object):
                      Overwrites ``data`` argument if present
         """
 
+        if self.cache is None:
+            return self._shared_request(method, url, **kwargs)
+
+        resource = cache.resource_of(url)
+        if method not in IDEMPOTENT_METHODS or resource in cache.INVALIDATES:
+            try:
+                return self._shared_request(method, url, **kwargs)
+            finally:
+                self.cache.invalidate(resource)
+
+        if method != 'GET' or kwargs.get('stream'):
+            return self._shared_request(method, url, **kwargs)
+
+        key = (url, _freeze(kwargs.get('params')))
+        response = self.cache.get(key)
+        if response is None:
+            generation = self.cache.generation()
+            response = self._shared_request(method, url, **kwargs)
+            self.cache.put(key, response, generation)
+        return response
+
+    def _shared_request(self, method, url, **kwargs):
+        shared = method in IDEMPOTENT_METHODS and not kwargs.get('stream')
+        if shared and self.single_flight is not None:
+            key = (method, url, _freeze(kwargs.get('params')))
+            return self.single_flight.do(
+                key, self._request, method, url, **kwargs)
+
+        return self._request(method, url, **kwargs)
+
+    def _request(self, method, url, **kwargs):
+
+        priority = kwargs.pop('priority', throttle.NORMAL)
+
         kwargs.setdefault('headers', {})
         if self.auth_header:
             kwargs['auth'] = self.auth_header
@@ -128,7 +204,7 @@ class RESTApi(object):
         if 'json' in kwargs:
             json_obj = kwargs.get('json', None)
             if json_obj and isinstance(json_obj, (dict)):
-                kwargs['data'] = json.dumps(json_obj)
+                kwargs['data'] = codec.dumps(json_obj)
                 kwargs['headers']['Content-Type'] = 'application/json'
             kwargs.pop('json')
 
@@ -137,31 +213,68 @@ class RESTApi(object):
         if 'timeout' not in kwargs:
             kwargs['timeout'] = 10
 
-        if self.debug:
+        trace = self._tracing()
+        if trace:
             self._log_request(method, self.base_url + url, **kwargs)
 
+        if self.throttle is not None:
+            admission = self.throttle.admit(
+                method, cache.resource_of(url), priority)
+        else:
+            admission = _admitted()
+
+        metrics = self.metrics
+        start = sent = time.time() if metrics is not None else None
         try:
-            response = self.session.request(method,
-                                            self.base_url + url,
-                                            **kwargs)
+            with admission:
+                if metrics is not None:
+                    sent = time.time()
+                response = self.session.request(method,
+                                                self.base_url + url,
+                                                **kwargs)
         except (requests.exceptions.ConnectionError,
                 requests.exceptions.Timeout) as e:
+            if metrics is not None:
+                metrics.count_error(
+                    cache.resource_of(url), method, 'ConnectionError')
             raise exceptions.ConnectionError(e.message)
 
         except Exception as e:
             raise e
 
-        if self.debug:
+        if metrics is not None:
+            self._measure(metrics, method, url, response, start, sent,
+                          kwargs.get('stream'))
+
+        if trace:
             self._log_response(response)
 
         return self._error_handler(response)
 
+    def _measure(self, metrics, method, url, response, start, sent, stream):
+        received = time.time()
+        resource = cache.resource_of(url)
+        # the time to the response headers
+        server = response.elapsed.total_seconds()
+        metrics.observe(resource, method, 'wait', sent - start)
+        metrics.observe(resource, method, 'server', server)
+        metrics.count_status(resource, method, response.status_code)
+        if stream:
+            # the body is read by the caller
+            size = int(response.headers.get('Content-Length') or 0)
+        else:
+            metrics.observe(resource, method, 'download',
+                            max(0.0, received - sent - server))
+            size = len(response.content or b'')
+        metrics.count_bytes(resource, method, size)
+
     def _error_handler(self, response):
         if response.status_code < 200 or response.status_code > 300:
-            self.logger.debug(
-                "ERROR: %s",
-                response.text,
-            )
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(
+                    "ERROR: %s",
+                    _truncate(response.content, self.trace_body_limit),
+                )
             raise exceptions.from_response(response)
         return response
 
@@ -253,9 +366,9 @@ class RESTApi(object):
 
         response = self.request('POST', url, json=data, **kwargs)
         if response_key:
-            return response.json()[response_key]
+            return codec.decode(response)[response_key]
         else:
-            return response.json()
+            return codec.decode(response)
 
     def list(self, url, data=None, response_key=None, **kwargs):
         """Retrieve a list of objects via a GET or POST request
@@ -272,9 +385,9 @@ class RESTApi(object):
             response = self.request('GET', url, **kwargs)
 
         if response_key:
-            return response.json()[response_key]
+            return codec.decode(response)[response_key]
         else:
-            return response.json()
+            return codec.decode(response)
 
     def set(self, url, data=None, response_key=None, **kwargs):
         """Update an object via a PUT request
@@ -289,9 +402,9 @@ class RESTApi(object):
         response = self.request('PUT', url, json=data)
         if data:
             if response_key:
-                return response.json()[response_key]
+                return codec.decode(response)[response_key]
             else:
-                return response.json()
+                return codec.decode(response)
         else:
             # Nothing to do here
             return None
@@ -306,9 +419,17 @@ class RESTApi(object):
 
         response = self.request('GET', url, **kwargs)
         if response_key:
-            return response.json()[response_key]
+            return codec.decode(response)[response_key]
         else:
-            return response.json()
+            return codec.decode(response)
+
+    def _tracing(self):
+        """Returns True if the current request should be traced"""
+        if not self.debug or not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        if self.trace_sample_rate >= 1.0:
+            return True
+        return random.random() < self.trace_sample_rate
 
     def _log_request(self, method, url, **kwargs):
         if 'params' in kwargs and kwargs['params'] != {}:
@@ -324,9 +445,11 @@ class RESTApi(object):
             header = " -H '%s: %s'" % (element, kwargs['headers'][element])
             string_parts.append(header)
 
-        self.logger.debug("REQ: %s" % " ".join(string_parts))
+        self.logger.debug("REQ: %s", " ".join(string_parts))
         if 'data' in kwargs:
-            self.logger.debug("  REQ BODY: %r\n" % (kwargs['data']))
+            self.logger.debug(
+                "  REQ BODY: %r\n",
+                _truncate(kwargs['data'], self.trace_body_limit))
 
     def _log_response(self, response):
         self.logger.debug(
@@ -337,9 +460,145 @@ class RESTApi(object):
         if response._content_consumed:
             self.logger.debug(
                 "  RESP BODY: '%s'",
-                response.text,
+                _truncate(response.content, self.trace_body_limit),
             )
         self.logger.debug(
             "  encoding: %s",
             response.encoding,
         )
+
+
+def _truncate(body, limit):
+    """Returns the body cut to ``limit`` bytes for logging"""
+    if body is None or limit is None or len(body) <= limit:
+        return body
+    return "%s... (%d bytes)" % (body[:limit], len(body))
+
+
+@contextlib.contextmanager
+def _admitted():
+    yield
+
+
+def _freeze(params):
+    """Returns hashable representation of the request params"""
+    if not params:
+        return None
+    if isinstance(params, dict):
+        params = params.items()
+    if isinstance(params, (list, tuple)):
+        return tuple(sorted((k, unicode(v)) for k, v in params))
+    return params
+
+
+def size_pool(session, maxsize):
+    """Mount the adapters keeping up to ``maxsize`` pooled connections per
+    host, otherwise urllib3 keeps discarding the connections above the
+    default limit of 10 when more requests run concurrently.
+    """
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+class ConcurrentRESTApi(object):
+    """A thread pool backed counterpart of :class:`RESTApi`
+
+    Every verb mirrors the one provided by :class:`RESTApi` but instead of
+    blocking the caller on the HTTP round trip it is submitted to an
+    executor and a :class:`concurrent.futures.Future` is returned.
+
+    The requests are still the blocking ``requests`` calls, so every
+    request in flight occupies one worker thread. The futures are not
+    awaitable by an event loop as is (on Python 3 they can be wrapped with
+    ``asyncio.wrap_future``). The executor can be shared between many
+    ConcurrentRESTApi objects, so a single pool of workers bounds the
+    number of threads driving a whole fleet of Home Centers.
+    """
+
+    def __init__(self, api=None, executor=None,
+                 max_workers=CONCURRENT_WORKERS, **kwargs):
+        """Construct a new concurrent REST client
+
+        :param RESTApi api: A :class:`RESTApi` object used to send the
+                            requests. If not passed it is created
+                            with ``**kwargs``.
+        :param executor: A :class:`concurrent.futures.Executor` running
+                         the requests. If not passed a thread pool with
+                         ``max_workers`` workers is created.
+        :param int max_workers: A number of concurrent requests
+        """
+
+        self.api = api or RESTApi(**kwargs)
+        self._own_executor = executor is None
+        self.executor = executor or futures.ThreadPoolExecutor(max_workers)
+
+        # the connection pool of the session passed by the caller is left
+        # as configured
+        if api is None and kwargs.get('session') is None:
+            size_pool(self.api.session, max_workers)
+
+    def submit(self, function, *args, **kwargs):
+        """Run the ``function`` in the executor. Returns
+        :class:`concurrent.futures.Future` object.
+        """
+
+        return self.executor.submit(function, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """Shutdown the executor if it was created by this object"""
+
+        if self._own_executor:
+            self.executor.shutdown(wait=wait)
+
+    def request(self, method, url, **kwargs):
+        r"""Make a request in the background. Returns
+        :class:`concurrent.futures.Future` object.
+
+        :param method: Request HTTP method
+        :param url: Request URL
+        :param \*\*kwargs: Optional arguments passed to ``RESTApi.request``
+        """
+
+        return self.submit(self.api.request, method, url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.submit(self.api.delete, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.submit(self.api.get, url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.submit(self.api.head, url, **kwargs)
+
+    def options(self, url, **kwargs):
+        return self.submit(self.api.options, url, **kwargs)
+
+    def patch(self, url, data=None, json=None, **kwargs):
+        return self.submit(self.api.patch, url, data=data, json=json,
+                           **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.submit(self.api.post, url, data=data, json=json,
+                           **kwargs)
+
+    def put(self, url, data=None, json=None, **kwargs):
+        return self.submit(self.api.put, url, data=data, json=json, **kwargs)
+
+    def create(self, url, data=None, response_key=None, **kwargs):
+        return self.submit(self.api.create, url, data=data,
+                           response_key=response_key, **kwargs)
+
+    def list(self, url, data=None, response_key=None, **kwargs):
+        return self.submit(self.api.list, url, data=data,
+                           response_key=response_key, **kwargs)
+
+    def set(self, url, data=None, response_key=None, **kwargs):
+        return self.submit(self.api.set, url, data=data,
+                           response_key=response_key, **kwargs)
+
+    def show(self, url, response_key=None, **kwargs):
+        return self.submit(self.api.show, url, response_key=response_key,
+                           **kwargs)
@@ -0,0 +1,86 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.singleflight
+ ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+ Duplicate Call Suppression Implementation
+"""
+
+import sys
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """Collapses concurrent calls identified by the same key into a single
+    call. The first caller executes the function, the callers arriving
+    while it is in flight wait for it and share the result or the
+    exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.collapsed = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """Execute function(*args, **kwargs) unless the call with the same
+        key is already in flight. Returns the result of the function.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.calls += 1
+            else:
+                leader = False
+                self.collapsed += 1
+
+        if not leader:
+            call.done.wait()
+            if call.exc_info:
+                exc_type, exc_value, exc_tb = call.exc_info
+                raise exc_type, exc_value, exc_tb
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except Exception:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def stats(self):
+        """Returns the dictionary with the counters"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'collapsed': self.collapsed,
+                'in_flight': len(self._calls),
+            }
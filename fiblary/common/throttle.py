@@ -0,0 +1,211 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.throttle
+ ~~~~~~~~~~~~~~~~~~~~~~~
+
+ Request Admission Control Implementation
+"""
+
+import bisect
+import contextlib
+import itertools
+import logging
+import threading
+import time
+
+
+_logger = logging.getLogger(__name__)
+
+EXEMPT = -1
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+
+LANES = {
+    INTERACTIVE: 'interactive',
+    NORMAL: 'normal',
+    BULK: 'bulk',
+}
+
+MAX_IN_FLIGHT = 4
+
+DEFAULT_LIMITS = {
+    ('GET', 'callAction'): (10, 10),
+    ('GET', 'sceneControl'): (5, 5),
+}
+"""Rate (requests per second) and burst per (verb, resource)"""
+
+
+class TokenBucket(object):
+    """Token bucket rate limiter"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self.tokens = self.burst
+        self.stamp = time.time()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def available(self, now):
+        self._refill(now)
+        return self.tokens >= 1
+
+    def delay(self, now):
+        """Returns the number of seconds until the token is available"""
+        self._refill(now)
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class Throttle(object):
+    """Admission control of the requests sent to a single Home Center.
+
+    The number of requests in flight is capped by ``max_in_flight`` and
+    the request rate is limited per (verb, resource) by the token buckets.
+    The waiting requests are admitted in the priority order, so the
+    interactive requests jump ahead of the bulk ones.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, limits=None):
+        """
+        :param max_in_flight: The maximum number of concurrent requests.
+                              None means unlimited.
+        :param limits: The dictionary of (rate, burst) tuples keyed by
+                       (verb, resource). '*' matches any verb or resource.
+                       default DEFAULT_LIMITS (optional)
+        """
+        self.max_in_flight = max_in_flight
+        self.limits = dict(
+            (key, TokenBucket(*value))
+            for key, value in (
+                DEFAULT_LIMITS if limits is None else limits).items())
+
+        self.in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = dict((lane, {
+            'requests': 0,
+            'waited': 0,
+            'wait_time': 0.0,
+            'max_wait': 0.0,
+        }) for lane in LANES.values())
+
+    def limit_for(self, method, resource):
+        """Returns the most specific token bucket for the request"""
+        for key in ((method, resource), ('*', resource),
+                    (method, '*'), ('*', '*')):
+            limit = self.limits.get(key)
+            if limit is not None:
+                return limit
+        return None
+
+    @contextlib.contextmanager
+    def admit(self, method, resource, priority=NORMAL):
+        """Context manager blocking until the request can be sent
+
+        :param method: Request HTTP method
+        :param resource: Request resource i.e. 'devices'
+        :param priority: INTERACTIVE, NORMAL, BULK or EXEMPT
+        """
+        if priority == EXEMPT:
+            yield
+            return
+
+        start = time.time()
+        self._acquire(self.limit_for(method, resource), priority)
+        self._record(priority, time.time() - start)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def _eligible(self, now):
+        """Returns the first waiter which can be admitted and the time
+        to wait for the token if none of them can
+        """
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return None, None
+
+        delay = None
+        for waiter in self._waiters:
+            limit = waiter[2]
+            if limit is None or limit.available(now):
+                return waiter, None
+            wait = limit.delay(now)
+            delay = wait if delay is None else min(delay, wait)
+        return None, delay
+
+    def _acquire(self, limit, priority):
+        with self._cond:
+            waiter = (priority, next(self._sequence), limit)
+            bisect.insort(self._waiters, waiter)
+            while True:
+                now = time.time()
+                eligible, delay = self._eligible(now)
+                if eligible is waiter:
+                    break
+                self._cond.wait(delay)
+
+            self._waiters.remove(waiter)
+            if limit is not None:
+                limit.take(now)
+            self.in_flight += 1
+            # the next waiter may be eligible as well
+            self._cond.notify_all()
+
+    def _record(self, priority, wait):
+        stats = self._stats[LANES.get(priority, 'normal')]
+        with self._cond:
+            stats['requests'] += 1
+            if wait > 0.001:
+                stats['waited'] += 1
+                stats['wait_time'] += wait
+                stats['max_wait'] = max(stats['max_wait'], wait)
+
+    def stats(self):
+        """Returns the dictionary of the wait metrics per priority lane"""
+        with self._cond:
+            result = dict(
+                (lane, dict(values)) for lane, values in self._stats.items())
+            result['in_flight'] = self.in_flight
+            result['waiting'] = len(self._waiters)
+        return result
+
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+def get(base_url, max_in_flight=MAX_IN_FLIGHT, limits=None):
+    """Returns the throttle shared by all the clients of the Home Center
+    identified by ``base_url``. The parameters are used only when the
+    throttle is created.
+    """
+    with _throttles_lock:
+        throttle = _throttles.get(base_url)
+        if throttle is None:
+            throttle = _throttles[base_url] = Throttle(max_in_flight, limits)
+        return throttle
@@ -0,0 +1,179 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+ fiblary.common.tracing
+ ~~~~~~~~~~~~~~~~~~~~~~
+
+ Operation Tracing Hooks Implementation
+
+ The controller operations, the state handler polls and the event
+ handler calls are wrapped in spans. The spans are dropped unless a tracer
+ is installed::
+
+    def report(span):
+        print(span.name, span.duration, span.attributes)
+
+    tracing.set_tracer(tracing.CallbackTracer(report))
+
+ The external tracers are plugged in by subclassing :class:`Tracer` and
+ implementing :meth:`Tracer.on_start` and :meth:`Tracer.on_end`.
+"""
+
+import logging
+import threading
+import time
+
+
+_logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class _NoopSpan(object):
+    """The span returned when tracing is disabled"""
+
+    name = None
+    parent = None
+    attributes = {}
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span(object):
+    """Timed operation with attributes i.e. resource, id, items, bytes.
+
+    The spans started in the same thread are nested, :func:`current`
+    returns the innermost one.
+    """
+
+    def __init__(self, tracer, name, attributes, parent=None):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.start = None
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        """The number of seconds the span lasted or None if not ended"""
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        stack = getattr(_local, 'spans', None)
+        if stack is None:
+            stack = _local.spans = []
+        stack.append(self)
+        self.start = time.time()
+        self.tracer.on_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.end = time.time()
+        if exc_value is not None:
+            self.error = exc_value
+        stack = _local.spans
+        if stack and stack[-1] is self:
+            stack.pop()
+        try:
+            self.tracer.on_end(self)
+        except Exception:
+            _logger.exception("Tracer failed on {}".format(self.name))
+        return False
+
+    def __repr__(self):
+        return "Span({!r}, {!r})".format(self.name, self.attributes)
+
+
+class Tracer(object):
+    """Base class of the tracers"""
+
+    def span(self, name, attributes):
+        return Span(self, name, attributes, current())
+
+    def on_start(self, span):
+        """Called when the span is entered"""
+
+    def on_end(self, span):
+        """Called when the span is exited. ``span.error`` is the exception
+        raised within the span if any
+        """
+
+
+class NoopTracer(Tracer):
+    """The default tracer dropping all the spans"""
+
+    def span(self, name, attributes):
+        return NOOP_SPAN
+
+
+class CallbackTracer(Tracer):
+    """Calls the callback with every ended span"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def on_end(self, span):
+        self.callback(span)
+
+
+_tracer = NoopTracer()
+
+
+def set_tracer(tracer):
+    """Install the tracer, None restores the default no-op tracer.
+    Returns the previous one.
+    """
+    global _tracer
+    previous = _tracer
+    _tracer = tracer if tracer is not None else NoopTracer()
+    return previous
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, **attributes):
+    """Returns the span context manager of the operation"""
+    return _tracer.span(name, attributes)
+
+
+def current():
+    """Returns the innermost span of the thread or the no-op span"""
+    stack = getattr(_local, 'spans', None)
+    return stack[-1] if stack else NOOP_SPAN
@@ -20,7 +20,9 @@
 """
 
 
+import collections
 import sys
+import threading
 
 
 def import_module(import_str):
@@ -41,3 +43,44 @@ def quote_if_string(value):
         return "'{0}'".format(value)
     else:
         return value
+
+
+class LRUCache(object):
+    """Thread safe dictionary keeping at most ``maxsize`` recently used
+    items.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value  # move to the end
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,88 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test bulk controller operations"""
+
+from concurrent import futures
+import mock
+import threading
+
+from fiblary.client.v3 import devices
+from fiblary.client.v3 import models
+from fiblary.client.v3 import scenes
+from fiblary.common import exceptions
+from fiblary.common import throttle
+from fiblary.tests import utils
+
+
+class TestBulk(utils.TestCase):
+
+    def _http_client(self, fail=()):
+        lock = threading.Lock()
+        self.calls = []
+
+        def get(url, **kwargs):
+            with lock:
+                self.calls.append(url)
+            if any('deviceID={}&'.format(device_id) in url
+                   for device_id in fail):
+                raise exceptions.HTTPNotFound()
+            return mock.MagicMock(status_code=202)
+
+        http_client = mock.MagicMock()
+        http_client.get.side_effect = get
+        http_client.throttle = None
+        return http_client
+
+    def test_bulk_action(self):
+        controller = devices.Controller(
+            self._http_client(fail=(3,)), models.DeviceModel)
+
+        results = controller.bulk_action(range(1, 6), 'setValue', 10)
+        self.assertEqual([result.id for result in results], [1, 2, 3, 4, 5])
+        self.assertEqual([result.ok for result in results],
+                         [True, True, False, True, True])
+        self.assertIsInstance(results[2].error, exceptions.HTTPNotFound)
+        self.assertTrue(all(result.elapsed >= 0 for result in results))
+        self.assertIn('callAction?deviceID=1&name=setValue&arg1=10',
+                      self.calls)
+
+    def test_stop_on_error(self):
+        controller = devices.Controller(
+            self._http_client(fail=(1,)), models.DeviceModel)
+
+        results = controller.bulk_action(
+            range(1, 11), 'turnOff', max_workers=1, stop_on_error=True)
+        self.assertEqual(len(self.calls), 1)
+        self.assertFalse(any(result.ok for result in results))
+        for result in results[1:]:
+            self.assertIsInstance(result.error, futures.CancelledError)
+
+    def test_workers_capped_by_throttle(self):
+        http_client = self._http_client()
+        http_client.throttle = throttle.Throttle(max_in_flight=2)
+        controller = devices.Controller(http_client, models.DeviceModel)
+
+        with mock.patch('fiblary.client.v3.base.futures.ThreadPoolExecutor',
+                        wraps=futures.ThreadPoolExecutor) as executor:
+            controller.bulk_action(range(10), 'turnOn', max_workers=8)
+        executor.assert_called_with(2)
+
+    def test_bulk_control(self):
+        controller = scenes.Controller(
+            self._http_client(), models.SceneModel)
+
+        results = controller.bulk_control([7, 8], 'start')
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(self.calls, ['sceneControl', 'sceneControl'])
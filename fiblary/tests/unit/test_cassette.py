@@ -0,0 +1,145 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test cassette module"""
+
+import contextlib
+import gzip
+import json
+import mock
+import os
+import requests
+import shutil
+import tempfile
+import time
+
+from fiblary.client.v3 import client
+from fiblary.common import cassette
+from fiblary.common import exceptions
+from fiblary.tests import utils
+
+
+fake_url = 'http://hc2/api/'
+
+fake_devices = [
+    {'id': 3, 'name': u'lampa w kuchni \u0142', 'properties': {'value': '0'}},
+    {'id': 7, 'name': 'door', 'properties': {'value': '1'}},
+]
+
+
+def fake_response(data, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = 'OK'
+    response.encoding = 'utf-8'
+    response.headers['Content-Type'] = 'application/json'
+    response._content = json.dumps(data).encode('utf-8')
+    return response
+
+
+class TestCassette(utils.TestCase):
+
+    def setUp(self):
+        super(TestCassette, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'hc2.cassette.gz')
+
+    @contextlib.contextmanager
+    def record(self, responses):
+        with mock.patch.object(requests.Session, 'request',
+                               side_effect=responses):
+            with cassette.Recorder(self.path) as session:
+                yield client.Client(fake_url, 'admin', 'secret',
+                                    session=session)
+
+    def test_record(self):
+        with self.record([fake_response(fake_devices),
+                          fake_response({'name': 'x'})]) as hc:
+            self.assertEqual(len(list(hc.devices.list())), 2)
+            hc.users.update({'id': 2, 'name': 'x', 'password': 'secret'})
+
+        entries = cassette.load(self.path)
+        self.assertEqual([(e['method'], e['path']) for e in entries],
+                         [('GET', '/api/devices'), ('PUT', '/api/users')])
+        self.assertEqual(json.loads(entries[0]['content']), fake_devices)
+        self.assertEqual(json.loads(entries[1]['body'])['password'],
+                         cassette.SCRUBBED)
+
+        with gzip.open(self.path, 'rb') as f:
+            content = f.read()
+        self.assertNotIn(b'secret', content)
+
+    def test_scrub_response(self):
+        camera = {'id': 9, 'name': 'camera',
+                  'properties': {'user': 'admin', 'password': 'secret'}}
+        with self.record([fake_response([camera])]) as hc:
+            self.assertEqual(
+                list(hc.devices.list())[0].properties.password, 'secret')
+
+        content = json.loads(cassette.load(self.path)[0]['content'])
+        self.assertEqual(content[0]['properties'],
+                         {'user': 'admin', 'password': cassette.SCRUBBED})
+
+    def test_request_key(self):
+        self.assertEqual(
+            cassette.request_key(
+                'get', 'http://hc2/api/devices?roomID=5&password=x',
+                {'id': 3}),
+            ('GET', '/api/devices', 'id=3&password=%2A%2A%2A&roomID=5'))
+
+    def test_replay(self):
+        with self.record([fake_response(fake_devices),
+                          fake_response(fake_devices[0]),
+                          fake_response({'last': 5, 'changes': []})]) as hc:
+            list(hc.devices.list())
+            hc.devices.get(3)
+            hc.client.get('refreshStates?last=0')
+
+        player = cassette.Player(self.path)
+        hc = client.Client(fake_url, 'admin', 'other', session=player)
+        self.assertEqual(hc.devices.get(3).name, fake_devices[0]['name'])
+        self.assertEqual([d.id for d in hc.devices.list()], [3, 7])
+
+        # the long-poll is matched by the path
+        state = hc.client.get('refreshStates?last=4').json()
+        self.assertEqual(state['last'], 5)
+        self.assertEqual(player.remaining, 0)
+
+        self.assertRaises(exceptions.ConnectionError,
+                          hc.client.get, 'devices', params={'id': 3})
+        self.assertEqual(player.misses, 1)
+
+    def test_realtime_pacing(self):
+        def delayed(*args, **kwargs):
+            time.sleep(0.05)
+            return fake_response(fake_devices)
+
+        with mock.patch.object(requests.Session, 'request',
+                               side_effect=delayed):
+            with cassette.Recorder(self.path) as session:
+                session.request('GET', fake_url + 'devices')
+                session.request('GET', fake_url + 'devices')
+
+        player = cassette.Player(self.path, pacing=cassette.REALTIME)
+        start = time.time()
+        player.request('GET', fake_url + 'devices')
+        player.request('GET', fake_url + 'devices')
+        self.assertGreater(time.time() - start, 0.04)
+
+        player = cassette.Player(self.path, pacing=cassette.FAST)
+        start = time.time()
+        player.request('GET', fake_url + 'devices')
+        player.request('GET', fake_url + 'devices')
+        self.assertLess(time.time() - start, 0.04)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test codec module"""
+
+import mock
+
+from fiblary.common import codec
+from fiblary.tests import utils
+
+
+fake_state = {
+    'status': 'IDLE',
+    'last': 123456,
+    'changes': [{'id': 12, 'value': '1', 'log': u'Temperatura 21\xb0C'}],
+    'timestamp': 1400000000,
+}
+
+
+class TestCodec(utils.TestCase):
+
+    def _codecs(self):
+        for name in codec.BACKENDS:
+            try:
+                yield codec.Codec(name)
+            except ImportError:
+                pass
+
+    def test_select(self):
+        self.assertEqual(codec.select(('no_such_json', 'json')).name, 'json')
+        self.assertRaises(ImportError, codec.select, ('no_such_json',))
+
+    def test_round_trip(self):
+        for backend in self._codecs():
+            data = backend.dumps(fake_state)
+            self.assertEqual(backend.loads(data), fake_state)
+            self.assertEqual(codec.Codec('json').loads(data), fake_state)
+            self.assertRaises(ValueError, backend.loads, '{"id": ')
+
+    def test_decode(self):
+        for backend in self._codecs():
+            response = mock.MagicMock(
+                content=codec.Codec('json').dumps(fake_state),
+                encoding=None)
+            self.assertEqual(backend.decode(response), fake_state)
+
+            response = mock.MagicMock(
+                text=u'{"name": "żar\xf3wka"}', encoding='ISO-8859-2')
+            self.assertEqual(
+                backend.decode(response), {'name': u'żar\xf3wka'})
@@ -16,6 +16,8 @@
 """Test rest module"""
 
 import operator
+import threading
+import time
 
 from fiblary.common import event
 from fiblary.common import exceptions
@@ -76,3 +78,147 @@ class TestEventHook(utils.TestCase):
             operator.isub,
             self.event_hook,
             fake_handler)
+
+
+class TestDispatcher(utils.TestCase):
+
+    def setUp(self):
+        super(TestDispatcher, self).setUp()
+
+        self.dispatcher = event.Dispatcher(workers=3)
+        self.addCleanup(self.dispatcher.stop)
+
+    def test_lazy_workers(self):
+        """Test the workers are started with the first call"""
+
+        self.assertEqual(self.dispatcher._workers, [])
+        done = threading.Event()
+        self.dispatcher.put('a', done.set)
+        self.assertTrue(done.wait(5), "Handler was not called")
+        self.assertEqual(len(self.dispatcher._workers), 3)
+
+    def test_ordering_per_hook(self):
+        """Test the calls of a single hook are executed in order"""
+
+        results = {'a': [], 'b': []}
+        done = threading.Event()
+
+        def handler(key, n):
+            results[key].append(n)
+            if len(results['a']) + len(results['b']) == 200:
+                done.set()
+
+        hook_a = event.EventHook('a', dispatcher=self.dispatcher)
+        hook_b = event.EventHook('b', dispatcher=self.dispatcher)
+        hook_a += handler
+        hook_b += handler
+
+        for n in range(100):
+            hook_a('a', n)
+            hook_b('b', n)
+
+        self.assertTrue(done.wait(5), "Handlers were not called")
+        self.assertEqual(results['a'], list(range(100)))
+        self.assertEqual(results['b'], list(range(100)))
+
+    def test_queue_depth(self):
+        """Test the pending calls are reported per hook"""
+
+        release = threading.Event()
+        hook = event.EventHook(event_name, dispatcher=self.dispatcher)
+        hook += lambda: release.wait(5)
+
+        self.assertEqual(
+            type(hook.event_queue),
+            event.DispatcherQueue,
+            "Queue should be served by the dispatcher")
+
+        for n in range(3):
+            hook()
+
+        self.assertEqual(hook.get_queue_depth(), 3)
+        self.assertEqual(self.dispatcher.queue_depths(), {event_name: 3})
+        release.set()
+
+
+class TestScheduler(utils.TestCase):
+
+    def setUp(self):
+        super(TestScheduler, self).setUp()
+
+        self.scheduler = event.Scheduler()
+        self.addCleanup(self.scheduler.stop)
+
+    def test_order(self):
+        """Test the timers fire in the time order and can be cancelled"""
+
+        results = []
+        done = threading.Event()
+        now = time.time()
+
+        self.scheduler.call_at(now + 0.03, results.append, 3)
+        self.scheduler.call_at(now + 0.01, results.append, 1)
+        timer = self.scheduler.call_at(now + 0.02, results.append, 2)
+        self.scheduler.call_at(now + 0.04, done.set)
+        self.scheduler.cancel(timer)
+
+        self.assertTrue(done.wait(5), "Timers were not fired")
+        self.assertEqual(results, [1, 3])
+
+
+class TestCoalescer(utils.TestCase):
+
+    def setUp(self):
+        super(TestCoalescer, self).setUp()
+
+        self.scheduler = event.Scheduler()
+        self.addCleanup(self.scheduler.stop)
+        self.results = []
+        self.done = threading.Event()
+
+    def handler(self, **kwargs):
+        self.results.append((kwargs['id'], kwargs['value']))
+        self.done.set()
+
+    def test_last_value_wins(self):
+        coalescer = event.Coalescer(
+            self.handler, window=0.05, scheduler=self.scheduler)
+        for n in range(10):
+            coalescer(id=3, value=n)
+            coalescer(id=4, value=-n)
+
+        self.assertTrue(self.done.wait(5), "Handler was not called")
+        time.sleep(0.1)
+        self.assertEqual(sorted(self.results), [(3, 9), (4, -9)])
+        self.assertEqual(coalescer.received, 20)
+        self.assertEqual(coalescer.delivered, 2)
+
+    def test_max_rate(self):
+        coalescer = event.Coalescer(
+            self.handler, max_rate=10, scheduler=self.scheduler)
+        coalescer(id=3, value=0)
+        self.assertEqual(self.results, [(3, 0)], "First event is delayed")
+
+        self.done.clear()
+        for n in range(1, 5):
+            coalescer(id=3, value=n)
+        self.assertEqual(len(self.results), 1)
+        self.assertTrue(self.done.wait(5), "Handler was not called")
+        self.assertEqual(self.results, [(3, 0), (3, 4)])
+
+    def test_cancel(self):
+        coalescer = event.Coalescer(
+            self.handler, window=0.02, scheduler=self.scheduler)
+        coalescer(id=3, value=1)
+        coalescer.cancel()
+
+        time.sleep(0.05)
+        self.assertEqual(self.results, [])
+
+    def test_remove_from_hook(self):
+        hook = event.EventHook(event_name)
+        coalescer = event.Coalescer(
+            self.handler, window=0.02, scheduler=self.scheduler)
+        hook += coalescer
+        hook -= self.handler
+        self.assertEqual(hook.get_handler_count(), 0)
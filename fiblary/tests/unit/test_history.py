@@ -0,0 +1,93 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test event history"""
+
+import json
+import mock
+import threading
+import time
+
+from fiblary.client.v3 import events
+from fiblary.common import throttle
+from fiblary.tests import utils
+
+
+fake_events = [
+    {'id': n, 'type': 'DEVICE_PROPERTY_CHANGED', 'timestamp': 1000 + n * 10,
+     'deviceID': 3, 'propertyName': 'value', 'newValue': str(n % 2)}
+    for n in range(100)
+]
+
+
+class TestHistory(utils.TestCase):
+
+    def setUp(self):
+        super(TestHistory, self).setUp()
+        self.requests = []
+        self.lock = threading.Lock()
+        self.in_flight = [0, 0]
+
+        def get(resource, params=None, **kwargs):
+            with self.lock:
+                self.requests.append((params, kwargs))
+                self.in_flight[0] += 1
+                self.in_flight[1] = max(self.in_flight)
+            time.sleep(0.005)
+            data = [event for event in reversed(fake_events)
+                    if params['from'] <= event['timestamp'] <= params['to']]
+            with self.lock:
+                self.in_flight[0] -= 1
+            return mock.MagicMock(content=json.dumps(data), encoding='utf-8')
+
+        self.http_client = mock.MagicMock()
+        self.http_client.get.side_effect = get
+        self.http_client.throttle = None
+        self.http_client.metrics = None
+        self.controller = events.Controller(
+            self.http_client, lambda item: item)
+
+    def test_windows(self):
+        self.assertEqual(events.windows(0, 25, 10),
+                         [(0, 10), (10, 20), (20, 25)])
+        self.assertEqual(events.windows(0, 20, 10), [(0, 10), (10, 20)])
+        self.assertEqual(events.windows(5, 5, 10), [(5, 5)])
+        self.assertRaises(ValueError, events.windows, 0, 10, 0)
+
+    def test_history(self):
+        history = list(self.controller.history(
+            1000, 2000, window=100, max_workers=3, deviceID=3))
+
+        self.assertEqual([item['id'] for item in history], list(range(100)))
+        self.assertEqual(len(self.requests), 10)
+        params, kwargs = self.requests[0]
+        self.assertEqual(params['type'], 'time')
+        self.assertEqual(params['deviceID'], 3)
+        self.assertEqual(kwargs['timeout'], events.HISTORY_TIMEOUT)
+        self.assertEqual(kwargs['priority'], throttle.BULK)
+        self.assertLessEqual(self.in_flight[1], 3)
+
+    def test_capped_by_throttle(self):
+        self.http_client.throttle = throttle.Throttle(max_in_flight=2)
+        list(self.controller.history(1000, 2000, window=50))
+        self.assertLessEqual(self.in_flight[1], 2)
+
+    def test_partial_consumption(self):
+        history = self.controller.history(1000, 2000, window=10,
+                                          max_workers=2)
+        self.assertEqual(next(history)['id'], 0)
+        history.close()
+        time.sleep(0.05)
+        # only the windows requested ahead were fetched
+        self.assertLessEqual(len(self.requests), 5)
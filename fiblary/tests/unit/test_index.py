@@ -0,0 +1,117 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test index module"""
+
+import json
+import mock
+
+from fiblary.client.v3 import devices
+from fiblary.client.v3 import index
+from fiblary.client.v3 import replica
+from fiblary.tests import utils
+
+
+fake_devices = [
+    {'id': 3, 'name': 'lamp', 'type': 'binary_light', 'roomID': 1,
+     'properties': {'value': '0', 'deviceID': 10}},
+    {'id': 7, 'name': 'dimmer', 'type': 'dimmable_light', 'roomID': 2,
+     'properties': {'value': '55', 'deviceID': 10}},
+    {'id': 8, 'name': 'temp', 'type': 'temperature_sensor', 'roomID': 2,
+     'properties': {'value': '21.50', 'deviceID': 11}},
+    {'id': 9, 'name': 'remote', 'type': 'remote_controller', 'roomID': 2,
+     'properties': {'value': 'n/a'}},
+]
+
+
+class TestIndex(utils.TestCase):
+
+    def setUp(self):
+        super(TestIndex, self).setUp()
+        self.index = index.Index(properties=('deviceID',), ranges=('p_value',))
+        for item in fake_devices:
+            self.index.add(item)
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup(roomID=2), set([7, 8, 9]))
+        self.assertEqual(
+            self.index.lookup(roomID=2, p_deviceID=10), set([7]))
+        self.assertEqual(self.index.lookup(roomID=5), set())
+        # 'name' is not indexed
+        self.assertEqual(self.index.lookup(roomID=2, name='temp'), None)
+
+    def test_between(self):
+        self.assertEqual(self.index.between('p_value', 20, 55), [8, 7])
+        self.assertEqual(self.index.between('p_value', high=21.5), [3, 8])
+        self.assertEqual(self.index.between('p_value', 56), [])
+        self.assertRaises(KeyError, self.index.between, 'roomID')
+
+    def test_incremental(self):
+        moved = dict(fake_devices[0], roomID=2)
+        moved['properties'] = {'value': '99', 'deviceID': 12}
+        self.index.add(moved)
+        self.assertEqual(self.index.lookup(roomID=1), set())
+        self.assertEqual(self.index.lookup(roomID=2), set([3, 7, 8, 9]))
+        self.assertEqual(self.index.lookup(p_deviceID=12), set([3]))
+        self.assertEqual(self.index.between('p_value', 90), [3])
+
+        self.index.discard(3)
+        self.assertEqual(self.index.lookup(p_deviceID=12), set())
+        self.assertEqual(self.index.between('p_value', 90), [])
+
+
+class TestIndexedReplica(utils.TestCase):
+
+    def setUp(self):
+        super(TestIndexedReplica, self).setUp()
+        self.replica = replica.Replica(
+            index=index.Index(properties=('value',), ranges=('p_value',)))
+        self.replica.load(fake_devices)
+        self.http_client = mock.MagicMock()
+        self.controller = devices.Controller(
+            self.http_client, lambda item: item)
+        self.controller.replica = self.replica
+
+    def test_list(self):
+        with mock.patch('fiblary.common.jsonpath.jsonpath') as path:
+            self.assertEqual(
+                [i['id'] for i in self.controller.list(roomID=2)], [7, 8, 9])
+            self.assertEqual(
+                self.controller.find(type='binary_light')['id'], 3)
+        self.assertFalse(path.called)
+
+        # not indexed parameters are filtered with JSON path
+        self.assertEqual(
+            [i['id'] for i in self.controller.list(roomID=2, name='temp')],
+            [8])
+        self.assertFalse(self.http_client.get.called)
+
+    def test_state_and_update(self):
+        self.replica.apply_state({'last': 1, 'changes': [
+            {'id': 7, 'value': '0'},
+        ]})
+        self.assertEqual(
+            [i['id'] for i in self.controller.list(p_value='0')], [3, 7])
+        self.assertEqual(
+            [i['id'] for i in self.replica.between('p_value', 0, 0)], [3, 7])
+
+        updated = dict(fake_devices[1], roomID=5)
+        self.http_client.put.return_value = mock.MagicMock(
+            content=json.dumps(updated), encoding='utf-8')
+        self.controller.update(updated)
+        self.assertEqual(
+            [i['id'] for i in self.controller.list(roomID=5)], [7])
+
+        self.controller.delete(7)
+        self.assertEqual(list(self.controller.list(roomID=5)), [])
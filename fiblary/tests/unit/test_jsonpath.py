@@ -0,0 +1,87 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test jsonpath compiler module"""
+
+from fiblary.common import jsonpath
+import fiblary.external.jsonpath as external
+from fiblary.tests import utils
+
+
+fake_devices = [
+    {
+        'id': i,
+        'name': 'device_{}'.format(i),
+        'type': 'binary_light' if i % 2 else 'door_sensor',
+        'roomID': i % 3,
+        'properties': {
+            'value': str(i % 2),
+            'power': i * 1.5,
+            'parameters': [{'id': 1}, {'id': 2}],
+        }
+    } for i in range(20)
+]
+
+expressions = [
+    "$[?(@.id==3)]",
+    "$[?((@.type=='binary_light') and (@.properties.value=='1'))]",
+    "$[?(@.properties.power>10 && @.properties.power<20)]",
+    "$[?(@.properties.missing=='1')]",
+    "$[?(!@.roomID)]",
+    "$[?(@.properties.parameters.length==2 and @.roomID==1)]",
+    "$[?(@.id<3 || not @.id<17)]",
+    "$[?(1<@.id<5)]",
+    "$..name",
+    "$[0].properties.value",
+    "$[*].id",
+    "$['1']",
+]
+
+
+class TestJsonPath(utils.TestCase):
+
+    def test_compatibility(self):
+        """Test compiled expressions match the eval based ones"""
+
+        for expr in expressions:
+            self.assertIsInstance(
+                jsonpath.compile(expr),
+                jsonpath.CompiledPath,
+                expr)
+            self.assertEqual(
+                jsonpath.jsonpath(fake_devices, expr),
+                external.jsonpath(fake_devices, expr),
+                expr)
+
+    def test_fallback(self):
+        """Test unsupported expressions are evaluated by external module"""
+
+        expr = "$[1:3]"
+        self.assertIsInstance(jsonpath.compile(expr), jsonpath.FallbackPath)
+        self.assertEqual(
+            jsonpath.jsonpath(fake_devices, expr),
+            fake_devices[1:3])
+
+    def test_cache(self):
+        """Test the compiled expression is reused"""
+
+        expr = "$[?(@.id==5)]"
+        path = jsonpath.compile(expr)
+        self.assertIs(jsonpath.compile(expr), path)
+        self.assertEqual(path.predicate(fake_devices[5]), True)
+
+    def test_no_match(self):
+        self.assertEqual(jsonpath.jsonpath(fake_devices, "$[?(@.id<0)]"),
+                         False)
+        self.assertEqual(jsonpath.jsonpath([], "$[*]"), False)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test jsonstream module"""
+
+import json
+import mock
+
+from fiblary.client.v3 import devices
+from fiblary.client.v3 import models
+from fiblary.common import jsonstream
+from fiblary.tests import utils
+
+
+fake_devices = [
+    {'id': 1, 'name': u'światło', 'roomID': 1,
+     'properties': {'value': '0'}},
+    {'id': 2, 'name': 'lamp', 'roomID': 2, 'properties': {'value': '1'}},
+    {'id': 3, 'name': 'fan', 'roomID': 2, 'properties': {'value': 100}},
+]
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestIterArray(utils.TestCase):
+
+    def test_chunked(self):
+        data = json.dumps(fake_devices, ensure_ascii=False).encode('utf-8')
+        # split at every position including inside multibyte characters
+        for size in range(1, len(data) + 1):
+            items = list(jsonstream.iter_array(_chunks(data, size)))
+            self.assertEqual(items, fake_devices)
+
+    def test_numbers(self):
+        data = b' [ 12345 , 6.5e3,\n"x" ] '
+        for size in range(1, len(data) + 1):
+            items = list(jsonstream.iter_array(_chunks(data, size)))
+            self.assertEqual(items, [12345, 6.5e3, "x"])
+
+    def test_not_array(self):
+        data = json.dumps(fake_devices[0]).encode('utf-8')
+        items = list(jsonstream.iter_array(_chunks(data, 7)))
+        self.assertEqual(items, [fake_devices[0]])
+        self.assertEqual(list(jsonstream.iter_array([b'[]'])), [])
+
+    def test_malformed(self):
+        for data in (b'', b'[1, 2', b'[1 2]', b'[1,]', b'[1] 2', b'[{"a":]'):
+            self.assertRaises(
+                ValueError, list, jsonstream.iter_array(_chunks(data, 2)))
+
+
+class TestStreamedList(utils.TestCase):
+
+    def setUp(self):
+        super(TestStreamedList, self).setUp()
+        data = json.dumps(fake_devices).encode('utf-8')
+        self.response = mock.MagicMock(encoding=None)
+        self.response.iter_content.return_value = _chunks(data, 16)
+        self.http_client = mock.MagicMock()
+        self.http_client.get.return_value = self.response
+        self.controller = devices.Controller(
+            self.http_client, models.RecursiveDict)
+
+    def test_list(self):
+        items = list(self.controller.list(stream=True, roomID=2, p_value='1'))
+        self.assertEqual([item.id for item in items], [2])
+        self.assertEqual(
+            self.http_client.get.call_args[1]['params']['roomID'], 2)
+        self.assertTrue(self.http_client.get.call_args[1]['stream'])
+        self.assertTrue(self.response.close.called)
+
+    def test_list_fallback(self):
+        # the expression which is not a single filter
+        items = list(self.controller.list(
+            stream=True, jsonpath='$[*].properties'))
+        self.assertEqual(len(items), 3)
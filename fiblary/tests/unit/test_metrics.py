@@ -0,0 +1,133 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test metrics module"""
+
+import datetime
+import json
+import mock
+
+import requests
+
+from fiblary.client.v3 import devices
+from fiblary.common import exceptions
+from fiblary.common import metrics
+from fiblary.common import restapi
+from fiblary.tests import utils
+
+
+fake_url = 'http://hc2/api/'
+
+fake_devices = [
+    {'id': 3, 'name': 'lamp', 'properties': {'value': '0'}},
+    {'id': 7, 'name': 'door', 'properties': {'value': '1'}},
+]
+
+
+def fake_response(data, status_code=200, elapsed=0.01):
+    response = requests.Response()
+    response.status_code = status_code
+    response.encoding = 'utf-8'
+    response.elapsed = datetime.timedelta(seconds=elapsed)
+    response._content = json.dumps(data).encode('utf-8')
+    return response
+
+
+class TestHistogram(utils.TestCase):
+
+    def test_observe(self):
+        histogram = metrics.Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.05, 0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.6)
+        self.assertEqual(histogram.cumulative(),
+                         [(0.1, 2), (1.0, 3), (float('inf'), 4)])
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.75), 1.0)
+        self.assertEqual(histogram.quantile(0.99), 2.0)
+        self.assertIsNone(metrics.Histogram().quantile(0.5))
+
+
+@mock.patch('fiblary.common.restapi.requests.Session')
+class TestRequestMetrics(utils.TestCase):
+
+    def _api(self, session_mock, responses):
+        session_mock.return_value.request.side_effect = responses
+        self.metrics = metrics.Metrics()
+        return restapi.RESTApi(base_url=fake_url, metrics=self.metrics)
+
+    def test_phases(self, session_mock):
+        api = self._api(session_mock, [
+            fake_response(fake_devices, elapsed=0.02),
+            fake_response(None, status_code=404),
+        ])
+        controller = devices.Controller(api, lambda item: item)
+
+        self.assertEqual(len(list(controller.list())), 2)
+        self.assertRaises(exceptions.HTTPNotFound,
+                          api.get, 'devices', params={'id': 99})
+
+        snapshot = self.metrics.snapshot()
+        latency = snapshot['latency']['devices']['GET']
+        self.assertEqual(
+            sorted(latency),
+            ['decode', 'download', 'model', 'server', 'wait'])
+        self.assertEqual(latency['server']['count'], 2)
+        self.assertAlmostEqual(latency['server']['max'], 0.02)
+        self.assertEqual(latency['decode']['count'], 1)
+        self.assertEqual(latency['model']['count'], 2)
+        self.assertEqual(snapshot['status']['devices']['GET'],
+                         {200: 1, 404: 1})
+        self.assertEqual(snapshot['bytes']['devices']['GET'],
+                         len(json.dumps(fake_devices)) + len('null'))
+
+    def test_connection_error(self, session_mock):
+        api = self._api(
+            session_mock, requests.exceptions.ConnectionError('refused'))
+        self.assertRaises(exceptions.ConnectionError,
+                          api.get, 'refreshStates?last=5')
+        self.assertEqual(self.metrics.snapshot()['errors'],
+                         {'refreshStates': {'GET': {'ConnectionError': 1}}})
+
+    def test_prometheus(self, session_mock):
+        api = self._api(session_mock, [fake_response(fake_devices)])
+        api.get('devices')
+
+        text = self.metrics.to_prometheus()
+        self.assertIn('# TYPE fiblary_request_seconds histogram', text)
+        self.assertIn(
+            'fiblary_request_seconds_bucket{resource="devices",verb="GET",'
+            'phase="server",le="0.01"} 1', text)
+        self.assertIn(
+            'fiblary_request_seconds_bucket{resource="devices",verb="GET",'
+            'phase="server",le="+Inf"} 1', text)
+        self.assertIn(
+            'fiblary_responses_total{resource="devices",verb="GET",'
+            'status="200"} 1', text)
+        size = len(json.dumps(fake_devices))
+        self.assertIn(
+            'fiblary_response_bytes_total{resource="devices",verb="GET"} '
+            '%d' % size, text)
+
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot()['latency'], {})
+
+    def test_disabled(self, session_mock):
+        session_mock.return_value.request.return_value = fake_response(
+            fake_devices)
+        api = restapi.RESTApi(base_url=fake_url)
+        self.assertIsNone(api.metrics)
+        self.assertEqual(api.get('devices').status_code, 200)
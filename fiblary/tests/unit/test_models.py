@@ -0,0 +1,169 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test models module"""
+
+import copy
+import json
+import mock
+
+from fiblary.client.v3 import devices
+from fiblary.client.v3 import models
+from fiblary.tests import utils
+
+
+fake_device = {
+    'id': 12,
+    'name': 'lamp',
+    'type': 'binary_light',
+    'properties': {
+        'value': '0',
+        'parameters': [{'id': 1, 'value': 10}, {'id': 2, 'value': 20}],
+    },
+    'actions': {'turnOn': 0, 'turnOff': 0, 'setValue': 1},
+}
+
+
+class TestRecursiveDict(utils.TestCase):
+
+    def setUp(self):
+        super(TestRecursiveDict, self).setUp()
+        self.item = copy.deepcopy(fake_device)
+        self.model = models.RecursiveDict(self.item)
+
+    def test_lazy_wrapping(self):
+        """Test nested values are wrapped on the first access only"""
+
+        raw = dict.__getitem__(self.model, 'properties')
+        self.assertNotIsInstance(raw, models.RecursiveDict)
+
+        properties = self.model.properties
+        self.assertIsInstance(properties, models.RecursiveDict)
+        self.assertIs(self.model.properties, properties)
+        self.assertIsInstance(properties.parameters, models.RecursiveList)
+        self.assertIsInstance(properties.parameters[0], models.RecursiveDict)
+        self.assertEqual(
+            [p.value for p in properties.parameters], [10, 20])
+        self.assertIsInstance(
+            self.model.get('properties'), models.RecursiveDict)
+        self.assertTrue(all(
+            isinstance(v, models.RecursiveDict)
+            for k, v in self.model.items() if isinstance(v, dict)))
+
+    def test_original_untouched(self):
+        """Test the changes do not modify the original JSON"""
+
+        self.model.properties.value = '1'
+        self.model.properties.parameters[1].value = 30
+        self.assertEqual(self.item, fake_device)
+        self.assertIs(self.model.__dict__['__original__'], self.item)
+
+        changes = json.loads(self.model.changes())
+        self.assertEqual(sorted(c['path'] for c in changes), [
+            '/properties/parameters/1/value',
+            '/properties/value'])
+
+    def test_tracked_changes(self):
+        """Test the modified paths are recorded"""
+
+        self.assertFalse(self.model.is_modified())
+        self.model.properties.value = '1'
+        self.model.properties.parameters.append({'id': 3, 'value': 30})
+        self.model.pop('actions')
+        self.model.room = 4
+
+        self.assertTrue(self.model.is_modified())
+        self.assertEqual(json.loads(self.model.changes()), [
+            {'op': 'remove', 'path': '/actions'},
+            {'op': 'replace', 'path': '/properties/parameters',
+             'value': self.model.properties.parameters},
+            {'op': 'replace', 'path': '/properties/value', 'value': '1'},
+            {'op': 'add', 'path': '/room', 'value': 4},
+        ])
+
+        self.model.clear_changes()
+        self.assertEqual(self.model.changes(), '[]')
+
+    def test_partial(self):
+        """Test only the modified fields are included"""
+
+        self.model.properties.parameters[0].value = 11
+        self.model.properties.value = '1'
+        self.model.name = 'bulb'
+        self.assertEqual(self.model.partial(), {
+            'name': 'bulb',
+            'properties': {
+                'value': '1',
+                'parameters': [
+                    {'id': 1, 'value': 11}, {'id': 2, 'value': 20}]}})
+
+    def test_partial_unchanged(self):
+        """Test the fields set to their original values are skipped"""
+
+        self.model.name = self.model.name
+        self.model.properties.parameters[0].value = \
+            self.model.properties.parameters[0].value
+        self.assertTrue(self.model.is_modified())
+        self.assertEqual(self.model.partial(), {})
+
+        self.model.properties.value = '1'
+        self.assertEqual(self.model.partial(), {'properties': {'value': '1'}})
+
+    def test_equality(self):
+        self.assertEqual(self.model, fake_device)
+        self.assertEqual(json.loads(json.dumps(self.model)), fake_device)
+
+
+class TestDeviceModel(utils.TestCase):
+
+    def setUp(self):
+        super(TestDeviceModel, self).setUp()
+        self.controller = mock.MagicMock(RESOURCE='devices')
+
+    def test_action_class_cache(self):
+        """Test devices of the same type share the generated class"""
+
+        lamp = models.factory(self.controller, copy.deepcopy(fake_device))
+        other = models.factory(self.controller, copy.deepcopy(fake_device))
+        self.assertIs(type(lamp), type(other))
+        self.assertIsInstance(lamp, models.DeviceModel)
+        self.assertNotIn('turnOn', lamp.__dict__)
+
+    def test_action(self):
+        lamp = models.factory(self.controller, copy.deepcopy(fake_device))
+        lamp.setValue(10)
+        self.controller.action.assert_called_with(12, 'setValue', 10)
+
+        self.assertRaises(TypeError, lamp.turnOn, 1)
+
+    def test_no_actions(self):
+        item = copy.deepcopy(fake_device)
+        del item['actions']
+        device = models.factory(self.controller, item)
+        self.assertIs(type(device), models.DeviceModel)
+
+    def test_partial_update(self):
+        http_client = mock.MagicMock()
+        http_client.put.return_value = mock.MagicMock(
+            content=json.dumps({'id': 12}), encoding='utf-8')
+        controller = devices.Controller(http_client, models.RecursiveDict)
+
+        lamp = models.RecursiveDict(copy.deepcopy(fake_device))
+        self.assertIs(controller.update(lamp, partial=True), lamp)
+        self.assertFalse(http_client.put.called)
+
+        lamp.name = 'bulb'
+        controller.update(lamp, partial=True)
+        http_client.put.assert_called_with(
+            'devices', json={'id': 12, 'name': 'bulb'})
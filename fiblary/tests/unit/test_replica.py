@@ -0,0 +1,75 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test replica module"""
+
+import mock
+
+from fiblary.client.v3 import devices
+from fiblary.client.v3 import replica
+from fiblary.tests import utils
+
+
+fake_devices = [
+    {'id': 3, 'name': 'lamp', 'type': 'binary_light', 'roomID': 1,
+     'properties': {'value': '0', 'dead': '0'}},
+    {'id': 7, 'name': 'door', 'type': 'door_sensor', 'roomID': 2,
+     'properties': {'value': '1', 'dead': '0'}},
+]
+
+
+class TestReplica(utils.TestCase):
+
+    def setUp(self):
+        super(TestReplica, self).setUp()
+        self.replica = replica.Replica()
+        self.replica.load(fake_devices, last=100)
+
+    def test_load(self):
+        self.assertEqual(len(self.replica), 2)
+        self.assertEqual(self.replica.last, 100)
+        self.assertEqual(self.replica.get(7)['name'], 'door')
+        self.assertEqual([i['id'] for i in self.replica.list()], [3, 7])
+
+    def test_apply_state(self):
+        before = self.replica.get(3)
+        unknown = self.replica.apply_state({
+            'last': 101,
+            'changes': [
+                {'id': 3, 'value': '1'},
+                {'id': 99, 'value': '1'},
+            ]
+        })
+        self.assertEqual(unknown, set([99]))
+        self.assertEqual(self.replica.last, 101)
+        self.assertEqual(self.replica.get(3)['properties']['value'], '1')
+        self.assertEqual(self.replica.get(3)['properties']['dead'], '0')
+
+        # items are replaced, never modified in place
+        self.assertEqual(before['properties']['value'], '0')
+
+    def test_staleness(self):
+        self.assertTrue(self.replica.staleness(3) >= 0)
+        self.assertEqual(self.replica.staleness(99), None)
+
+    def test_controller_served_from_replica(self):
+        http_client = mock.MagicMock()
+        controller = devices.Controller(http_client, lambda item: item)
+        controller.replica = self.replica
+
+        self.assertEqual(controller.get(7)['name'], 'door')
+        self.assertEqual(
+            [i['id'] for i in controller.list(type='door_sensor')], [7])
+        self.assertEqual(controller.find(p_value='0')['id'], 3)
+        self.assertFalse(http_client.get.called)
@@ -15,11 +15,15 @@
 
 """Test rest module"""
 
+from concurrent import futures
 import json
 import mock
 
 import requests
 
+from fiblary.client.v3 import base
+from fiblary.common import cache
+from fiblary.common import codec
 from fiblary.common import exceptions
 from fiblary.common import restapi
 from fiblary.tests import utils
@@ -176,7 +180,7 @@ class TestRESTApi(utils.TestCase):
                 'Content-Type': 'application/json',
             },
             allow_redirects=True,
-            data=json.dumps(data),
+            data=codec.dumps(data),
             timeout=10
         )
         self.assertEqual(gopher.json(), fake_gopher_single)
@@ -219,7 +223,7 @@ class TestRESTApi(utils.TestCase):
             fake_url,
             headers=mock.ANY,
             allow_redirects=True,
-            data=json.dumps(data),
+            data=codec.dumps(data),
             timeout=10
         )
         self.assertEqual(gopher, fake_gopher_single)
@@ -231,7 +235,7 @@ class TestRESTApi(utils.TestCase):
             fake_url,
             headers=mock.ANY,
             allow_redirects=True,
-            data=json.dumps(data),
+            data=codec.dumps(data),
             timeout=10
         )
         self.assertEqual(gopher, fake_gopher_mac)
@@ -263,7 +267,7 @@ class TestRESTApi(utils.TestCase):
             fake_url,
             headers=mock.ANY,
             allow_redirects=True,
-            data=json.dumps(data),
+            data=codec.dumps(data),
             timeout=10
         )
         self.assertEqual(gopher, [fake_gopher_mac, fake_gopher_tosh])
@@ -312,7 +316,7 @@ class TestRESTApi(utils.TestCase):
             fake_url,
             headers=mock.ANY,
             allow_redirects=True,
-            data=json.dumps(data),
+            data=codec.dumps(data),
             timeout=10
         )
         self.assertEqual(gopher, fake_gopher_single)
@@ -327,7 +331,7 @@ class TestRESTApi(utils.TestCase):
             fake_url,
             headers=mock.ANY,
             allow_redirects=True,
-            data=json.dumps(data),
+            data=codec.dumps(data),
             timeout=10
         )
         self.assertEqual(gopher, fake_gopher_mac)
@@ -361,3 +365,169 @@ class TestRESTApi(utils.TestCase):
             timeout=10
         )
         self.assertEqual(gopher, fake_gopher_mac)
+
+
+@mock.patch('fiblary.common.restapi.requests.Session')
+class TestConcurrentRESTApi(utils.TestCase):
+
+    def test_get(self, session_mock):
+        resp = FakeResponse(status_code=200, data=fake_gopher_single)
+        session_mock.return_value = mock.MagicMock(
+            request=mock.MagicMock(return_value=resp),
+        )
+
+        api = restapi.ConcurrentRESTApi(max_workers=2)
+        future = api.get(fake_url)
+        gopher = future.result(timeout=5)
+        session_mock.return_value.request.assert_called_with(
+            'GET',
+            fake_url,
+            headers={},
+            allow_redirects=True,
+            timeout=10
+        )
+        self.assertEqual(gopher.json(), fake_gopher_single)
+        api.shutdown()
+
+    def test_show_fail_404(self, session_mock):
+        resp = FakeResponse(status_code=404, data=fake_gopher_single)
+        session_mock.return_value = mock.MagicMock(
+            request=mock.MagicMock(return_value=resp),
+        )
+
+        api = restapi.ConcurrentRESTApi(max_workers=2)
+        future = api.show(fake_url, response_key=fake_key)
+        self.assertRaises(
+            exceptions.HTTPNotFound,
+            future.result,
+            5)
+        api.shutdown()
+
+    def test_session_pool(self, session_mock):
+        api = restapi.ConcurrentRESTApi(max_workers=2)
+        self.assertEqual(session_mock.return_value.mount.call_count, 2)
+        api.shutdown()
+
+        session = mock.MagicMock()
+        api = restapi.ConcurrentRESTApi(session=session, max_workers=2)
+        self.assertFalse(session.mount.called)
+        api.shutdown()
+
+    def test_controller(self, session_mock):
+        controller = mock.MagicMock()
+        controller.get.return_value = 'gopher'
+        executor = futures.ThreadPoolExecutor(1)
+        proxy = base.ConcurrentController(controller, executor)
+
+        self.assertEqual(proxy.get(1).result(timeout=5), 'gopher')
+        controller.get.assert_called_with(1)
+        # the helpers other than the request methods are not wrapped
+        self.assertIs(proxy.model, controller.model)
+        executor.shutdown()
+
+
+@mock.patch('fiblary.common.restapi.requests.Session')
+class TestRESTApiCache(utils.TestCase):
+
+    def setUp(self):
+        super(TestRESTApiCache, self).setUp()
+        self.cache = cache.ResponseCache(ttls={'rooms': 60})
+
+    def _api(self, session_mock):
+        resp = FakeResponse(status_code=200, data=fake_gopher_list)
+        session_mock.return_value = mock.MagicMock(
+            request=mock.MagicMock(return_value=resp),
+        )
+        return restapi.RESTApi(base_url=fake_url + '/', cache=self.cache)
+
+    def test_cached(self, session_mock):
+        api = self._api(session_mock)
+        api.get('rooms', params={'id': 1})
+        gopher = api.get('rooms', params={'id': 1})
+        self.assertEqual(gopher.json(), fake_gopher_list)
+        self.assertEqual(session_mock.return_value.request.call_count, 1)
+
+        # resources without TTL are not cached
+        api.get('devices')
+        api.get('devices')
+        self.assertEqual(session_mock.return_value.request.call_count, 3)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['entries'], 1)
+
+    def test_invalidate(self, session_mock):
+        api = self._api(session_mock)
+        api.get('rooms')
+        api.put('rooms', json={'id': 1})
+        api.get('rooms')
+        self.assertEqual(session_mock.return_value.request.call_count, 3)
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+    def test_stale_fill(self, session_mock):
+        api = self._api(session_mock)
+        request = session_mock.return_value.request
+        response = request.return_value
+
+        def get_racing_put(*args, **kwargs):
+            # the PUT completes while the GET is in flight
+            request.side_effect = None
+            api.put('rooms', json={'id': 1})
+            return response
+        request.side_effect = get_racing_put
+
+        api.get('rooms')
+        self.assertEqual(self.cache.stats()['stale'], 1)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+        api.get('rooms')
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+    def test_evict(self, session_mock):
+        self.cache.max_entries = 2
+        api = self._api(session_mock)
+        for room_id in range(3):
+            api.get('rooms', params={'id': room_id})
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+
+@mock.patch('fiblary.common.restapi.requests.Session')
+class TestRESTApiTracing(utils.TestCase):
+
+    def _api(self, session_mock, debug, enabled, **kwargs):
+        resp = FakeResponse(status_code=200, data=fake_gopher_list)
+        session_mock.return_value = mock.MagicMock(
+            request=mock.MagicMock(return_value=resp),
+        )
+        logger = mock.MagicMock()
+        logger.isEnabledFor.return_value = enabled
+        return restapi.RESTApi(
+            base_url=fake_url, debug=debug, logger=logger, **kwargs)
+
+    def test_disabled(self, session_mock):
+        api = self._api(session_mock, debug=False, enabled=True)
+        api.get('/gopher', params={'id': 1})
+        self.assertFalse(api.logger.debug.called)
+
+        # debug requested but the logger level is above DEBUG
+        api = self._api(session_mock, debug=True, enabled=False)
+        api.get('/gopher', params={'id': 1})
+        self.assertFalse(api.logger.debug.called)
+
+    def test_enabled(self, session_mock):
+        api = self._api(session_mock, debug=True, enabled=True,
+                        trace_body_limit=10)
+        api.post('/gopher', json=fake_gopher_mac)
+        self.assertTrue(api.logger.debug.called)
+
+        bodies = [c[0][1] for c in api.logger.debug.call_args_list
+                  if 'BODY' in c[0][0]]
+        self.assertTrue(bodies)
+        for body in bodies:
+            self.assertTrue(body.endswith('bytes)'))
+
+    def test_sampled(self, session_mock):
+        api = self._api(session_mock, debug=True, enabled=True,
+                        trace_sample_rate=0)
+        api.get('/gopher')
+        self.assertFalse(api.logger.debug.called)
@@ -0,0 +1,89 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test property change routing"""
+
+from fiblary.client.v3 import routing
+from fiblary.common import event
+from fiblary.tests import utils
+
+
+fake_devices = {
+    3: {'id': 3, 'roomID': 1, 'type': 'com.fibaro.binarySwitch'},
+    4: {'id': 4, 'roomID': 1, 'type': 'com.fibaro.dimmer'},
+    5: {'id': 5, 'roomID': 2, 'type': 'com.fibaro.binarySwitch'},
+}
+
+
+class TestRouter(utils.TestCase):
+
+    def setUp(self):
+        super(TestRouter, self).setUp()
+        self.lookups = []
+
+        def lookup(device_id):
+            self.lookups.append(device_id)
+            return fake_devices.get(device_id)
+
+        self.router = routing.Router(lookup, event.EventHook)
+
+    def route(self, property_name, **filters):
+        key = routing.route_key(property_name, filters)
+        return self.router.hook(key, create=True)
+
+    def names(self, property_name, device_id):
+        return sorted(hook.name for hook in
+                      self.router.match(property_name, device_id))
+
+    def test_match(self):
+        self.route('value', id=3)
+        self.route('value', roomID=1)
+        self.route('value', roomID=1, type='com.fibaro.dimmer')
+        self.route('power', type='com.fibaro.binarySwitch')
+
+        self.assertEqual(self.names('value', 3),
+                         ['value[id=3]', 'value[roomID=1]'])
+        self.assertEqual(
+            self.names('value', 4),
+            ['value[roomID=1,type=com.fibaro.dimmer]', 'value[roomID=1]'])
+        self.assertEqual(self.names('value', 5), [])
+        self.assertEqual(self.names('power', 5),
+                         ['power[type=com.fibaro.binarySwitch]'])
+        self.assertEqual(self.names('dead', 3), [])
+        self.assertEqual(self.names('value', 99), [])
+
+    def test_lookup_only_when_needed(self):
+        self.route('value', id=3)
+        self.router.match('value', 3)
+        self.assertEqual(self.lookups, [])
+
+        self.route('value', roomID=1)
+        self.router.match('value', 3)
+        self.assertEqual(self.lookups, [3])
+
+    def test_discard(self):
+        key = routing.route_key('value', {'id': 3})
+        hook = self.router.hook(key, create=True)
+        hook += lambda **kw: None
+        self.router.discard(key)
+        self.assertEqual(len(self.router), 1, "Route with handler removed")
+
+        hook -= hook._EventHook__handlers[0]
+        self.router.discard(key)
+        self.assertEqual(len(self.router), 0)
+        self.assertEqual(self.router.match('value', 3), [])
+
+    def test_unsupported_field(self):
+        self.assertRaises(ValueError, routing.route_key,
+                          'value', {'name': 'lamp'})
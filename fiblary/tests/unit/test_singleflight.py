@@ -0,0 +1,79 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test singleflight module"""
+
+import threading
+
+from fiblary.common import exceptions
+from fiblary.common import singleflight
+from fiblary.tests import utils
+
+
+class TestSingleFlight(utils.TestCase):
+
+    def setUp(self):
+        super(TestSingleFlight, self).setUp()
+        self.single_flight = singleflight.SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def _call(self, value):
+        self.calls.append(value)
+        self.release.wait(5)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def _run_concurrently(self, count, value):
+        results = []
+
+        def worker():
+            try:
+                results.append(
+                    self.single_flight.do('key', self._call, value))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=worker) for i in range(count)]
+        for thread in threads:
+            thread.start()
+
+        # wait for all the callers to join the flight
+        while self.single_flight.stats()['collapsed'] < count - 1:
+            threading.Event().wait(0.01)
+
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_collapse(self):
+        results = self._run_concurrently(5, 'value')
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(self.calls, ['value'])
+        self.assertEqual(self.single_flight.stats(), {
+            'calls': 1, 'collapsed': 4, 'in_flight': 0})
+
+    def test_exception_shared(self):
+        error = exceptions.ConnectionError("timeout")
+        results = self._run_concurrently(3, error)
+        self.assertEqual(results, [error] * 3)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_sequential_not_collapsed(self):
+        self.release.set()
+        self.single_flight.do('key', self._call, 1)
+        self.single_flight.do('key', self._call, 2)
+        self.assertEqual(self.calls, [1, 2])
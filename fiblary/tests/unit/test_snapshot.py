@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test snapshot module"""
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from fiblary.client.v3 import client
+from fiblary.client.v3 import snapshot
+from fiblary.common import exceptions
+from fiblary.tests import utils
+
+
+fake_url = 'http://hc2/api/'
+
+fake_resources = {
+    'devices': [
+        {'id': 3, 'name': u'lampa w kuchni ł', 'roomID': 1,
+         'type': 'binary_light', 'properties': {'value': '0'}},
+        {'id': 7, 'name': 'door', 'roomID': 2,
+         'type': 'door_sensor', 'properties': {'value': '1'}},
+    ],
+    'rooms': [{'id': 1, 'name': 'kitchen'}, {'id': 2, 'name': 'hall'}],
+    'globalVariables': [{'name': 'mode', 'value': 'away'}],
+}
+
+
+class TestSnapshot(utils.TestCase):
+
+    def setUp(self):
+        super(TestSnapshot, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'hc2.snap')
+
+    def test_round_trip(self):
+        snapshot.save(self.path, fake_resources, 1234, fake_url)
+        with snapshot.Snapshot(self.path) as snap:
+            self.assertEqual(snap.last, 1234)
+            self.assertEqual(snap.endpoint, fake_url)
+            self.assertEqual(
+                snap.resources, ['devices', 'globalVariables', 'rooms'])
+            for name, items in fake_resources.items():
+                self.assertEqual(snap.get(name), items)
+            self.assertEqual(snap.get('scenes'), None)
+            self.assertTrue(snap.age() >= 0)
+
+    def test_invalid(self):
+        self.assertRaises(exceptions.SnapshotError,
+                          snapshot.Snapshot, self.path)
+
+        for content in ('', 'garbage', snapshot.MAGIC + '\x00\x63' + 'x' * 8):
+            with open(self.path, 'wb') as f:
+                f.write(content)
+            self.assertRaises(exceptions.SnapshotError,
+                              snapshot.Snapshot, self.path)
+
+        for toc in ('[]', '{}', '{"created": 0, "endpoint": null, '
+                    '"last": 1, "resources": {"devices": [0]}}'):
+            with open(self.path, 'wb') as f:
+                f.write(snapshot._HEADER.pack(
+                    snapshot.MAGIC, snapshot.VERSION, len(toc)) + toc)
+            self.assertRaises(exceptions.SnapshotError,
+                              snapshot.Snapshot, self.path)
+
+    @mock.patch('fiblary.client.v3.client.StateHandler')
+    @mock.patch('fiblary.common.restapi.requests.Session')
+    def test_client_warm_start(self, session_mock, handler_mock):
+        snapshot.save(self.path, fake_resources, 1234, fake_url)
+        refetch = threading.Event()
+        urls = []
+
+        def request(method, url, **kwargs):
+            refetch.wait(5)
+            urls.append(url[len(fake_url):])
+            data = [{'id': 1, 'name': 'kitchen'}] if 'rooms' in url else []
+            return mock.MagicMock(
+                status_code=200, content=json.dumps(data), encoding='utf-8')
+        session_mock.return_value.request.side_effect = request
+
+        hc = client.Client(fake_url, 'admin', 'admin')
+        self.assertEqual(hc.load_snapshot(self.path, max_age=60), 1234)
+
+        self.assertEqual(handler_mock.call_args[1]['last'], 1234)
+        self.assertTrue(
+            time.time() - handler_mock.call_args[1]['received'] < 60)
+        self.assertEqual(hc.devices.replica.last, 1234)
+        self.assertEqual(hc.devices.find(roomID=2).name, 'door')
+        self.assertFalse(hc.devices.replica.stale)
+        self.assertTrue(hc.rooms.replica.stale)
+        self.assertEqual(
+            [room.name for room in hc.rooms.list()], ['kitchen', 'hall'])
+        # variables are not replicated by default
+        self.assertEqual(hc.variables.replica, None)
+
+        # the replicas other than devices are refetched in the background
+        refetch.set()
+        hc._refresher.join(5)
+        self.assertEqual(urls, ['rooms'])
+        self.assertFalse(hc.rooms.replica.stale)
+        self.assertEqual([room.name for room in hc.rooms.list()], ['kitchen'])
+
+        self.assertRaises(exceptions.SnapshotError,
+                          hc.load_snapshot, self.path, max_age=-1)
+        other = client.Client('http://other/api/', 'admin', 'admin')
+        self.assertRaises(exceptions.SnapshotError,
+                          other.load_snapshot, self.path)
+
+    @mock.patch('fiblary.common.restapi.requests.Session')
+    def test_client_save(self, session_mock):
+        def request(method, url, **kwargs):
+            resource = url[len(fake_url):]
+            if resource.startswith('refreshStates'):
+                data = {'last': 99}
+            else:
+                data = fake_resources.get(resource, [])
+            return mock.MagicMock(
+                status_code=200, content=json.dumps(data), encoding='utf-8')
+        session_mock.return_value.request.side_effect = request
+
+        hc = client.Client(fake_url, 'admin', 'admin')
+        self.assertEqual(hc.save_snapshot(self.path), 99)
+        with snapshot.Snapshot(self.path) as snap:
+            self.assertEqual(snap.last, 99)
+            self.assertEqual(snap.get('rooms'), fake_resources['rooms'])
+            self.assertEqual(snap.get('scenes'), [])
@@ -0,0 +1,314 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test state handler"""
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from fiblary.client.v3 import client
+from fiblary.client.v3 import replica
+from fiblary.common import exceptions
+from fiblary.common import tracing
+from fiblary.tests import utils
+
+
+fake_url = 'http://hc2/api/'
+
+fake_devices = [
+    {'id': 3, 'name': 'lamp', 'properties': {'value': '0'}},
+    {'id': 7, 'name': 'door', 'properties': {'value': '1'}},
+]
+
+
+@mock.patch.object(client.StateHandler, 'start')
+class TestStateHandler(utils.TestCase):
+
+    def setUp(self):
+        super(TestStateHandler, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cursor_file = os.path.join(self.directory, 'cursor')
+        self.client = mock.MagicMock()
+
+    def test_resume(self, start_mock):
+        handler = client.StateHandler(
+            self.client, None, last=1234, cursor_file=self.cursor_file)
+        handler._save_cursor(force=True)
+
+        handler = client.StateHandler(
+            self.client, None, cursor_file=self.cursor_file)
+        self.assertEqual(handler.last, 1234)
+
+        # explicit cursor wins
+        handler = client.StateHandler(
+            self.client, None, last=99, cursor_file=self.cursor_file)
+        self.assertEqual(handler.last, 99)
+
+    def test_stopped_mid_poll(self, start_mock):
+        callback = mock.MagicMock()
+        handler = client.StateHandler(
+            self.client, callback, last=100, cursor_file=self.cursor_file)
+
+        def get(*args, **kwargs):
+            # the handler is stopped while the long-poll is pending
+            handler.stop()
+            return mock.MagicMock(
+                content=json.dumps({'last': 200, 'changes': []}),
+                encoding='utf-8')
+        self.client.client.get.side_effect = get
+
+        handler._poll(100, 60, tracing.NOOP_SPAN)
+        handler.run()
+        self.assertFalse(callback.called)
+        self.assertEqual(handler.last, 100)
+        self.assertEqual(client._read_cursor(self.cursor_file)[0], 100)
+
+    def test_missing_cursor_file(self, start_mock):
+        handler = client.StateHandler(
+            self.client, None, cursor_file=self.cursor_file)
+        self.assertEqual(handler.last, None)
+
+    def test_gap(self, start_mock):
+        on_gap = mock.MagicMock()
+        handler = client.StateHandler(
+            self.client, None, on_gap=on_gap, max_outage=60)
+
+        handler._check_gap("0", {'last': 100})
+        handler._check_gap(100, {'last': 101})
+        self.assertFalse(on_gap.called)
+
+        handler._check_gap(101, {'last': 5})
+        on_gap.assert_called_with('reset')
+
+        handler.received = time.time() - 61
+        handler._check_gap(5, {'last': 6})
+        on_gap.assert_called_with('outage')
+        self.assertEqual(on_gap.call_count, 2)
+
+        # i.e. resumed from the old snapshot
+        handler = client.StateHandler(
+            self.client, None, last=5, received=time.time() - 61,
+            on_gap=on_gap, max_outage=60)
+        handler._check_gap(5, {'last': 6})
+        self.assertEqual(on_gap.call_count, 3)
+
+
+@mock.patch('fiblary.common.restapi.requests.Session')
+class TestResync(utils.TestCase):
+
+    def _client(self, session_mock, devices):
+        def request(method, url, **kwargs):
+            params = kwargs.get('params') or {}
+            if 'id' in params:
+                data = [item for item in devices
+                        if item['id'] == params['id']]
+                if not data:
+                    return mock.MagicMock(status_code=404)
+                data = data[0]
+            else:
+                data = devices
+            return mock.MagicMock(
+                status_code=200, content=json.dumps(data), encoding='utf-8')
+        session_mock.return_value.request.side_effect = request
+
+        hc = client.Client(fake_url, 'admin', 'admin')
+        hc.devices.replica = replica.Replica()
+        hc.devices.replica.load(fake_devices)
+
+        self.events = []
+        self.fired = threading.Event()
+
+        def handler(**kwargs):
+            self.events.append(kwargs['value'])
+            self.fired.set()
+
+        hc.add_event_handler(client.RESYNC_EVENT, handler)
+        self.addCleanup(hc.dispatcher.stop)
+        return hc
+
+    def test_unknown_devices(self, session_mock):
+        added = {'id': 9, 'name': 'new', 'properties': {'value': '1'}}
+        hc = self._client(session_mock, fake_devices + [added])
+
+        hc._on_state_change({'last': 1, 'changes': [
+            {'id': 9, 'value': '0'},
+            {'id': 3, 'value': '1'},
+        ]})
+        self.assertTrue(self.fired.wait(5))
+        self.assertEqual(self.events, [{'reason': 'unknown', 'devices': [9]}])
+        self.assertEqual(hc.devices.replica.get(9)['name'], 'new')
+
+    def test_full_resync(self, session_mock):
+        hc = self._client(session_mock, fake_devices[:1])
+
+        hc._resync('reset')
+        self.assertTrue(self.fired.wait(5))
+        self.assertEqual(self.events, [{'reason': 'reset', 'devices': None}])
+        self.assertEqual(len(hc.devices.replica), 1)
+
+
+@mock.patch.object(client.StateHandler, 'start')
+@mock.patch('fiblary.common.restapi.requests.Session')
+class TestEnableReplica(utils.TestCase):
+
+    def test_cursor_before_fetch(self, session_mock, start_mock):
+        urls = []
+
+        def request(method, url, **kwargs):
+            urls.append(url[len(fake_url):])
+            if 'refreshStates' in url:
+                data = {'last': 1234}
+            else:
+                data = fake_devices
+            return mock.MagicMock(
+                status_code=200, content=json.dumps(data), encoding='utf-8')
+        session_mock.return_value.request.side_effect = request
+
+        hc = client.Client(fake_url, 'admin', 'admin')
+        devices_replica = hc.enable_replica()
+
+        self.assertEqual(urls, ['refreshStates?last=0', 'devices'])
+        self.assertEqual(devices_replica.last, 1234)
+        self.assertEqual(hc.state_handler.last, 1234)
+
+
+@mock.patch('fiblary.common.restapi.requests.Session')
+class TestEventDelivery(utils.TestCase):
+
+    def setUp(self):
+        super(TestEventDelivery, self).setUp()
+        self.events = []
+        self.fired = threading.Event()
+
+    def _client(self):
+        hc = client.Client(fake_url, 'admin', 'admin')
+        self.addCleanup(lambda: hc.dispatcher and hc.dispatcher.stop())
+        return hc
+
+    def handler(self, **kwargs):
+        self.events.append(kwargs)
+        self.fired.set()
+
+    def test_unsubscribed(self, session_mock):
+        hc = self._client()
+        hc._on_state_change({'last': 1, 'changes': [{'id': 3, 'value': '1'}]})
+        self.assertEqual(hc.modified, {})
+        self.assertEqual(hc.dispatcher, None)
+
+    def test_batch(self, session_mock):
+        hc = self._client()
+        hc.add_batch_handler(self.handler)
+
+        hc._on_state_change({'last': 5, 'timestamp': 100, 'changes': [
+            {'id': 3, 'value': '1', 'power': '2.0'},
+            {'id': 7, 'value': '0'},
+        ]})
+        self.assertTrue(self.fired.wait(5))
+        self.assertEqual(len(self.events), 1)
+        batch = self.events[0]
+        self.assertEqual(batch['last'], 5)
+        self.assertEqual(batch['timestamp'], 100)
+        self.assertEqual(
+            sorted((c['id'], c['property'], c['value'])
+                   for c in batch['changes']),
+            [(3, 'power', '2.0'), (3, 'value', '1'), (7, 'value', '0')])
+
+        hc.remove_batch_handler(self.handler)
+        self.assertEqual(hc.batch_hook.get_handler_count(), 0)
+
+    def test_coalesced_handler(self, session_mock):
+        hc = self._client()
+        hc.add_event_handler('value', self.handler, window=0.05)
+
+        for n in range(10):
+            hc._on_state_change({'last': n, 'changes': [
+                {'id': 3, 'value': str(n)},
+            ]})
+        self.assertTrue(self.fired.wait(5))
+        time.sleep(0.1)
+        self.assertEqual([e['value'] for e in self.events], ['9'])
+
+        hc.remove_event_handler('value', self.handler)
+        self.assertEqual(hc.modified['value'].get_handler_count(), 0)
+        self.assertEqual(hc._coalescers, {})
+
+    def test_routed_handlers(self, session_mock):
+        hc = self._client()
+        hc.devices.replica = replica.Replica()
+        hc.devices.replica.load([
+            {'id': 3, 'roomID': 1, 'type': 'com.fibaro.binarySwitch'},
+            {'id': 7, 'roomID': 2, 'type': 'com.fibaro.binarySwitch'},
+            {'id': 8, 'roomID': 2, 'type': 'com.fibaro.dimmer'},
+        ])
+        wildcard = []
+        hc.add_event_handler('value', lambda **kw: wildcard.append(kw['id']))
+        hc.add_event_handler('value', self.handler, device_id=7)
+        hc.add_event_handler('value', self.handler, room_id=1)
+
+        hc._on_state_change({'last': 1, 'changes': [
+            {'id': 3, 'value': '1'},
+            {'id': 7, 'value': '0'},
+            {'id': 8, 'value': '0'},
+        ]})
+        for _ in range(100):
+            if len(self.events) == 2 and len(wildcard) == 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual(sorted(e['id'] for e in self.events), [3, 7])
+        self.assertEqual(sorted(wildcard), [3, 7, 8])
+        self.assertIn('value[id=7]', hc.get_queue_depths())
+
+        hc.remove_event_handler('value', self.handler, device_id=7)
+        self.assertNotIn('value[id=7]', hc.get_queue_depths())
+        self.assertRaises(
+            exceptions.HandlerNotFound, hc.remove_event_handler,
+            'value', self.handler, device_id=7)
+
+    def test_routed_moved_device(self, session_mock):
+        hc = self._client()
+        hc._load_replica(hc.devices, [
+            {'id': 3, 'roomID': 1, 'properties': {'value': '0'}}])
+        hc.add_event_handler('value', self.handler, room_id=2)
+
+        hc._on_state_change({'last': 1, 'changes': [
+            {'id': 3, 'roomID': 2, 'value': '1'}]})
+        self.assertTrue(self.fired.wait(5))
+        self.assertEqual(self.events[0]['id'], 3)
+        device = hc.devices.replica.get(3)
+        self.assertEqual(device['roomID'], 2)
+        self.assertEqual(device['properties'], {'value': '1'})
+
+    def test_routed_without_replica(self, session_mock):
+        hc = self._client()
+        # the first lookup fails i.e. on the connection error
+        hc.devices._get = mock.MagicMock(side_effect=[
+            None, {'id': 3, 'roomID': 1}, {'id': 3, 'roomID': 2}])
+        hc.add_event_handler('value', self.handler, room_id=2)
+
+        hc._on_state_change({'last': 1, 'changes': [{'id': 3, 'value': '1'}]})
+        self.assertEqual(hc._devices_info, {})
+        hc._on_state_change({'last': 2, 'changes': [{'id': 3, 'value': '0'}]})
+        self.assertEqual(hc._devices_info[3]['roomID'], 1)
+
+        # the device moved to the room 2
+        hc._on_state_change({'last': 3, 'changes': [
+            {'id': 3, 'roomID': 2, 'value': '1'}]})
+        self.assertTrue(self.fired.wait(5))
+        self.assertEqual(self.events[0]['value'], '1')
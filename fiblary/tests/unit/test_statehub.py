@@ -0,0 +1,115 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test statehub module"""
+
+import BaseHTTPServer
+import json
+import SocketServer
+import threading
+import urlparse
+
+from fiblary.client.v3 import client
+from fiblary.client.v3 import statehub
+from fiblary.tests import utils
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def _handler(protocol):
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = protocol
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse.urlparse(self.path)
+            last = int(dict(urlparse.parse_qsl(url.query))['last'])
+            self.server.requests.append(
+                (url.path, last, self.headers.get('Authorization')))
+            body = json.dumps({
+                'last': last + 1,
+                'changes': [{'id': self.server.server_port, 'value': last}],
+            })
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    return Handler
+
+
+class TestResponse(utils.TestCase):
+
+    def test_chunked(self):
+        data = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'5\r\n{"las\r\n7\r\nt": 12}\r\n0\r\n\r\n')
+        for size in range(1, len(data)):
+            response = statehub._Response()
+            self.assertFalse(response.feed(data[:size]))
+            self.assertTrue(response.feed(data[size:]))
+            self.assertEqual(response.body(), b'{"last": 12}')
+
+    def test_close_delimited(self):
+        response = statehub._Response()
+        self.assertFalse(response.feed(
+            b'HTTP/1.0 404 Not Found\r\nConnection: close\r\n\r\nabc'))
+        self.assertEqual(response.status, 404)
+        self.assertFalse(response.keep_alive)
+        self.assertEqual(response.body(eof=True), b'abc')
+
+
+class TestStateHub(utils.TestCase):
+
+    def _server(self, protocol):
+        server = _Server(('127.0.0.1', 0), _handler(protocol))
+        server.requests = []
+        thread = threading.Thread(
+            target=server.serve_forever, kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_fan_in(self):
+        servers = [self._server('HTTP/1.1'), self._server('HTTP/1.0')]
+        clients = [
+            client.Client('http://127.0.0.1:{}/api/'.format(
+                server.server_port), 'admin', 'admin')
+            for server in servers]
+
+        hub = statehub.StateHub(timeout=5)
+        self.addCleanup(hub.stop)
+        hub.add(clients[0], last=100)
+        hub.add(clients[1])
+
+        received = dict((hc, []) for hc in clients)
+        while min(len(states) for states in received.values()) < 3:
+            hc, state = hub.get(timeout=5)
+            received[hc].append(state['last'])
+
+        self.assertEqual(received[clients[0]][:3], [101, 102, 103])
+        self.assertEqual(received[clients[1]][:3], [1, 2, 3])
+
+        path, last, auth = servers[0].requests[0]
+        self.assertEqual((path, last), ('/api/refreshStates', 100))
+        self.assertEqual(auth, 'Basic YWRtaW46YWRtaW4=')
+
+        hub.remove(clients[0])
+        self.assertTrue(hub.cursor(clients[1]) >= 3)
+        self.assertEqual(hub.cursor(clients[0]), None)
@@ -0,0 +1,87 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test throttle module"""
+
+import threading
+import time
+
+from fiblary.common import throttle
+from fiblary.tests import utils
+
+
+class TestThrottle(utils.TestCase):
+
+    def test_priority(self):
+        """Test interactive requests are admitted before bulk ones"""
+
+        gate = throttle.Throttle(max_in_flight=1, limits={})
+        order = []
+
+        def request(name, priority):
+            with gate.admit('GET', 'devices', priority):
+                order.append(name)
+
+        with gate.admit('GET', 'devices'):
+            threads = [
+                threading.Thread(target=request, args=('bulk', p))
+                for p in (throttle.BULK, throttle.BULK)]
+            threads.append(threading.Thread(
+                target=request, args=('interactive', throttle.INTERACTIVE)))
+            for waiting, thread in enumerate(threads, 1):
+                thread.start()
+                # make sure the waiters are queued in order
+                while gate.stats()['waiting'] < waiting:
+                    time.sleep(0.001)
+            # all the waiters wait long enough to be counted
+            time.sleep(0.01)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ['interactive', 'bulk', 'bulk'])
+        stats = gate.stats()
+        self.assertEqual(stats['bulk']['waited'], 2)
+        self.assertEqual(stats['interactive']['waited'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_rate(self):
+        """Test the token bucket delays the requests above the rate"""
+
+        gate = throttle.Throttle(
+            max_in_flight=None,
+            limits={('GET', 'callAction'): (20, 1)})
+
+        start = time.time()
+        for i in range(3):
+            with gate.admit('GET', 'callAction'):
+                pass
+        self.assertTrue(time.time() - start >= 0.09)
+
+        # other resources are not limited
+        with gate.admit('GET', 'devices'):
+            pass
+        self.assertEqual(gate.stats()['normal']['requests'], 4)
+        self.assertEqual(gate.stats()['normal']['waited'], 2)
+
+    def test_exempt(self):
+        gate = throttle.Throttle(max_in_flight=1, limits={})
+        with gate.admit('GET', 'devices'):
+            with gate.admit('GET', 'refreshStates', throttle.EXEMPT):
+                self.assertEqual(gate.stats()['in_flight'], 1)
+
+    def test_shared_per_url(self):
+        self.assertIs(
+            throttle.get('http://hc2/api/'),
+            throttle.get('http://hc2/api/'))
@@ -0,0 +1,160 @@
+#  Copyright 2014 Klaudiusz Staniek
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Test tracing hooks"""
+
+import json
+import mock
+import threading
+
+from fiblary.client.v3 import client
+from fiblary.client.v3 import devices
+from fiblary.client.v3 import scenes
+from fiblary.common import event
+from fiblary.common import tracing
+from fiblary.tests import utils
+
+
+fake_devices = [
+    {'id': 3, 'name': 'lamp', 'properties': {'value': '0'}},
+    {'id': 7, 'name': 'door', 'properties': {'value': '1'}},
+]
+
+
+def fake_response(data, status_code=200):
+    return mock.MagicMock(
+        status_code=status_code, content=json.dumps(data), encoding='utf-8')
+
+
+class TestTracing(utils.TestCase):
+
+    def setUp(self):
+        super(TestTracing, self).setUp()
+        self.spans = []
+        tracing.set_tracer(tracing.CallbackTracer(self.spans.append))
+        self.addCleanup(tracing.set_tracer, None)
+
+        self.http_client = mock.MagicMock()
+        self.http_client.metrics = None
+
+    def test_noop(self):
+        tracing.set_tracer(None)
+        with tracing.span('test', resource='devices') as span:
+            span.set_attribute('items', 1)
+            self.assertIs(span, tracing.NOOP_SPAN)
+            self.assertIs(tracing.current(), tracing.NOOP_SPAN)
+        self.assertEqual(self.spans, [])
+
+    def test_nested(self):
+        with tracing.span('outer') as outer:
+            with tracing.span('inner', n=1) as inner:
+                self.assertIs(tracing.current(), inner)
+                self.assertIs(inner.parent, outer)
+            self.assertIs(tracing.current(), outer)
+        self.assertIs(tracing.current(), tracing.NOOP_SPAN)
+        self.assertEqual([span.name for span in self.spans],
+                         ['inner', 'outer'])
+        self.assertGreaterEqual(self.spans[1].duration, 0)
+
+    def test_error(self):
+        def fail():
+            with tracing.span('failing'):
+                raise ValueError('boom')
+
+        self.assertRaises(ValueError, fail)
+        self.assertIsInstance(self.spans[0].error, ValueError)
+
+    def test_controller(self):
+        self.http_client.get.side_effect = [
+            fake_response(fake_devices),
+            fake_response(fake_devices[0]),
+            fake_response(None, 202),
+        ]
+        self.http_client.put.return_value = fake_response(fake_devices[1])
+        controller = devices.Controller(self.http_client, lambda item: item)
+
+        self.assertEqual(controller.find(name='lamp')['id'], 3)
+        controller.get(3)
+        controller.action(3, 'turnOn')
+        controller.update(dict(fake_devices[1]))
+        controller.delete(7)
+
+        names = [span.name for span in self.spans]
+        self.assertEqual(names, ['fiblary.list', 'fiblary.find',
+                                 'fiblary.get', 'fiblary.action',
+                                 'fiblary.update', 'fiblary.delete'])
+        spans = dict((span.name, span) for span in self.spans)
+        self.assertIs(spans['fiblary.list'].parent, spans['fiblary.find'])
+        self.assertEqual(spans['fiblary.list'].attributes, {
+            'resource': 'devices',
+            'items': 2,
+            'bytes': len(json.dumps(fake_devices)),
+        })
+        self.assertEqual(spans['fiblary.get'].attributes['id'], 3)
+        self.assertEqual(spans['fiblary.action'].attributes,
+                         {'resource': 'devices', 'id': 3,
+                          'action': 'turnOn'})
+        self.assertEqual(spans['fiblary.update'].attributes['id'], 7)
+        self.assertEqual(spans['fiblary.delete'].attributes['id'], 7)
+
+    def test_scene_control(self):
+        self.http_client.get.side_effect = [
+            fake_response(None, 202),
+            fake_response({'id': 5, 'name': 'night'}),
+        ]
+        controller = scenes.Controller(self.http_client, lambda item: item)
+        controller._scene_control(5, 'start')
+
+        self.assertEqual([span.name for span in self.spans],
+                         ['fiblary.get', 'fiblary.scene_control'])
+        self.assertEqual(self.spans[1].attributes,
+                         {'resource': 'scenes', 'id': 5, 'action': 'start'})
+
+    @mock.patch.object(client.StateHandler, 'start')
+    def test_poll(self, start_mock):
+        api = mock.MagicMock()
+        api.get.return_value = fake_response(
+            {'last': 12, 'changes': [{'id': 3, 'value': '1'}]})
+        callback = mock.MagicMock()
+        handler = client.StateHandler(
+            mock.MagicMock(client=api), callback, last=10)
+
+        with tracing.span('fiblary.poll', last=10) as span:
+            handler._poll(10, 30, span)
+
+        self.assertEqual(handler.last, 12)
+        self.assertTrue(callback.called)
+        self.assertEqual(self.spans[0].attributes['changes'], 1)
+        self.assertEqual(self.spans[0].attributes['next'], 12)
+
+    def test_dispatcher(self):
+        dispatcher = event.Dispatcher(workers=1)
+        self.addCleanup(dispatcher.stop)
+        done = threading.Event()
+
+        dispatcher.put('key', done.set)
+        self.assertTrue(done.wait(5))
+        dispatcher.stop()
+
+        self.assertEqual(self.spans[0].name, 'fiblary.event')
+        self.assertEqual(self.spans[0].attributes['event'], "'key'")
+        self.assertGreaterEqual(self.spans[0].attributes['queue_wait'], 0)
+
+    def test_tracer_failure(self):
+        def fail(span):
+            raise RuntimeError('tracer bug')
+
+        tracing.set_tracer(tracing.CallbackTracer(fail))
+        with tracing.span('test'):
+            pass